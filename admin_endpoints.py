@@ -2,14 +2,24 @@
 Admin Endpoints Module
 Additional API endpoints for admin section functionality
 """
-from flask import Blueprint, jsonify, request
-from database import SessionLocal, User, LeaveRequest, LeaveType, TeamMember, EmployeeProfile, Department, Broadcast, BroadcastReaction, Notification
+import logging
+
+from flask import Blueprint, jsonify, request, g
+from database import User, LeaveRequest, LeaveType, TeamMember, EmployeeProfile, Department, Broadcast, BroadcastReaction, Notification, get_pool_status
 from functools import wraps
 from datetime import datetime
 from sqlalchemy.exc import IntegrityError
 import json
 import urllib.parse
 from auth import jwt_required, role_required, permission_required
+from profile_enrichment import load_employee_cards, empty_card
+from leave_balances import get_leave_type_usage, get_bulk_leave_type_usage
+from event_stream import stream_status
+from resource_versions import conditional_get, skip_etag
+import reference_cache
+import media_store
+
+logger = logging.getLogger(__name__)
 
 # Create Blueprint for admin endpoints
 admin_bp = Blueprint('admin_endpoints', __name__)
@@ -62,7 +72,7 @@ def get_all_leave_records():
     Returns: List of all leave requests with employee info, department, leave type
     Tables Used: leave_requests, users, leave_types, employee_profiles
     """
-    db = SessionLocal()
+    db = g.db
     try:
         # Query all leave requests with joins
         results = db.query(
@@ -74,23 +84,23 @@ def get_all_leave_records():
         ).join(
             LeaveType, LeaveRequest.leave_type_id == LeaveType.id
         ).order_by(LeaveRequest.applied_date.desc()).all()
-        
+
+        # Employee profiles (department) for every record in one query
+        cards = load_employee_cards(db, [user.id for req, user, leave_type in results])
+
         leave_records = []
         for req, user, leave_type in results:
-            # Get employee profile for department info
-            emp_profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
+            card = cards.get(user.id) or empty_card(user.id, user.username)
+
             # Calculate days
             days = (req.end_date - req.start_date).days + 1
             
             leave_records.append({
                 "id": req.id,
                 "employeeId": user.id,
-                "employeeName": f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username,
+                "employeeName": card["name"],
                 "email": user.email,
-                "department": emp_profile.department if emp_profile and emp_profile.department else "Not Assigned",
+                "department": card["department"] or "Not Assigned",
                 "leaveType": leave_type.name,
                 "startDate": req.start_date.strftime('%Y-%m-%d'),
                 "endDate": req.end_date.strftime('%Y-%m-%d'),
@@ -104,10 +114,8 @@ def get_all_leave_records():
         return jsonify(leave_records), 200
         
     except Exception as e:
-        print(f"Error in get_all_leave_records: {str(e)}")
+        logger.error("Error in get_all_leave_records: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -127,7 +135,7 @@ def get_leave_by_department():
     if not department:
         return jsonify({"message": "Department parameter is required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Get users in the specified department
         dept_users = db.query(User.id).join(
@@ -176,10 +184,8 @@ def get_leave_by_department():
         return jsonify(leave_records), 200
         
     except Exception as e:
-        print(f"Error in get_leave_by_department: {str(e)}")
+        logger.error("Error in get_leave_by_department: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -187,41 +193,44 @@ def get_leave_by_department():
 # ============================================================================
 
 @admin_bp.route('/api/departments', methods=['GET'])
+@conditional_get('departments')
 def get_departments():
     """
     Get list of all departments
     Tables Used: departments, employee_profiles
     """
-    db = SessionLocal()
+    db = g.db
     try:
-        # Get from departments table
-        departments = db.query(Department).all()
-        dept_list = [{"id": d.id, "name": d.name, "description": d.description} for d in departments]
-        
-        # Also get unique departments from employee_profiles
-        profile_depts = db.query(EmployeeProfile.department).filter(
-            EmployeeProfile.department.isnot(None),
-            EmployeeProfile.department != ""
-        ).distinct().all()
-        
-        existing_names = {d["name"] for d in dept_list}
-        for dept in profile_depts:
-            if dept[0] and dept[0] not in existing_names:
-                dept_list.append({"id": None, "name": dept[0], "description": ""})
-        
-        return jsonify(dept_list), 200
+        # Departments table + names only used on employee_profiles (cached)
+        return jsonify(reference_cache.departments(db)), 200
         
     except Exception as e:
-        print(f"Error in get_departments: {str(e)}")
+        logger.error("Error in get_departments: %s", e)
+        skip_etag()
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 # ============================================================================
 # MY TEAM ENDPOINT
 # ============================================================================
 
+def _team_member_entry(user, cards):
+    """Build one /api/my_team row from a user and its batched profile card"""
+    card = cards.get(user.id) or empty_card(user.id, user.username)
+    return {
+        "id": user.id,
+        "name": card["name"],
+        "email": user.email,
+        "phone": user.phone or "",
+        "department": card["department"] or "Not Assigned",
+        "position": card["position"] or card["emp_type"] or "Not Specified",
+        "joining_date": card["joining_date"].isoformat() if card["joining_date"] else "",
+        "status": card["status"] or "Active",
+        "empId": card["emp_id"],
+        "image": card["image"]
+    }
+
+
 @admin_bp.route('/api/my_team', methods=['GET'])
 def get_my_team():
     """
@@ -234,7 +243,7 @@ def get_my_team():
     if not manager_id:
         return jsonify({"message": "User ID header required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Get team members for this manager
         team_members = db.query(TeamMember, User).join(
@@ -243,56 +252,22 @@ def get_my_team():
             TeamMember.manager_id == int(manager_id)
         ).all()
         
-        team_list = []
-        for tm, user in team_members:
-            # Get employee profile for additional info
-            emp_profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
-            team_list.append({
-                "id": user.id,
-                "name": f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username,
-                "email": user.email,
-                "phone": user.phone or "",
-                "department": emp_profile.department if emp_profile and emp_profile.department else "Not Assigned",
-                "position": emp_profile.position if emp_profile and emp_profile.position else emp_profile.emp_type if emp_profile and emp_profile.emp_type else "Not Specified",
-                "joining_date": emp_profile.joining_date.isoformat() if emp_profile and emp_profile.joining_date else "",
-                "status": emp_profile.status if emp_profile and emp_profile.status else "Active",
-                "empId": emp_profile.emp_id if emp_profile and emp_profile.emp_id else str(user.id),
-                "image": emp_profile.profile_image if emp_profile and emp_profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote((user.first_name or user.username) + ' ' + (user.last_name or ''))}&background=random"
-            })
-        
+        cards = load_employee_cards(db, [user.id for tm, user in team_members])
+        team_list = [_team_member_entry(user, cards) for tm, user in team_members]
+
         # If no team members in team_members table, return all employees for admin
         if not team_list:
             user_role = request.headers.get('X-User-Role', 'employee')
             if user_role == 'admin':
                 # Return all employees for admin
                 employees = db.query(User).filter(User.role == 'employee').all()
-                for user in employees:
-                    emp_profile = db.query(EmployeeProfile).filter(
-                        EmployeeProfile.user_id == user.id
-                    ).first()
-                    
-                    team_list.append({
-                        "id": user.id,
-                        "name": f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username,
-                        "email": user.email,
-                        "phone": user.phone or "",
-                        "department": emp_profile.department if emp_profile and emp_profile.department else "Not Assigned",
-                        "position": emp_profile.position if emp_profile and emp_profile.position else emp_profile.emp_type if emp_profile and emp_profile.emp_type else "Not Specified",
-                        "joining_date": emp_profile.joining_date.isoformat() if emp_profile and emp_profile.joining_date else "",
-                        "status": emp_profile.status if emp_profile and emp_profile.status else "Active",
-                        "empId": emp_profile.emp_id if emp_profile and emp_profile.emp_id else str(user.id),
-                        "image": emp_profile.profile_image if emp_profile and emp_profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote((user.first_name or user.username) + ' ' + (user.last_name or ''))}&background=random"
-                    })
+                cards = load_employee_cards(db, [user.id for user in employees])
+                team_list = [_team_member_entry(user, cards) for user in employees]
         return jsonify(team_list), 200
         
     except Exception as e:
-        print(f"Error in get_my_team: {str(e)}")
+        logger.error("Error in get_my_team: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -314,7 +289,7 @@ def add_team_member():
     if not manager_id or not member_id:
         return jsonify({"message": "manager_id and member_id are required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if already exists
         existing = db.query(TeamMember).filter(
@@ -336,16 +311,26 @@ def add_team_member():
         
     except Exception as e:
         db.rollback()
-        print(f"Error in add_team_member: {str(e)}")
+        logger.error("Error in add_team_member: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
 # EMPLOYEE LEAVE BALANCE FOR REPORTS
 # ============================================================================
 
+def _balance_summary_entry(lt):
+    """One report row from a leave_balances usage row"""
+    allocated = lt["allocated"] if lt["allocated"] is not None else float(lt["max_days_per_year"])
+    used = lt["used_calendar_days"]
+    return {
+        "leaveType": lt["name"],
+        "allocated": allocated,
+        "used": used,
+        "remaining": max(0, allocated - used)
+    }
+
+
 @admin_bp.route('/api/employee_leave_balance/<int:user_id>', methods=['GET'])
 @admin_required()
 def get_employee_leave_balance(user_id):
@@ -353,49 +338,54 @@ def get_employee_leave_balance(user_id):
     Get leave balance for a specific employee (for admin reports)
     Tables Used: leave_balances, leave_types, leave_requests
     """
-    from database import LeaveBalance
-    
-    db = SessionLocal()
+    db = g.db
     try:
         current_year = datetime.now().year
-        
-        # Get all leave types with balances
-        leave_types = db.query(LeaveType).all()
-        
-        balance_summary = []
-        for lt in leave_types:
-            # Get allocated balance
-            balance = db.query(LeaveBalance).filter(
-                LeaveBalance.user_id == user_id,
-                LeaveBalance.leave_type_id == lt.id,
-                LeaveBalance.year == current_year
-            ).first()
-            
-            allocated = float(balance.balance) if balance else float(lt.max_days_per_year)
-            
-            # Get used days (approved leaves)
-            used_days = db.query(LeaveRequest).filter(
-                LeaveRequest.user_id == user_id,
-                LeaveRequest.leave_type_id == lt.id,
-                LeaveRequest.status == 'approved'
-            ).all()
-            
-            used = sum((req.end_date - req.start_date).days + 1 for req in used_days)
-            
-            balance_summary.append({
-                "leaveType": lt.name,
-                "allocated": allocated,
-                "used": used,
-                "remaining": max(0, allocated - used)
-            })
+
+        # Allocated balance and used days per leave type in one query
+        usage = get_leave_type_usage(db, user_id, current_year)
+
+        balance_summary = [_balance_summary_entry(lt) for lt in usage]
         
         return jsonify(balance_summary), 200
         
     except Exception as e:
-        print(f"Error in get_employee_leave_balance: {str(e)}")
+        logger.error("Error in get_employee_leave_balance: %s", e)
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+
+@admin_bp.route('/api/employee_leave_balances', methods=['GET'])
+@admin_required()
+def get_employee_leave_balances():
+    """
+    Leave balances for many employees in one call (for admin reports)
+    Query Params: user_ids (comma separated, optional), department (optional),
+                  year (optional, defaults to current year)
+    Tables Used: users, employee_profiles, leave_balances, leave_types, leave_requests
+    """
+    user_ids_param = request.args.get('user_ids', '').strip()
+    department = request.args.get('department', '').strip() or None
+
+    try:
+        year = int(request.args.get('year') or datetime.now().year)
+        user_ids = [int(uid) for uid in user_ids_param.split(',') if uid.strip()] if user_ids_param else None
+    except ValueError:
+        return jsonify({"message": "user_ids and year must be integers"}), 400
+
+    db = g.db
+    try:
+        report = get_bulk_leave_type_usage(db, year, user_ids=user_ids, department=department)
+
+        return jsonify([{
+            "employeeId": emp["user_id"],
+            "employeeName": emp["name"],
+            "department": emp["department"] or "Not Assigned",
+            "balances": [_balance_summary_entry(lt) for lt in emp["balances"]]
+        } for emp in report]), 200
+
+    except Exception as e:
+        logger.error("Error in get_employee_leave_balances: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -502,7 +492,7 @@ def get_employee_leave_balance(user_id):
 @admin_bp.route('/admin_profile/<int:user_id>', methods=['PUT'])
 @admin_required()
 def update_admin_profile(user_id):
-    db = SessionLocal()
+    db = g.db
     try:
         # Support both JSON and multipart/form-data
         if request.content_type and 'multipart/form-data' in request.content_type:
@@ -594,11 +584,7 @@ def update_admin_profile(user_id):
             if 'profileImage' in request.files:
                 file = request.files['profileImage']
                 if file and file.filename != '':
-                    import base64
-                    file_content = file.read()
-                    base64_encoded = base64.b64encode(file_content).decode('utf-8')
-                    mime_type = file.content_type if file.content_type else 'image/png'
-                    emp_profile.profile_image = f"data:{mime_type};base64,{base64_encoded}"
+                    emp_profile.profile_image = media_store.save_image_upload(file)
 
         else:
             # ---- NESTED FORMAT (AdminProfile.jsx) ----
@@ -662,13 +648,9 @@ def update_admin_profile(user_id):
 
     except Exception as e:
         db.rollback()
-        print("❌ UPDATE ERROR:", str(e))
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in update_admin_profile: %s", e)
         return jsonify({"message": str(e)}), 500
 
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -685,7 +667,7 @@ def get_user_theme():
     if not user_id:
         return jsonify({"message": "User ID not found in token"}), 401
     
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.id == int(user_id)).first()
         if not user:
@@ -693,10 +675,8 @@ def get_user_theme():
             
         return jsonify({"theme": user.theme}), 200
     except Exception as e:
-        print(f"Error in get_user_theme: {str(e)}")
+        logger.error("Error in get_user_theme: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 @admin_bp.route('/api/settings/user_theme', methods=['PUT'])
 @jwt_required()
@@ -714,7 +694,7 @@ def update_user_theme():
     if not new_theme:
         return jsonify({"message": "Theme is required"}), 400
         
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.id == int(user_id)).first()
         if not user:
@@ -725,10 +705,8 @@ def update_user_theme():
         return jsonify({"message": "User theme updated successfully"}), 200
     except Exception as e:
         db.rollback()
-        print(f"Error in update_user_theme: {str(e)}")
+        logger.error("Error in update_user_theme: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
         
@@ -738,14 +716,13 @@ def update_user_theme():
 # ============================================================================
 
 @admin_bp.route('/api/settings/general', methods=['GET'])
+@conditional_get('settings')
 def get_general_settings():
     """
     Get all general system settings
-    Tables Used: system_settings
+    Tables Used: system_settings (cached)
     """
-    from database import SystemSettings
-    
-    db = SessionLocal()
+    db = g.db
     try:
         # Default settings
         default_settings = {
@@ -758,24 +735,22 @@ def get_general_settings():
             'allow_manager_edit': False
         }
         
-        # Get saved settings from database
-        settings = db.query(SystemSettings).all()
+        # Saved settings (cached, see reference_cache.py)
+        settings = reference_cache.settings(db)
         
-        for s in settings:
-            if s.setting_key in default_settings:
+        for key, s in settings.items():
+            if key in default_settings:
                 # Parse boolean values
-                if s.setting_type == 'boolean':
-                    default_settings[s.setting_key] = s.setting_value.lower() == 'true'
+                if s["type"] == 'boolean':
+                    default_settings[key] = s["value"].lower() == 'true'
                 else:
-                    default_settings[s.setting_key] = s.setting_value
+                    default_settings[key] = s["value"]
         
         return jsonify(default_settings), 200
         
     except Exception as e:
-        print(f"Error in get_general_settings: {str(e)}")
+        logger.error("Error in get_general_settings: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/settings/general', methods=['PUT'])
@@ -789,7 +764,7 @@ def update_general_settings():
     from database import SystemSettings
     
     data = request.get_json()
-    db = SessionLocal()
+    db = g.db
     
     try:
         user_id = request.headers.get('X-User-ID', 1)
@@ -831,10 +806,8 @@ def update_general_settings():
         
     except Exception as e:
         db.rollback()
-        print(f"Error in update_general_settings: {str(e)}")
+        logger.error("Error in update_general_settings: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -842,14 +815,13 @@ def update_general_settings():
 # ============================================================================
 
 @admin_bp.route('/api/settings/break_times', methods=['GET'])
+@conditional_get('settings')
 def get_break_times():
     """
     Get break time settings
-    Tables Used: system_settings
+    Tables Used: system_settings (cached)
     """
-    from database import SystemSettings
-    
-    db = SessionLocal()
+    db = g.db
     try:
         # Default break times
         break_times = {
@@ -858,27 +830,24 @@ def get_break_times():
             'custom_breaks': []
         }
         
-        # Get from database
-        settings = db.query(SystemSettings).filter(
-            SystemSettings.setting_key.in_(['lunch_break', 'coffee_break', 'custom_breaks'])
-        ).all()
+        # Saved settings (cached, see reference_cache.py)
+        settings = reference_cache.settings(db)
         
-        for s in settings:
-            if s.setting_key == 'custom_breaks' and s.setting_value:
+        for key in ['lunch_break', 'coffee_break', 'custom_breaks']:
+            value = settings[key]["value"] if key in settings else None
+            if key == 'custom_breaks' and value:
                 try:
-                    break_times['custom_breaks'] = json.loads(s.setting_value)
+                    break_times['custom_breaks'] = json.loads(value)
                 except:
                     break_times['custom_breaks'] = []
-            elif s.setting_value:
-                break_times[s.setting_key] = s.setting_value
+            elif value:
+                break_times[key] = value
         
         return jsonify(break_times), 200
         
     except Exception as e:
-        print(f"Error in get_break_times: {str(e)}")
+        logger.error("Error in get_break_times: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/settings/break_times', methods=['PUT'])
@@ -892,7 +861,7 @@ def update_break_times():
     from database import SystemSettings
     
     data = request.get_json()
-    db = SessionLocal()
+    db = g.db
     
     try:
         user_id = request.headers.get('X-User-ID', 1)
@@ -932,10 +901,8 @@ def update_break_times():
         
     except Exception as e:
         db.rollback()
-        print(f"Error in update_break_times: {str(e)}")
+        logger.error("Error in update_break_times: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -956,7 +923,7 @@ def create_department():
     if not name:
         return jsonify({"message": "Department name is required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if department already exists
         existing = db.query(Department).filter(Department.name == name).first()
@@ -981,10 +948,8 @@ def create_department():
         
     except Exception as e:
         db.rollback()
-        print(f"Error in create_department: {str(e)}")
+        logger.error("Error in create_department: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/departments/<int:dept_id>', methods=['PUT'])
@@ -997,7 +962,7 @@ def update_department(dept_id):
     """
     data = request.get_json()
     
-    db = SessionLocal()
+    db = g.db
     try:
         dept = db.query(Department).filter(Department.id == dept_id).first()
         
@@ -1018,10 +983,8 @@ def update_department(dept_id):
         
     except Exception as e:
         db.rollback()
-        print(f"Error in update_department: {str(e)}")
+        logger.error("Error in update_department: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/departments/<int:dept_id>', methods=['DELETE'])
@@ -1031,7 +994,7 @@ def delete_department(dept_id):
     Delete a department
     Tables Used: departments
     """
-    db = SessionLocal()
+    db = g.db
     try:
         dept = db.query(Department).filter(Department.id == dept_id).first()
         
@@ -1044,10 +1007,8 @@ def delete_department(dept_id):
         
     except Exception as e:
         db.rollback()
-        print(f"Error in delete_department: {str(e)}")
+        logger.error("Error in delete_department: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -1064,7 +1025,7 @@ def get_user_basic_info():
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.id == int(user_id)).first()
         
@@ -1083,14 +1044,12 @@ def get_user_basic_info():
             "phone": user.phone or "",
             "position": emp_profile.emp_type if emp_profile and emp_profile.emp_type else "",
             "role": user.role or "admin",
-            "profileImage": emp_profile.profile_image if emp_profile and emp_profile.profile_image else ""
+            "profileImage": media_store.public_url(emp_profile.profile_image) if emp_profile and emp_profile.profile_image else ""
         }), 200
         
     except Exception as e:
-        print(f"Error in get_admin_basic_info: {str(e)}")
+        logger.error("Error in get_admin_basic_info: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/settings/basic_info', methods=['PUT'])
@@ -1106,7 +1065,7 @@ def update_user_basic_info():
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.id == int(user_id)).first()
         
@@ -1138,12 +1097,12 @@ def update_user_basic_info():
                 if 'position' in data:
                     emp_profile.emp_type = data['position']
                 if 'profileImage' in data:
-                    emp_profile.profile_image = data['profileImage']
+                    emp_profile.profile_image = media_store.image_value(data['profileImage'])
             else:
                 new_profile = EmployeeProfile(
                     user_id=int(user_id),
                     emp_type=data.get('position', ''),
-                    profile_image=data.get('profileImage', '')
+                    profile_image=media_store.image_value(data.get('profileImage', ''))
                 )
                 db.add(new_profile)
         
@@ -1152,7 +1111,7 @@ def update_user_basic_info():
         
     except IntegrityError as e:
         db.rollback()
-        print(f"IntegrityError in update_admin_basic_info: {str(e)}")
+        logger.error("IntegrityError in update_admin_basic_info: %s", e)
         # Check if it's a unique constraint on email or phone
         error_msg = str(e).lower()
         if "users_email_key" in error_msg or "email" in error_msg:
@@ -1163,10 +1122,8 @@ def update_user_basic_info():
             return jsonify({"message": "A database constraint was violated. Please check your data."}), 400
     except Exception as e:
         db.rollback()
-        print(f"Error in update_admin_basic_info: {str(e)}")
+        logger.error("Error in update_admin_basic_info: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -1180,7 +1137,7 @@ def get_settings_team():
     Get all users with their roles for settings team tab
     Tables Used: users
     """
-    db = SessionLocal()
+    db = g.db
     try:
         users = db.query(User).all()
         
@@ -1197,10 +1154,8 @@ def get_settings_team():
         return jsonify(team_list), 200
         
     except Exception as e:
-        print(f"Error in get_settings_team: {str(e)}")
+        logger.error("Error in get_settings_team: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/settings/team/<int:user_id>', methods=['PUT'])
@@ -1217,7 +1172,7 @@ def update_user_role(user_id):
     if not new_role:
         return jsonify({"message": "Role is required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.id == user_id).first()
         
@@ -1231,10 +1186,8 @@ def update_user_role(user_id):
         
     except Exception as e:
         db.rollback()
-        print(f"Error in update_user_role: {str(e)}")
+        logger.error("Error in update_user_role: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -1248,7 +1201,7 @@ def get_settings_departments():
     Get departments with member counts and heads for settings
     Tables Used: departments, users, employee_profiles
     """
-    db = SessionLocal()
+    db = g.db
     try:
         departments = db.query(Department).order_by(Department.id).all()
         
@@ -1283,10 +1236,8 @@ def get_settings_departments():
         return jsonify(dept_list), 200
         
     except Exception as e:
-        print(f"Error in get_settings_departments: {str(e)}")
+        logger.error("Error in get_settings_departments: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 
@@ -1321,7 +1272,7 @@ def sync_team_member_relationship(db, employee_user_id, supervisor_id):
             )
             db.add(new_tm)
     except Exception as e:
-        print(f"Error in sync_team_member_relationship: {str(e)}")
+        logger.error("Error in sync_team_member_relationship: %s", e)
         raise
 
 
@@ -1337,7 +1288,7 @@ def add_employee():
     from werkzeug.security import generate_password_hash
     
     data = request.get_json()
-    db = SessionLocal()
+    db = g.db
     
     try:
         # Validate required fields
@@ -1384,7 +1335,7 @@ def add_employee():
             supervisor_id=data.get('supervisor_id'),
             hr_manager_id=data.get('hr_manager_id'),
             status=data.get('status', 'Active'),
-            profile_image=data.get('profile_image', '')
+            profile_image=media_store.image_value(data.get('profile_image', ''))
         )
         db.add(new_profile)
         
@@ -1414,14 +1365,12 @@ def add_employee():
         
     except IntegrityError as e:
         db.rollback()
-        print(f"IntegrityError in add_employee: {str(e)}")
+        logger.error("IntegrityError in add_employee: %s", e)
         return jsonify({"message": "Email or phone number already exists"}), 409
     except Exception as e:
         db.rollback()
-        print(f"Error in add_employee: {str(e)}")
+        logger.error("Error in add_employee: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/admin/supervisors', methods=['GET'])
@@ -1431,7 +1380,7 @@ def get_supervisors():
     Get list of all potential supervisors (admins and managers)
     Returns: List of users with id and name
     """
-    db = SessionLocal()
+    db = g.db
     try:
         # Get all users who could be supervisors (admins and existing supervisors)
         supervisors = db.query(User).all()
@@ -1447,10 +1396,8 @@ def get_supervisors():
         return jsonify(supervisor_list), 200
         
     except Exception as e:
-        print(f"Error in get_supervisors: {str(e)}")
+        logger.error("Error in get_supervisors: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
@@ -1464,7 +1411,7 @@ def get_admin_announcements():
     Get all broadcast announcements for admin view
     Returns: List of all broadcasts with sender info and new fields
     """
-    db = SessionLocal()
+    db = g.db
     try:
         broadcasts = db.query(Broadcast).order_by(Broadcast.created_at.desc()).all()
         result = []
@@ -1490,10 +1437,8 @@ def get_admin_announcements():
             })
         return jsonify(result), 200
     except Exception as e:
-        print(f"Error in get_admin_announcements: {str(e)}")
+        logger.error("Error in get_admin_announcements: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/admin/announcements', methods=['POST'])
@@ -1506,7 +1451,7 @@ def create_announcement():
     data = request.get_json()
     user_id = request.headers.get('X-User-ID')
     
-    db = SessionLocal()
+    db = g.db
     try:
         new_broadcast = Broadcast(
             title=data.get('event_name'),
@@ -1528,48 +1473,16 @@ def create_announcement():
         db.commit()
         db.refresh(new_broadcast)
         
-        # Create notifications for the target audience
-        try:
-            target = data.get('target_audience', 'all')
-            
-            # Identify users based on target audience
-            query = db.query(User)
-            if target == 'employees':
-                query = query.filter(User.role == 'employee')
-            elif target == 'admins':
-                query = query.filter(User.role == 'admin')
-            # 'all' includes everyone
-            
-            target_users = query.all()
-            
-            for user in target_users:
-                # Avoid notifying the sender themselves if you want, but usually announcements go to everyone
-                notif = Notification(
-                    user_id=user.id,
-                    title=f"New Announcement: {new_broadcast.title}",
-                    message=new_broadcast.message[:100] + ("..." if len(new_broadcast.message) > 100 else ""),
-                    notification_type="broadcast",
-                    link="/employee/dashboard" # Or wherever announcements are viewed
-                )
-                db.add(notif)
-            
-            db.commit()
-            print(f"Notifications created for {len(target_users)} users for announcement {new_broadcast.id}")
-        except Exception as e:
-            print(f"Error creating notifications for announcement: {str(e)}")
-            # Don't fail the announcement creation if notifications fail
-            pass
-
+        # No per-user notification rows: GET /api/notifications shows the
+        # announcement to its target audience (broadcast_inbox.py)
         return jsonify({
             "message": "Announcement created successfully",
             "id": new_broadcast.id
         }), 201
     except Exception as e:
         db.rollback()
-        print(f"Error in create_announcement: {str(e)}")
+        logger.error("Error in create_announcement: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @admin_bp.route('/api/admin/announcements/<int:broadcast_id>/react', methods=['POST'])
@@ -1585,7 +1498,7 @@ def react_to_announcement(broadcast_id):
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
         
-    db = SessionLocal()
+    db = g.db
     try:
         from database import BroadcastReaction
         
@@ -1624,17 +1537,52 @@ def react_to_announcement(broadcast_id):
         return jsonify({"message": message, "reactions_count": broadcast.reactions_count}), 200
     except Exception as e:
         db.rollback()
-        print(f"Error in react_to_announcement: {str(e)}")
+        logger.error("Error in react_to_announcement: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ============================================================================
 # REGISTER BLUEPRINT FUNCTION
 # ============================================================================
 
+# ============================================================================
+# CONNECTION POOL DIAGNOSTICS
+# ============================================================================
+
+@admin_bp.route('/internal/pool', methods=['GET'])
+@admin_required()
+def get_connection_pool_status():
+    """
+    Report the database connection pool of the worker serving this request.
+
+    Returns checked-out/checked-in connections, overflow in use, a checkout
+    wait histogram, timeouts, invalidated connections and connection ages.
+    Each gunicorn worker has its own pool: compare the "pid" field.
+    """
+    try:
+        return jsonify(get_pool_status()), 200
+    except Exception as e:
+        logger.error("Error in get_connection_pool_status: %s", e)
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+
+
+@admin_bp.route('/internal/stream', methods=['GET'])
+@admin_required()
+def get_event_stream_status():
+    """
+    Report the /api/stream connections of the worker serving this request.
+
+    Returns open/peak/accepted/rejected/closed streams, events received,
+    delivered and dropped, and the state of the LISTEN connection.
+    """
+    try:
+        return jsonify(stream_status()), 200
+    except Exception as e:
+        logger.error("Error in get_event_stream_status: %s", e)
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 def register_admin_endpoints(app):
     """Register the admin blueprint with the Flask app"""
     app.register_blueprint(admin_bp)
-    print("Admin endpoints registered successfully")
\ No newline at end of file
+    logger.info("Admin endpoints registered")
\ No newline at end of file
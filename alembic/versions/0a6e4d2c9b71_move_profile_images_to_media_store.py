@@ -0,0 +1,80 @@
+"""move base64 profile images into the media store
+
+Revision ID: 0a6e4d2c9b71
+Revises: f2c7a8e4b915
+Create Date: 2026-10-17 16:41:27.905318
+
+employee_profiles.profile_image values of the form data:...;base64,...
+are written to MEDIA_ROOT (media_store.py) and replaced by their short
+"/media/<sha256>" path. Run it where MEDIA_ROOT points at the storage
+the web service uses; it refuses to run without MEDIA_ROOT in the
+environment rather than fill the repo-relative default. Values that do
+not decode are left unchanged.
+"""
+
+import base64
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0a6e4d2c9b71'
+down_revision = 'f2c7a8e4b915'
+branch_labels = None
+depends_on = None
+
+
+def _require_media_root():
+    if not os.environ.get('MEDIA_ROOT'):
+        raise RuntimeError(
+            "MEDIA_ROOT is not set: run this migration with MEDIA_ROOT pointing at "
+            "the web service's persistent media storage"
+        )
+
+
+def upgrade() -> None:
+    _require_media_root()
+    import media_store
+
+    conn = op.get_bind()
+    ids = conn.execute(sa.text(
+        "SELECT id FROM employee_profiles WHERE profile_image LIKE 'data:%'"
+    )).scalars().all()
+
+    # One row at a time: each value can be megabytes
+    for profile_id in ids:
+        value = conn.execute(
+            sa.text("SELECT profile_image FROM employee_profiles WHERE id = :id"), {"id": profile_id}
+        ).scalar()
+        try:
+            _mime, data = media_store.decode_data_url(value)
+        except ValueError:
+            continue
+        digest, _size = media_store.store.save_bytes(data)
+        conn.execute(
+            sa.text("UPDATE employee_profiles SET profile_image = :path WHERE id = :id"),
+            {"path": media_store.media_path(digest), "id": profile_id}
+        )
+
+
+def downgrade() -> None:
+    _require_media_root()
+    import media_store
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, profile_image FROM employee_profiles WHERE profile_image LIKE '/media/%'"
+    )).all()
+
+    for profile_id, value in rows:
+        digest = media_store.digest_from_value(value)
+        if digest is None or not media_store.store.exists(digest):
+            continue
+        with open(media_store.store.path(digest), 'rb') as f:
+            data = f.read()
+        mime = media_store.sniff_mime(data[:16]) or 'image/png'
+        conn.execute(
+            sa.text("UPDATE employee_profiles SET profile_image = :value WHERE id = :id"),
+            {"value": f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}", "id": profile_id}
+        )
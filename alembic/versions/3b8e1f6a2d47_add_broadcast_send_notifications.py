@@ -0,0 +1,32 @@
+"""add broadcasts.send_notifications
+
+Revision ID: 3b8e1f6a2d47
+Revises: 0a6e4d2c9b71
+Create Date: 2026-10-17 18:12:40.631904
+
+POST /api/broadcast only notifies the audience with send_notifications;
+the inbox (broadcast_inbox.py) filters on the stored flag. Existing rows
+keep showing as they do now (true).
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3b8e1f6a2d47'
+down_revision = '0a6e4d2c9b71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c['name'] for c in inspector.get_columns('broadcasts')]
+
+    if 'send_notifications' not in columns:
+        op.add_column('broadcasts', sa.Column('send_notifications', sa.Boolean(), nullable=False, server_default='true'))
+
+
+def downgrade() -> None:
+    op.drop_column('broadcasts', 'send_notifications')
@@ -0,0 +1,79 @@
+"""add hot path indexes
+
+Revision ID: 5c81e0d4a7b2
+Revises: a2cab3f93f44
+Create Date: 2026-10-17 10:02:18.331907
+
+Composite and partial indexes for the filters the API runs on every
+request. They are built with CREATE INDEX CONCURRENTLY (outside the
+migration transaction) so a live database keeps accepting writes while
+they build. Run `python index_advisor.py` afterwards to confirm the
+catalogued queries no longer sequential-scan.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5c81e0d4a7b2'
+down_revision = 'a2cab3f93f44'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, column list, partial-index predicate or None)
+INDEXES = [
+    # overlap / balance checks, my leave history
+    ('ix_leave_requests_user_status', 'leave_requests', 'user_id, status', None),
+    # pending counts and approval lists ordered by applied_date
+    ('ix_leave_requests_status_applied', 'leave_requests', 'status, applied_date', None),
+    # per-user date range overlap check
+    ('ix_leave_requests_user_dates', 'leave_requests', 'user_id, start_date, end_date', None),
+    # "who is on leave" / leave stats date ranges over approved leave only
+    ('ix_leave_requests_approved_dates', 'leave_requests', 'start_date, end_date', "status = 'approved'"),
+    # notification bell: latest 50 for a user
+    ('ix_notifications_user_created', 'notifications', 'user_id, created_at', None),
+    # today's break minutes and the currently open break
+    ('ix_break_sessions_user_date', 'break_sessions', 'user_id, date', None),
+    ('ix_break_sessions_open', 'break_sessions', 'user_id, date', 'break_end IS NULL'),
+    # pending regularization counts / approval lists, my regularizations
+    ('ix_regularizations_status_request_date', 'regularizations', 'status, request_date', None),
+    ('ix_regularizations_user_request_date', 'regularizations', 'user_id, request_date', None),
+    # OTP verification only ever looks at unused codes
+    ('ix_otps_unused_lookup', 'otps', 'email, otp_code, expires_at', 'is_used = 0'),
+    # organisation-wide attendance by day / date range (dashboard, graph stats)
+    ('ix_attendance_date', 'attendance', 'date', None),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+            if where:
+                sql += f" WHERE {where}"
+            op.execute(sql)
+
+            # A failed concurrent build leaves an INVALID index behind that
+            # IF NOT EXISTS would skip forever: drop it and build again.
+            invalid = op.get_bind().execute(sa.text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {"name": name}).fetchone()
+            if invalid:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                op.execute(sql)
+
+        op.execute("ANALYZE leave_requests")
+        op.execute("ANALYZE notifications")
+        op.execute("ANALYZE break_sessions")
+        op.execute("ANALYZE regularizations")
+        op.execute("ANALYZE otps")
+        op.execute("ANALYZE attendance")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
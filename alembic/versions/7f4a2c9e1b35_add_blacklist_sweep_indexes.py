@@ -0,0 +1,37 @@
+"""add blacklisted_tokens watermark and expiry indexes
+
+Revision ID: 7f4a2c9e1b35
+Revises: e37d9b2f6c10
+Create Date: 2026-10-17 12:41:37.560214
+
+The token blacklist cache refreshes by blacklisted_at watermark and the
+sweeper deletes by expires_at; both need an index once the table is big.
+Expired rows are deleted once here so the first refresh starts small.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7f4a2c9e1b35'
+down_revision = 'e37d9b2f6c10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    indexes = [ix['name'] for ix in inspector.get_indexes('blacklisted_tokens')]
+
+    op.execute("DELETE FROM blacklisted_tokens WHERE expires_at < (now() AT TIME ZONE 'utc')")
+
+    if 'ix_blacklisted_tokens_blacklisted_at' not in indexes:
+        op.create_index('ix_blacklisted_tokens_blacklisted_at', 'blacklisted_tokens', ['blacklisted_at'])
+    if 'ix_blacklisted_tokens_expires_at' not in indexes:
+        op.create_index('ix_blacklisted_tokens_expires_at', 'blacklisted_tokens', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blacklisted_tokens_expires_at', table_name='blacklisted_tokens')
+    op.drop_index('ix_blacklisted_tokens_blacklisted_at', table_name='blacklisted_tokens')
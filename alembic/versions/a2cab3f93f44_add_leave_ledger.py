@@ -0,0 +1,88 @@
+"""add leave ledger
+
+Revision ID: a2cab3f93f44
+Revises: bc2b9807fad5
+Create Date: 2026-10-17 09:12:41.503112
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a2cab3f93f44'
+down_revision = 'bc2b9807fad5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+
+    if 'leave_ledger_balances' not in tables:
+        op.create_table(
+            'leave_ledger_balances',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('leave_type_id', sa.Integer(), sa.ForeignKey('leave_types.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('year', sa.Integer(), nullable=False),
+            sa.Column('allocated', sa.DECIMAL(6, 2), nullable=False, server_default='0'),
+            sa.Column('pending', sa.DECIMAL(6, 2), nullable=False, server_default='0'),
+            sa.Column('used', sa.DECIMAL(6, 2), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.UniqueConstraint('user_id', 'leave_type_id', 'year', name='unique_ledger_balance'),
+        )
+
+    if 'leave_ledger_entries' not in tables:
+        op.create_table(
+            'leave_ledger_entries',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('leave_type_id', sa.Integer(), sa.ForeignKey('leave_types.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('year', sa.Integer(), nullable=False),
+            sa.Column('leave_request_id', sa.Integer(), sa.ForeignKey('leave_requests.id', ondelete='SET NULL'), nullable=True),
+            sa.Column('entry_type', sa.String(length=10), nullable=False),
+            sa.Column('event', sa.String(length=30), nullable=False),
+            sa.Column('allocated_delta', sa.DECIMAL(6, 2), nullable=False, server_default='0'),
+            sa.Column('pending_delta', sa.DECIMAL(6, 2), nullable=False, server_default='0'),
+            sa.Column('used_delta', sa.DECIMAL(6, 2), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_leave_ledger_entries_key', 'leave_ledger_entries', ['user_id', 'leave_type_id', 'year'])
+
+    # ---- Backfill: open a balance for every (user, type, year) with history ----
+    op.execute("""
+        INSERT INTO leave_ledger_balances (user_id, leave_type_id, year, allocated, pending, used, updated_at)
+        SELECT lr.user_id,
+               lr.leave_type_id,
+               EXTRACT(YEAR FROM lr.start_date)::int,
+               lt.max_days_per_year,
+               COALESCE(SUM(lr.num_days) FILTER (WHERE lr.status = 'pending'), 0),
+               COALESCE(SUM(lr.num_days) FILTER (WHERE lr.status = 'approved'), 0),
+               now()
+        FROM leave_requests lr
+        JOIN leave_types lt ON lt.id = lr.leave_type_id
+        WHERE lr.status IN ('pending', 'approved')
+        GROUP BY lr.user_id, lr.leave_type_id, EXTRACT(YEAR FROM lr.start_date), lt.max_days_per_year
+        ON CONFLICT ON CONSTRAINT unique_ledger_balance DO NOTHING
+    """)
+
+    op.execute("""
+        INSERT INTO leave_ledger_entries
+            (user_id, leave_type_id, year, entry_type, event,
+             allocated_delta, pending_delta, used_delta, created_at)
+        SELECT b.user_id, b.leave_type_id, b.year,
+               CASE WHEN b.allocated - b.pending - b.used > 0 THEN 'credit' ELSE 'debit' END,
+               'opening', b.allocated, b.pending, b.used, now()
+        FROM leave_ledger_balances b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM leave_ledger_entries e
+            WHERE e.user_id = b.user_id AND e.leave_type_id = b.leave_type_id AND e.year = b.year
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('leave_ledger_entries')
+    op.drop_table('leave_ledger_balances')
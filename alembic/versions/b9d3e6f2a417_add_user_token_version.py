@@ -0,0 +1,29 @@
+"""add users.token_version
+
+Revision ID: b9d3e6f2a417
+Revises: 7f4a2c9e1b35
+Create Date: 2026-10-17 13:20:52.904411
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b9d3e6f2a417'
+down_revision = '7f4a2c9e1b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c['name'] for c in inspector.get_columns('users')]
+
+    if 'token_version' not in columns:
+        # A constant default: existing rows are filled without a table rewrite
+        op.add_column('users', sa.Column('token_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
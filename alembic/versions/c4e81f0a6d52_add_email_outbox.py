@@ -0,0 +1,45 @@
+"""add email_outbox
+
+Revision ID: c4e81f0a6d52
+Revises: b9d3e6f2a417
+Create Date: 2026-10-17 14:05:18.271936
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c4e81f0a6d52'
+down_revision = 'b9d3e6f2a417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'email_outbox' not in inspector.get_table_names():
+        op.create_table(
+            'email_outbox',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('to_email', sa.String(255), nullable=False),
+            sa.Column('subject', sa.String(255), nullable=False),
+            sa.Column('body', sa.Text(), nullable=False),
+            sa.Column('content_type', sa.String(10), nullable=False, server_default='html'),
+            sa.Column('status', sa.String(10), nullable=False, server_default='pending'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() AT TIME ZONE 'utc')")),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index(
+            'ix_email_outbox_due', 'email_outbox', ['next_attempt_at'],
+            postgresql_where=sa.text("status = 'pending'")
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_outbox_due', table_name='email_outbox')
+    op.drop_table('email_outbox')
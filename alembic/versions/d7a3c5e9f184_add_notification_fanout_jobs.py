@@ -0,0 +1,43 @@
+"""add notification_fanout_jobs
+
+Revision ID: d7a3c5e9f184
+Revises: c4e81f0a6d52
+Create Date: 2026-10-17 14:48:03.615402
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3c5e9f184'
+down_revision = 'c4e81f0a6d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'notification_fanout_jobs' not in inspector.get_table_names():
+        op.create_table(
+            'notification_fanout_jobs',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('broadcast_id', sa.Integer(), sa.ForeignKey('broadcasts.id', ondelete='SET NULL'), nullable=True),
+            sa.Column('target_audience', sa.String(50), nullable=False, server_default='all'),
+            sa.Column('title', sa.String(200), nullable=False),
+            sa.Column('message', sa.Text(), nullable=True),
+            sa.Column('notification_type', sa.String(50), nullable=False, server_default='broadcast'),
+            sa.Column('link', sa.String(255), nullable=True),
+            sa.Column('status', sa.String(10), nullable=False, server_default='queued'),
+            sa.Column('total', sa.Integer(), nullable=True),
+            sa.Column('processed', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('last_user_id', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('notification_fanout_jobs')
@@ -0,0 +1,87 @@
+"""add leave period exclusion constraint
+
+Revision ID: e37d9b2f6c10
+Revises: 5c81e0d4a7b2
+Create Date: 2026-10-17 11:24:05.118342
+
+Stores every leave request's inclusive [start_date, end_date] as a
+generated `period` daterange (computed for all existing rows when the
+column is added) and adds a GiST exclusion constraint so one user can
+never hold two pending/approved requests sharing a day, however many
+submissions race each other.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e37d9b2f6c10'
+down_revision = '5c81e0d4a7b2'
+branch_labels = None
+depends_on = None
+
+
+CONSTRAINT = 'excl_leave_requests_user_period'
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [c['name'] for c in inspector.get_columns('leave_requests')]
+
+    # user_id WITH = inside a GiST index needs the btree_gist operator classes
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+
+    if 'period' not in columns:
+        # daterange() refuses an upper bound below the lower bound: repair
+        # rows saved with swapped dates before the column is computed
+        op.execute("""
+            UPDATE leave_requests
+            SET start_date = end_date, end_date = start_date
+            WHERE end_date < start_date
+        """)
+        op.execute("""
+            ALTER TABLE leave_requests
+            ADD COLUMN period daterange
+            GENERATED ALWAYS AS (daterange(start_date, end_date, '[]')) STORED
+        """)
+
+    exists = conn.execute(sa.text(
+        "SELECT 1 FROM pg_constraint WHERE conname = :name"
+    ), {"name": CONSTRAINT}).fetchone()
+    if exists:
+        return
+
+    # Requests that already overlap would make ADD CONSTRAINT fail with an
+    # opaque error; list them so they can be rejected/edited first.
+    conflicts = conn.execute(sa.text("""
+        SELECT a.user_id, a.id, a.start_date, a.end_date, b.id, b.start_date, b.end_date
+        FROM leave_requests a
+        JOIN leave_requests b
+          ON b.user_id = a.user_id AND b.id > a.id AND b.period && a.period
+        WHERE a.status IN ('pending', 'approved')
+          AND b.status IN ('pending', 'approved')
+        ORDER BY a.user_id, a.id
+        LIMIT 50
+    """)).fetchall()
+    if conflicts:
+        lines = "\n".join(
+            f"  user {row[0]}: request #{row[1]} ({row[2]} - {row[3]}) overlaps #{row[4]} ({row[5]} - {row[6]})"
+            for row in conflicts
+        )
+        raise RuntimeError(
+            "Cannot add the leave period exclusion constraint, these active "
+            "requests overlap:\n" + lines
+        )
+
+    op.execute(f"""
+        ALTER TABLE leave_requests
+        ADD CONSTRAINT {CONSTRAINT}
+        EXCLUDE USING gist (user_id WITH =, period WITH &&)
+        WHERE (status IN ('pending', 'approved'))
+    """)
+
+
+def downgrade() -> None:
+    op.execute(f"ALTER TABLE leave_requests DROP CONSTRAINT IF EXISTS {CONSTRAINT}")
+    op.execute("ALTER TABLE leave_requests DROP COLUMN IF EXISTS period")
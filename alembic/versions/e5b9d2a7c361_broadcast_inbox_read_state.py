@@ -0,0 +1,66 @@
+"""broadcast inbox read state, drop materialised broadcast notifications
+
+Revision ID: e5b9d2a7c361
+Revises: d7a3c5e9f184
+Create Date: 2026-10-17 15:32:46.108273
+
+Broadcast notifications are computed on read (broadcast_inbox.py). The
+per-user copies in notifications are deleted and every existing user's
+watermark is set to the newest broadcast, so broadcasts sent before this
+migration show as read. notification_fanout_jobs is no longer used.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9d2a7c361'
+down_revision = 'd7a3c5e9f184'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+    columns = [c['name'] for c in inspector.get_columns('users')]
+
+    if 'last_seen_broadcast_id' not in columns:
+        op.add_column('users', sa.Column('last_seen_broadcast_id', sa.Integer(), nullable=False, server_default='0'))
+        op.execute("UPDATE users SET last_seen_broadcast_id = (SELECT coalesce(max(id), 0) FROM broadcasts)")
+
+    if 'broadcast_read_exceptions' not in tables:
+        op.create_table(
+            'broadcast_read_exceptions',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('broadcast_id', sa.Integer(), sa.ForeignKey('broadcasts.id', ondelete='CASCADE'), primary_key=True),
+        )
+
+    op.execute("DELETE FROM notifications WHERE notification_type = 'broadcast'")
+
+    if 'notification_fanout_jobs' in tables:
+        op.drop_table('notification_fanout_jobs')
+
+
+def downgrade() -> None:
+    # The deleted per-user broadcast notifications are not recreated
+    op.create_table(
+        'notification_fanout_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('broadcast_id', sa.Integer(), sa.ForeignKey('broadcasts.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('target_audience', sa.String(50), nullable=False, server_default='all'),
+        sa.Column('title', sa.String(200), nullable=False),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('notification_type', sa.String(50), nullable=False, server_default='broadcast'),
+        sa.Column('link', sa.String(255), nullable=True),
+        sa.Column('status', sa.String(10), nullable=False, server_default='queued'),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('processed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_user_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+    )
+    op.drop_table('broadcast_read_exceptions')
+    op.drop_column('users', 'last_seen_broadcast_id')
@@ -0,0 +1,32 @@
+"""add resource_versions
+
+Revision ID: f2c7a8e4b915
+Revises: e5b9d2a7c361
+Create Date: 2026-10-17 16:05:12.447921
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f2c7a8e4b915'
+down_revision = 'e5b9d2a7c361'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+
+    if 'resource_versions' not in inspector.get_table_names():
+        op.create_table(
+            'resource_versions',
+            sa.Column('resource', sa.String(50), primary_key=True),
+            sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('resource_versions')
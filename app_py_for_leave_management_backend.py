@@ -1,24 +1,31 @@
 # app.py
 
-print("----- Flask Application is starting from THIS file! -----")
+import logging
 
-from flask import Flask, request, jsonify
+from logging_setup import setup_logging
+
+# Queue-based logging first, so every module's logger goes through it
+setup_logging()
+logger = logging.getLogger(__name__)
+logger.info("Flask application is starting")
+
+from flask import Flask, Response, request, jsonify, g, send_file, make_response
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import date, datetime, timedelta
+from decimal import Decimal
 from functools import wraps
 import os
 import sys
 import jwt
 import requests
 import secrets
-import smtplib
 import urllib.parse
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import time
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import func, extract, text
 from database import (
-    SessionLocal, User, OTP, init_db, get_db,
+    User, OTP, init_db, get_db, SessionLocal,
     LeaveType, LeaveBalance, LeaveRequest,
     EmployeeProfile, Attendance, Regularization,
     Holiday, Department, TeamMember,
@@ -28,13 +35,43 @@ from database import (
     Announcement, BlacklistedToken
 )
 from auth import (
-    generate_tokens, verify_token, blacklist_token,
+    generate_tokens, verify_token, blacklist_token, revoke_all_tokens,
+    USE_JTI_BLACKLIST, USE_TOKEN_VERSIONS,
     refresh_access_token, jwt_required, role_required, permission_required
 )
+from profile_enrichment import load_employee_cards, empty_card, display_name
+from db_session import init_request_db, session_scope
+from token_blacklist import start_sweeper
+from email_outbox import enqueue_email
+from broadcast_inbox import list_broadcast_notifications, mark_broadcast_read, mark_all_broadcasts_read
+import event_stream
+from resource_versions import install_resource_versions, conditional_get, skip_etag
+import leave_ledger
+import holiday_calendar
+import reference_cache
+import media_store
+import avatar_service
+import document_store
+from leave_periods import find_overlapping_leave, is_overlap_violation
+from dashboard_stats import (
+    compute_employee_dashboard, compute_attendance_graph_stats, compute_leave_stats
+)
 
 # Create a Flask application instance
 app = Flask(__name__)
 
+# Request-scoped session: views use g.db, committed/closed centrally
+init_request_db(app)
+
+# Delete expired blacklisted tokens periodically (per worker process)
+start_sweeper()
+
+# Publish notification/leave/regularization changes for /api/stream
+event_stream.install_change_events(SessionLocal)
+
+# Version counters behind the reference-data ETags
+install_resource_versions(SessionLocal)
+
 from admin_endpoints import register_admin_endpoints
 register_admin_endpoints(app)
 
@@ -59,7 +96,7 @@ def add_cors_headers(response):
         response.headers['Access-Control-Allow-Credentials'] = 'false'
 
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-User-Role, X-User-ID'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-User-Role, X-User-ID, X-Read-Primary'
     return response
 
 @app.before_request
@@ -72,46 +109,12 @@ def handle_options():
             response.headers['Access-Control-Allow-Origin'] = origin
             response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-User-Role, X-User-ID'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-User-Role, X-User-ID, X-Read-Primary'
         return response, 200
 
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
-
-# Email configuration
-EMAIL_USER = os.getenv('EMAIL_USER', 'asolinmaso22@gmail.com')
-EMAIL_PASS = os.getenv('EMAIL_PASS', 'iqcg fkfy fuar habr')
-EMAIL_FROM = os.getenv('EMAIL_FROM', 'example@example.com')
-SMTP_SERVER = 'smtp.gmail.com'
-SMTP_PORT = 587
 app.config['SESSION_COOKIE_SECURE'] = True
 
-# Email sending function
-def send_email(to_email, subject, body):
-    """Send email using SMTP"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_FROM
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
-
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASS.strip())
-        server.sendmail(EMAIL_FROM, to_email, msg.as_string())
-        server.quit()
-        print(f"Email sent successfully to {to_email}")
-        return True
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"Email authentication failed: {e}")
-        return False
-    except smtplib.SMTPException as e:
-        print(f"SMTP error: {e}")
-        return False
-    except Exception as e:
-        print(f"Email sending failed: {e}")
-        return False
-
 
 # Database tables will be initialized when app starts
 
@@ -126,15 +129,11 @@ def custom_admin_required():
         @jwt_required()
         def decorator(*args, **kwargs):
             user_role = getattr(request, 'user_role', None)
-            
-            import os
-            log_file = os.path.join(os.path.dirname(__file__), "debug_auth.log")
-            with open(log_file, "a") as f_log:
-                f_log.write(f"{datetime.now()}: [custom_admin_required] Role Check. Actual: {user_role}\n")
+            logger.debug("custom_admin_required on %s: role %s", request.path, user_role)
 
             if not user_role or str(user_role).lower() != 'admin':
-                with open(log_file, "a") as f_log:
-                    f_log.write(f"{datetime.now()}: [custom_admin_required] ACCESS DENIED. Found: {user_role}\n")
+                logger.warning("custom_admin_required denied %s: role %s, user %s",
+                               request.path, user_role, getattr(request, 'user_id', None))
                 return jsonify({
                     "message": f"Access denied. Admin role required. (Found: {user_role})"
                 }), 403
@@ -169,7 +168,7 @@ def hello_world():
 @app.route('/admin_dashboard')
 def admin_dashboard():
     """Get admin dashboard statistics"""
-    db = SessionLocal()
+    db = g.db
     try:
         today = datetime.now().date()
         
@@ -196,7 +195,7 @@ def admin_dashboard():
             LeaveRequest.end_date >= today
         ).count()
         
-        print("DEBUG on_time:", on_time)  # add this
+        logger.debug("Admin dashboard on_time: %s", on_time)
 
         
         # Pending Approval - leave requests with pending status
@@ -217,7 +216,7 @@ def admin_dashboard():
         }), 200
         
     except Exception as e:
-        print(f"Admin dashboard error: {str(e)}")
+        logger.error("Admin dashboard error: %s", e)
         return jsonify({
             "total_employees": 0,
             "On_Time": 0,
@@ -226,8 +225,6 @@ def admin_dashboard():
             "Pending_Approval": 0,
             "This_Week_Hoilday": 0
         }), 200
-    finally:
-        db.close()
 
 @app.route('/api/attendance/start-break', methods=['POST'])
 def start_break():
@@ -235,7 +232,7 @@ def start_break():
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         today = datetime.now().date()
 
@@ -253,8 +250,6 @@ def start_break():
     except Exception as e:
         db.rollback()
         return jsonify({"message": str(e)}), 500
-    finally:
-        db.close()
 
 @app.route('/api/attendance/end-break', methods=['POST'])
 def end_break():
@@ -262,7 +257,7 @@ def end_break():
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         today = datetime.now().date()
 
@@ -292,8 +287,6 @@ def end_break():
     except Exception as e:
         db.rollback()
         return jsonify({"message": str(e)}), 500
-    finally:
-        db.close()
 
 @app.route('/api/attendance/punch-in', methods=['POST'])
 def punch_in():
@@ -301,7 +294,7 @@ def punch_in():
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         today = datetime.now().date()
 
@@ -329,8 +322,6 @@ def punch_in():
     except Exception as e:
         db.rollback()
         return jsonify({"message": str(e)}), 500
-    finally:
-        db.close()
 
 @app.route('/api/attendance/punch-out', methods=['POST'])
 def punch_out():
@@ -338,7 +329,7 @@ def punch_out():
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         today = datetime.now().date()
 
@@ -388,14 +379,14 @@ def punch_out():
     except Exception as e:
         db.rollback()
         return jsonify({"message": str(e)}), 500
-    finally:
-        db.close()
 
 @app.route('/api/attendance/today', methods=['GET'])
 def get_today_attendance():
     user_id = request.headers.get('X-User-ID')
+    if not user_id:
+        return jsonify({}), 200
 
-    db = SessionLocal()
+    db = g.db
     try:
         today = datetime.now().date()
 
@@ -428,12 +419,8 @@ def get_today_attendance():
         }), 200
 
     except Exception as e:
-        print("Today attendance error:", e)
+        logger.error("Today attendance error: %s", e)
         return jsonify({}), 200
-    finally:
-        db.close()
-
-import calendar
 
 @app.route('/api/attendance_graph_stats', methods=['GET'])
 def get_attendance_graph_stats():
@@ -444,150 +431,40 @@ def get_attendance_graph_stats():
     requester_role = request.headers.get('X-User-Role', '').lower()
     requester_id = request.headers.get('X-User-ID')
     
-    db = SessionLocal()
+    db = g.db
     try:
         today = datetime.now().date()
-        total_users_count = max(1, db.query(User).count())
-        
-        # Base query
-        query = db.query(Attendance)
-        
+
         # Decide if individual or global
         # 1. If requester is Employee -> Always individual (their own ID)
         # 2. If requester is Admin -> individual ONLY IF user_id is passed in args
-        
-        is_individual = False
         target_id = None
-        
+
         if requester_role == 'admin':
             if requested_user_id:
                 target_id = int(requested_user_id)
-                is_individual = True
-            else:
-                is_individual = False # Global
         else:
             # Employee role or other — always show their own
             target_id = int(requester_id) if requester_id else (int(requested_user_id) if requested_user_id else None)
-            is_individual = True if target_id else False
-
-        if is_individual and target_id:
-            query = query.filter(Attendance.user_id == target_id)
-
-        # 1. Months Data (last 6 months)
-        months_data = []
-        for i in range(5, -1, -1):
-            # Calculate start of target month
-            # Go back i months from the 1st of current month
-            first_of_this_month = today.replace(day=1)
-            
-            # Simplified year/month calc
-            m = today.month - i
-            y = today.year
-            while m <= 0:
-                m += 12
-                y -= 1
-            
-            month_start = date(y, m, 1)
-            # Find last day of month
-            if m == 12:
-                month_end = date(y + 1, 1, 1) - timedelta(days=1)
-            else:
-                month_end = date(y, m + 1, 1) - timedelta(days=1)
-                
-            month_name = calendar.month_abbr[m]
-            
-            present_count = query.filter(
-                Attendance.date >= month_start,
-                Attendance.date <= month_end,
-                Attendance.check_in.isnot(None)
-            ).count()
-            
-            # Expected days logic
-            if y == today.year and m == today.month:
-                # Up to today
-                expected_per_user = max(1, (today.day * 5) // 7)
-                expected_per_user = min(22, expected_per_user)
-            else:
-                expected_per_user = 22
-                
-            denominator = expected_per_user if is_individual else expected_per_user * total_users_count
-            percent = min(100, (present_count / max(1, denominator)) * 100)
-            
-            months_data.append({
-                "label": month_name,
-                "value": round(percent)
-            })
-            
-        # 2. Weeks Data (last 4 weeks)
-        weeks_data = []
-        for i in range(3, -1, -1):
-            start_week = today - timedelta(days=today.weekday()) - timedelta(days=7 * i)
-            end_week = start_week + timedelta(days=6)
-            
-            present_count = query.filter(
-                Attendance.date >= start_week,
-                Attendance.date <= end_week,
-                Attendance.check_in.isnot(None)
-            ).count()
-            
-            denominator = 5 if is_individual else 5 * total_users_count
-            percent = min(100, (present_count / max(1, denominator)) * 100)
-            
-            weeks_data.append({
-                "label": f"W{4 - i}",
-                "value": round(percent)
-            })
-            
-        # 3. Days Data (Current Week: Mon - Sun)
-        days_data = []
-        monday = today - timedelta(days=today.weekday())
-        for i in range(7):
-            target_day = monday + timedelta(days=i)
-            day_name = calendar.day_abbr[target_day.weekday()]
-            
-            count = query.filter(
-                Attendance.date == target_day,
-                Attendance.check_in.isnot(None)
-            ).count()
-            
-            if is_individual:
-                value = 100 if count > 0 else 0
-            else:
-                value = round((count / total_users_count) * 100)
 
-            days_data.append({
-                "label": day_name,
-                "value": value
-            })
-            
-        return jsonify({
-            "months": months_data,
-            "weeks": weeks_data,
-            "days": days_data
-        }), 200
+        # Months (last 6), weeks (last 4) and days (current week) in one query
+        stats = compute_attendance_graph_stats(db, today, target_id or None)
+        return jsonify(stats), 200
         
     except Exception as e:
-        print(f"Attendance stats error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Attendance stats error: %s", e)
         return jsonify({"months": [], "weeks": [], "days": []}), 500
-    finally:
-        db.close()
         
 @app.route('/test_db_connection')
 def test_db_connection():
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         # Try a simple query
         from sqlalchemy import text
         db.execute(text("SELECT 1"))
         return jsonify({"message": "Database connection successful!", "status": "connected"})
     except Exception as e:
         return jsonify({"message": f"An error occurred: {str(e)}", "status": "error"}), 500
-    finally:
-        if db:
-            db.close()
 
 
 
@@ -609,11 +486,11 @@ def register_user():
     if not username or not password or not email or not phone:
         return jsonify({"message": "Username, password, email and phone are required."}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if signup is allowed
-        signup_setting = db.query(SystemSettings).filter(SystemSettings.setting_key == 'allow_signup').first()
-        is_disabled = signup_setting and signup_setting.setting_value.lower() in ['false', '0', 'no', 'disable', 'disabled']
+        allow_signup = reference_cache.setting(db, 'allow_signup')
+        is_disabled = allow_signup and allow_signup.lower() in ['false', '0', 'no', 'disable', 'disabled']
         
         if is_disabled:
             return jsonify({"message": "User registration is currently disabled by the administrator."}), 403
@@ -647,9 +524,6 @@ def register_user():
             db.rollback()
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
-    finally:
-        if db:
-            db.close()
 
 
 
@@ -664,7 +538,7 @@ def forgot_send_otp():
     if not email:
         return jsonify({"message": "Email is required."}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if email exists
         user = db.query(User).filter(User.email == email).first()
@@ -677,26 +551,24 @@ def forgot_send_otp():
 
         new_otp = OTP(email=email, otp_code=otp_code, expires_at=expires_at)
         db.add(new_otp)
-        db.commit()
 
-        # Send OTP Email
+        # Queue the OTP email; the outbox worker sends it (email_outbox.py)
         subject = "Your Password Reset OTP"
         body = f"""
         <h3>Your OTP Code is: <strong>{otp_code}</strong></h3>
         <p>This OTP expires in 10 minutes.</p>
         """
 
-        send_email(email, subject, body)
+        enqueue_email(db, email, subject, body)
+        db.commit()
 
         return jsonify({"message": "OTP sent successfully."}), 200
 
     except Exception as e:
         db.rollback()
-        print("Error in forgot_send_otp:", str(e))
+        logger.error("Error in forgot_send_otp: %s", e)
         return jsonify({"message": "Internal server error."}), 500
 
-    finally:
-        db.close()
 
 
 @app.route('/forgot_verify_otp', methods=['POST'])
@@ -709,7 +581,7 @@ def forgot_verify_otp():
     if not email or not otp_code:
         return jsonify({"message": "Email and OTP required."}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         otp_record = (
             db.query(OTP)
@@ -732,11 +604,9 @@ def forgot_verify_otp():
 
     except Exception as e:
         db.rollback()
-        print("Error in forgot_verify_otp:", str(e))
+        logger.error("Error in forgot_verify_otp: %s", e)
         return jsonify({"message": "Internal server error."}), 500
 
-    finally:
-        db.close()
 
 
 
@@ -752,7 +622,7 @@ def reset_password():
 
     hashed = generate_password_hash(new_password)
 
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.email == email).first()
 
@@ -766,20 +636,17 @@ def reset_password():
 
     except Exception as e:
         db.rollback()
-        print("Error in reset_password:", str(e))
+        logger.error("Error in reset_password: %s", e)
         return jsonify({"message": "Internal server error."}), 500
 
-    finally:
-        db.close()
 
 
 #this is the code of getting the user name for backend code 
 
 @app.route('/users/<int:user_id>', methods=['GET'])
 def get_user_details(user_id):
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         user = db.query(User).filter(User.id == user_id).first()
         
         if not user:
@@ -795,9 +662,6 @@ def get_user_details(user_id):
         }), 200
     except Exception as e:
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
-    finally:
-        if db:
-            db.close()
 
 
 
@@ -811,11 +675,11 @@ def admin_google_register():
     if not email:
         return jsonify({"message": "Email is required"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if signup is allowed
-        signup_setting = db.query(SystemSettings).filter(SystemSettings.setting_key == 'allow_signup').first()
-        if signup_setting and signup_setting.setting_value.lower() == 'false':
+        allow_signup = reference_cache.setting(db, 'allow_signup')
+        if allow_signup and allow_signup.lower() == 'false':
             return jsonify({"message": "User registration is currently disabled by the administrator."}), 403
 
         # Check if user exists (any role)
@@ -856,11 +720,9 @@ def admin_google_register():
 
     except Exception as e:
         db.rollback()
-        print(f"Error in admin_google_register: {str(e)}")
+        logger.error("Error in admin_google_register: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
-    finally:
-        db.close()
 
 
 @app.route("/employee_google_register", methods=["POST"])
@@ -873,11 +735,11 @@ def employee_google_register():
     if not email:
         return jsonify({"message": "Email is required"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if signup is allowed
-        signup_setting = db.query(SystemSettings).filter(SystemSettings.setting_key == 'allow_signup').first()
-        if signup_setting and signup_setting.setting_value.lower() == 'false':
+        allow_signup = reference_cache.setting(db, 'allow_signup')
+        if allow_signup and allow_signup.lower() == 'false':
             return jsonify({"message": "User registration is currently disabled by the administrator."}), 403
 
         # Check if employee already exists
@@ -913,8 +775,6 @@ def employee_google_register():
         db.rollback()
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
-    finally:
-        db.close()
 
 
 @app.route('/google_login', methods=['POST'])
@@ -951,7 +811,7 @@ def google_login():
     if not email or not email_verified:
         return jsonify({"message": "Google account email not verified"}), 400
 
-    db = SessionLocal()
+    db = g.db
 
     try:
         # Check if user exists
@@ -1003,8 +863,6 @@ def google_login():
         db.rollback()
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
-    finally:
-        db.close()
 
 
 
@@ -1018,9 +876,8 @@ def employee_login():
     if not identifier or not password:
         return jsonify({"message": "Username/Email and password are required."}), 400
 
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         user = db.query(User).filter(
             (User.username == identifier) | (User.email == identifier),
             User.role == 'employee'
@@ -1035,11 +892,8 @@ def employee_login():
         else:
             return jsonify({"message": "Invalid employee username/email or password."}), 401
     except Exception as e:
-        print(f"ERROR: employee_login - An unexpected error occurred: {str(e)}")
+        logger.error("employee_login - An unexpected error occurred: %s", e)
         return jsonify({"message": f"An unexpected error occurred: {str(e)}"}), 500
-    finally:
-        if db:
-            db.close()
 
 
 
@@ -1078,7 +932,7 @@ def admin_google_login():
     if not email or not email_verified:
         return jsonify({"message": "Google account email not verified"}), 400
 
-    db = SessionLocal()
+    db = g.db
 
     try:
         # Check if admin exists
@@ -1106,8 +960,6 @@ def admin_google_login():
         db.rollback()
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
-    finally:
-        db.close()
 
 
 
@@ -1147,7 +999,7 @@ def employee_google_login():
     if not email or not email_verified:
         return jsonify({"message": "Google account email not verified"}), 400
 
-    db = SessionLocal()
+    db = g.db
 
     try:
         # ⏳ Check if employee exists
@@ -1204,8 +1056,6 @@ def employee_google_login():
         db.rollback()
         return jsonify({"message": f"Server error: {str(e)}"}), 500
 
-    finally:
-        db.close()
 
 
 
@@ -1221,9 +1071,8 @@ def admin_login():
     if not identifier or not password:
         return jsonify({"message": "Username/Email and password are required."}), 400
 
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         user = db.query(User).filter(
             (User.username == identifier) | (User.email == identifier),
             User.role == 'admin'
@@ -1238,11 +1087,8 @@ def admin_login():
         else:
             return jsonify({"message": "Invalid admin username/email or password."}), 401
     except Exception as e:
-        print(f"ERROR: admin_login - An unexpected error occurred: {str(e)}")
+        logger.error("admin_login - An unexpected error occurred: %s", e)
         return jsonify({"message": f"An unexpected error occurred: {str(e)}"}), 500
-    finally:
-        if db:
-            db.close()
 
 # --- PROTECTED ROUTE (JWT PROTECTED) ---
 @app.route('/protected', methods=['GET'])
@@ -1260,62 +1106,18 @@ def get_dashboard_data():
     """Get employee dashboard data from database"""
     user_id = request.headers.get('X-User-ID')
     
-    db = SessionLocal()
+    db = g.db
     try:
-        current_year = datetime.now().year
         today = date.today()
-        
-        # Total leaves (sum of all leave balances for the year)
-        total_leaves_result = db.query(func.sum(LeaveBalance.balance)).filter(
-            LeaveBalance.user_id == user_id,
-            LeaveBalance.year == current_year
-        ).scalar()
-        total_leaves = float(total_leaves_result) if total_leaves_result else 0  # Default 0 if no balance set
-        
-        # Leaves taken (approved leave requests this year)
-        leaves_taken_result = db.query(func.sum(LeaveRequest.num_days)).filter(
-            LeaveRequest.user_id == user_id,
-            LeaveRequest.status == 'approved',
-            extract('year', LeaveRequest.start_date) == current_year
-        ).scalar()
-        leaves_taken = int(leaves_taken_result) if leaves_taken_result else 0
-        
-        # Absent days from attendance
-        absent_days = db.query(func.count(Attendance.id)).filter(
-            Attendance.user_id == user_id,
-            Attendance.status == 'Absent',
-            extract('year', Attendance.date) == current_year
-        ).scalar() or 0
-        
-        # Worked days
-        worked_days = db.query(func.count(Attendance.id)).filter(
-            Attendance.user_id == user_id,
-            Attendance.status.in_(['On Time', 'Late Login']),
-            extract('year', Attendance.date) == current_year
-        ).scalar() or 0
-        
-        # This week holiday
-        week_start = today - timedelta(days=today.weekday())
-        week_end = week_start + timedelta(days=6)
-        
-        this_week_holidays = db.query(func.count(Holiday.id)).filter(
-            Holiday.date >= week_start,
-            Holiday.date <= week_end
-        ).scalar() or 0
-        
-        dashboard_data = {
-            "total_leaves": total_leaves,
-            "leaves_taken": leaves_taken,
-            "absent_days": absent_days,
-            "worked_days": worked_days,
-            "completed_projects": 0,
-            "this_week_holiday": this_week_holidays
-        }
+
+        # Balance, leaves taken, absent/worked days and this week's holidays
+        # in a single query
+        dashboard_data = compute_employee_dashboard(db, user_id, today)
         
         return jsonify(dashboard_data), 200
         
     except Exception as e:
-        print(f"Dashboard error: {str(e)}")
+        logger.error("Dashboard error: %s", e)
         # Return default values on error
         return jsonify({
             "total_leaves": 15,
@@ -1325,18 +1127,16 @@ def get_dashboard_data():
             "completed_projects": 0,
             "this_week_holiday": 0
         }), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/attendance/monthly', methods=['GET'])
 def get_monthly_attendance():
     user_id = request.headers.get('X-User-ID')
-    print(f"DEBUG monthly attendance - user_id: {user_id}")
+    logger.debug("Monthly attendance for user %s", user_id)
     if not user_id:
         return jsonify([]), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         current_year = datetime.now().year
 
@@ -1371,16 +1171,14 @@ def get_monthly_attendance():
         return jsonify(data), 200
 
     except Exception as e:
-        print(f"Monthly attendance error: {str(e)}")
+        logger.error("Monthly attendance error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 #admin dasboard datas
 
 @app.route('/admin_dashboard', methods=['GET'])
 def get_admin_dashboard_data():
     """Get admin dashboard data from database"""
-    db = SessionLocal()
+    db = g.db
     try:
         today = date.today()
         
@@ -1414,10 +1212,7 @@ def get_admin_dashboard_data():
         week_start = today - timedelta(days=today.weekday())
         week_end = week_start + timedelta(days=6)
         
-        this_week_holidays = db.query(func.count(Holiday.id)).filter(
-            Holiday.date >= week_start,
-            Holiday.date <= week_end
-        ).scalar() or 0
+        this_week_holidays = len(holiday_calendar.holidays_between(db, week_start, week_end, source='custom'))
         
         return jsonify({
             "total_employees": total_employees,
@@ -1429,7 +1224,7 @@ def get_admin_dashboard_data():
         }), 200
         
     except Exception as e:
-        print(f"Admin dashboard error: {str(e)}")
+        logger.error("Admin dashboard error: %s", e)
         return jsonify({
             "total_employees": 0,
             "On_Time": 0,
@@ -1438,8 +1233,6 @@ def get_admin_dashboard_data():
             "Pending_Approval": 0,
             "This_Week_Hoilday": 0
         }), 200
-    finally:
-        db.close()
 
 
 @app.route('/check_email', methods=['POST'])
@@ -1447,16 +1240,12 @@ def check_email():
     """Check if email exists in database"""
     email = request.json.get("email")
 
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         user = db.query(User).filter(User.email == email).first()
         return jsonify({"exists": bool(user)})
     except Exception as e:
         return jsonify({"exists": False, "error": str(e)}), 500
-    finally:
-        if db:
-            db.close()
 
 
 @app.route('/update_password', methods=['POST'])
@@ -1466,9 +1255,8 @@ def update_password():
     email = data["email"]
     new_password = generate_password_hash(data["newPassword"])
 
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         user = db.query(User).filter(User.email == email).first()
 
         if not user:
@@ -1481,9 +1269,6 @@ def update_password():
         if db:
             db.rollback()
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
-    finally:
-        if db:
-            db.close()
 
 
 # =============================================================================
@@ -1504,7 +1289,8 @@ def create_leave_request():
     reason = data.get('reason')
 
     # Debug logging
-    print(f"Leave request data: user_id={user_id}, leave_type_id={leave_type_id}, start_date={start_date}, end_date={end_date}, num_days={num_days}")
+    logger.debug("Leave request data: user_id=%s, leave_type_id=%s, start_date=%s, end_date=%s, num_days=%s",
+                 user_id, leave_type_id, start_date, end_date, num_days)
 
     # Validation
     missing_fields = []
@@ -1522,7 +1308,7 @@ def create_leave_request():
     if missing_fields:
         return jsonify({"message": f"Missing required fields: {', '.join(missing_fields)}"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         # Convert types
         user_id = int(user_id)
@@ -1530,13 +1316,13 @@ def create_leave_request():
         num_days = float(num_days)
 
         # Check leave type
-        leave_type = db.query(LeaveType).filter(LeaveType.id == leave_type_id).first()
+        leave_type = reference_cache.leave_type(db, leave_type_id)
         if not leave_type:
-            available = db.query(LeaveType).all()
+            available = reference_cache.leave_types(db)
             if not available:
                 return jsonify({"message": "No leave types configured. Please contact admin."}), 400
             else:
-                type_names = ", ".join([f"{lt.id}: {lt.name}" for lt in available])
+                type_names = ", ".join([f"{lt['id']}: {lt['name']}" for lt in available])
                 return jsonify({"message": f"Invalid leave type ID. Available: {type_names}"}), 400
 
         # Date parsing
@@ -1546,17 +1332,13 @@ def create_leave_request():
         if s_date < datetime.today().date():
             return jsonify({"message": "Cannot apply leave for past dates"}), 400
 
-        day_diff = (e_date - s_date).days + 1
-        if day_diff < 0:
+        if e_date < s_date:
             return jsonify({"message": "End date cannot be before start date"}), 400
+        day_diff = (e_date - s_date).days + 1
 
-        # 🚫 OVERLAP CHECK (FIXED - NO lower())
-        existing_leave = db.query(LeaveRequest).filter(
-            LeaveRequest.user_id == user_id,
-            LeaveRequest.status.in_(["pending", "approved"]),  # ✅ FIXED
-            LeaveRequest.start_date <= e_date,
-            LeaveRequest.end_date >= s_date
-        ).first()
+        # 🚫 OVERLAP CHECK (GiST probe on the period range; the exclusion
+        # constraint still rejects a concurrent submission that slips past)
+        existing_leave = find_overlapping_leave(db, user_id, s_date, e_date)
 
         if existing_leave:
             return jsonify({
@@ -1575,25 +1357,18 @@ def create_leave_request():
         if day_type_raw == 'half_day':
             calculated_num_days = day_diff * 0.5
 
-        # ✅ LEAVE BALANCE CHECK (FIXED)
-        used_result = db.query(func.sum(LeaveRequest.num_days)).filter(
-            LeaveRequest.user_id == user_id,
-            LeaveRequest.leave_type_id == leave_type_id,
-            LeaveRequest.status.in_(["pending", "approved"])  # ✅ FIXED
-        ).scalar()
-
-        used = float(used_result) if used_result else 0
-        total = float(leave_type.max_days_per_year)
-        remaining = round(total - used, 2)
+        # ✅ LEAVE BALANCE CHECK (ledger running balance, row locked until commit)
+        balance = leave_ledger.lock_balance(db, user_id, leave_type_id, s_date.year)
+        remaining = round(leave_ledger.available_days(balance), 2)
 
         if remaining <= 0:
             return jsonify({
-                "message": f"No {leave_type.name} balance available"
+                "message": f"No {leave_type['name']} balance available"
             }), 400
 
         if calculated_num_days > remaining:
             return jsonify({
-                "message": f"Only {remaining} day(s) available for {leave_type.name}"
+                "message": f"Only {remaining} day(s) available for {leave_type['name']}"
             }), 400
 
         # Create leave
@@ -1609,6 +1384,7 @@ def create_leave_request():
         )
 
         db.add(new_request)
+        leave_ledger.record_request_created(db, new_request, balance)
         db.commit()
         db.refresh(new_request)
 
@@ -1619,12 +1395,16 @@ def create_leave_request():
 
     except ValueError as e:
         return jsonify({"message": f"Invalid data format: {str(e)}"}), 400
+    except IntegrityError as e:
+        db.rollback()
+        if is_overlap_violation(e):
+            return jsonify({"message": "You already applied leave for some of these dates"}), 400
+        logger.error("Create leave request error: %s", e)
+        return jsonify({"message": f"Error: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"Create leave request error: {str(e)}")
+        logger.error("Create leave request error: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 @app.route('/leave_requests/<int:request_id>', methods=['PUT'])
 def update_leave_request(request_id):
@@ -1632,7 +1412,7 @@ def update_leave_request(request_id):
 
     data = request.get_json()
 
-    db = SessionLocal()
+    db = g.db
     try:
         leave_request = db.query(LeaveRequest).filter(
             LeaveRequest.id == request_id
@@ -1672,19 +1452,18 @@ def update_leave_request(request_id):
             calculated_num_days = day_diff * 0.5
 
         # 🚫 OVERLAP CHECK (exclude current request)
-        existing_leave = db.query(LeaveRequest).filter(
-            LeaveRequest.user_id == leave_request.user_id,
-            LeaveRequest.id != request_id,  # exclude current
-            LeaveRequest.status.in_(["pending", "approved"]),
-            LeaveRequest.start_date <= e_date,
-            LeaveRequest.end_date >= s_date
-        ).first()
+        existing_leave = find_overlapping_leave(
+            db, leave_request.user_id, s_date, e_date, exclude_id=request_id
+        )
 
         if existing_leave:
             return jsonify({
                 "message": f"Overlapping leave exists from {existing_leave.start_date} to {existing_leave.end_date}"
             }), 400
 
+        # Release the old reservation before the request changes
+        leave_ledger.record_request_withdrawn(db, leave_request, event='request_updated')
+
         # ✅ UPDATE VALUES
         leave_request.leave_type_id = leave_type_id
         leave_request.start_date = s_date
@@ -1693,26 +1472,31 @@ def update_leave_request(request_id):
         leave_request.day_type = day_type_raw
         leave_request.reason = reason
 
+        leave_ledger.record_request_created(db, leave_request, event='request_updated')
         db.commit()
 
         return jsonify({
             "message": "Leave request updated successfully"
         }), 200
 
+    except IntegrityError as e:
+        db.rollback()
+        if is_overlap_violation(e):
+            return jsonify({"message": "Overlapping leave exists for some of these dates"}), 400
+        logger.error("Update leave error: %s", e)
+        return jsonify({"message": str(e)}), 500
     except Exception as e:
         db.rollback()
-        print("Update leave error:", str(e))
+        logger.error("Update leave error: %s", e)
         return jsonify({"message": str(e)}), 500
 
-    finally:
-        db.close()
 
 #for delete the request
 @app.route('/leave_requests/<int:request_id>', methods=['DELETE'])
 def delete_leave_request(request_id):
     """Delete a leave request (only if pending)"""
 
-    db = SessionLocal()
+    db = g.db
     try:
         leave_request = db.query(LeaveRequest).filter(
             LeaveRequest.id == request_id
@@ -1725,6 +1509,7 @@ def delete_leave_request(request_id):
         if leave_request.status != "pending":
             return jsonify({"message": "Only pending requests can be deleted"}), 400
 
+        leave_ledger.record_request_withdrawn(db, leave_request, event='request_deleted')
         db.delete(leave_request)
         db.commit()
 
@@ -1732,11 +1517,9 @@ def delete_leave_request(request_id):
 
     except Exception as e:
         db.rollback()
-        print("Delete leave error:", str(e))
+        logger.error("Delete leave error: %s", e)
         return jsonify({"message": str(e)}), 500
 
-    finally:
-        db.close()
 
 # Create Leave Type (POST) - Admin only
 @app.route('/leave_types', methods=['POST'])
@@ -1751,7 +1534,7 @@ def create_leave_type():
     if not name or not max_days:
         return jsonify({"message": "Name and max_days_per_year are required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if leave type already exists
         existing = db.query(LeaveType).filter(LeaveType.name == name).first()
@@ -1775,36 +1558,32 @@ def create_leave_type():
         
     except Exception as e:
         db.rollback()
-        print(f"Create leave type error: {str(e)}")
+        logger.error("Create leave type error: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # Get all leave types (for dropdown in apply leave form)
 @app.route('/api/leave_types', methods=['GET'])
+@conditional_get('leave_types')
 def get_leave_types():
     """Get all leave types"""
-    db = SessionLocal()
+    db = g.db
     try:
-        leave_types = db.query(LeaveType).all()
-        
         result = []
-        for lt in leave_types:
+        for lt in reference_cache.leave_types(db):
             result.append({
-                "id": lt.id,
-                "name": lt.name,
-                "description": lt.description or "",
-                "max_days_per_year": lt.max_days_per_year
+                "id": lt["id"],
+                "name": lt["name"],
+                "description": lt["description"] or "",
+                "max_days_per_year": lt["max_days_per_year"]
             })
         
         return jsonify(result), 200
         
     except Exception as e:
-        print(f"Get leave types error: {str(e)}")
+        logger.error("Get leave types error: %s", e)
+        skip_etag()
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 # =============================================================================
@@ -1822,7 +1601,7 @@ def approve_leave_request(request_id):
     approver_id = request.headers.get('X-User-ID')  # From header (new)
     
     # Debug logging
-    print(f"Approve request {request_id}: approver_id from header={approver_id}, from body={approved_by}")
+    logger.debug("Approve request %s: approver_id from header=%s, from body=%s", request_id, approver_id, approved_by)
     
     # Use header if available, fallback to body
     final_approver_id = approver_id if approver_id else approved_by
@@ -1830,16 +1609,18 @@ def approve_leave_request(request_id):
     if not final_approver_id:
         return jsonify({"message": "Approver ID is required (X-User-ID header or approved_by in body)"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
+        # Locked until commit: a concurrent approve/reject of the same request
+        # waits here and then sees the new status instead of also booking it
         leave_request = db.query(LeaveRequest).filter(
             LeaveRequest.id == request_id
-        ).first()
+        ).with_for_update().first()
 
         if not leave_request:
             return jsonify({"message": "Leave request not found"}), 404
         
-        print(f"Leave request status: {leave_request.status}, approver_type: {leave_request.approver_type}")
+        logger.debug("Leave request status: %s, approver_type: %s", leave_request.status, leave_request.approver_type)
         
         if leave_request.status != 'pending':
             return jsonify({"message": f"Request is already {leave_request.status}"}), 400
@@ -1859,6 +1640,8 @@ def approve_leave_request(request_id):
                     return jsonify({"message": "Only admins can approve employee leave requests"}), 403
         # --- END AUTHORIZATION CHECK ---
 
+        leave_ledger.record_request_approved(db, leave_request)
+
         leave_request.status = 'approved'
         leave_request.approved_by = int(final_approver_id) if final_approver_id else None
         leave_request.approval_date = datetime.utcnow()
@@ -1879,8 +1662,7 @@ def approve_leave_request(request_id):
             if leave_request.day_type == 'half_day':
                 deduct_days = actual_days * 0.5
             
-            balance.used = (balance.used or 0) + deduct_days
-            balance.balance = balance.balance - deduct_days
+            balance.balance = balance.balance - Decimal(str(deduct_days))
 
         # Create Notification
         new_notif = Notification(
@@ -1892,16 +1674,14 @@ def approve_leave_request(request_id):
         )
         db.add(new_notif)
         db.commit()
-        print(f"DEBUG: Created leave approval notification for user {leave_request.user_id}")
+        logger.debug("Created leave approval notification for user %s", leave_request.user_id)
 
         return jsonify({"message": "Leave request approved successfully"}), 200
 
     except Exception as e:
         db.rollback()
-        print(f"Approve leave error: {str(e)}")
+        logger.error("Approve leave error: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 
@@ -1915,7 +1695,7 @@ def reject_leave_request(request_id):
     approver_id = request.headers.get('X-User-ID')  # From header (new)
     
     # Debug logging
-    print(f"Reject request {request_id}: approver_id from header={approver_id}, from body={approved_by}")
+    logger.debug("Reject request %s: approver_id from header=%s, from body=%s", request_id, approver_id, approved_by)
     
     # Use header if available, fallback to body
     final_approver_id = approver_id if approver_id else approved_by
@@ -1923,16 +1703,18 @@ def reject_leave_request(request_id):
     if not final_approver_id:
         return jsonify({"message": "Approver ID is required (X-User-ID header or approved_by in body)"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
+        # Locked until commit: a concurrent approve/reject of the same request
+        # waits here and then sees the new status instead of also booking it
         leave_request = db.query(LeaveRequest).filter(
             LeaveRequest.id == request_id
-        ).first()
+        ).with_for_update().first()
 
         if not leave_request:
             return jsonify({"message": "Leave request not found"}), 404
         
-        print(f"Leave request status: {leave_request.status}, approver_type: {leave_request.approver_type}")
+        logger.debug("Leave request status: %s, approver_type: %s", leave_request.status, leave_request.approver_type)
         
         if leave_request.status != 'pending':
             return jsonify({"message": f"Request is already {leave_request.status}"}), 400
@@ -1952,6 +1734,8 @@ def reject_leave_request(request_id):
                     return jsonify({"message": "Only admins can reject employee leave requests"}), 403
         # --- END AUTHORIZATION CHECK ---
 
+        leave_ledger.record_request_rejected(db, leave_request)
+
         leave_request.status = 'rejected'
         leave_request.rejection_reason = reason
         leave_request.approved_by = int(final_approver_id) if final_approver_id else None
@@ -1966,16 +1750,14 @@ def reject_leave_request(request_id):
         )
         db.add(new_notif)
         db.commit()
-        print(f"DEBUG: Created leave rejection notification for user {leave_request.user_id}")
+        logger.debug("Created leave rejection notification for user %s", leave_request.user_id)
 
         return jsonify({"message": "Leave request rejected"}), 200
 
     except Exception as e:
         db.rollback()
-        print(f"Reject leave error: {str(e)}")
+        logger.error("Reject leave error: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # =============================================================================
@@ -1987,7 +1769,7 @@ def get_leave_balance():
     """Get user's leave balance for all leave types"""
     user_id_str = request.headers.get('X-User-ID') or request.args.get('user_id')
     
-    db = SessionLocal()
+    db = g.db
     try:
         if not user_id_str:
             return jsonify([]), 200
@@ -1995,24 +1777,18 @@ def get_leave_balance():
         # Convert to integer for proper database comparison
         user_id = int(user_id_str)
             
-        leave_types = db.query(LeaveType).all()
-        
+        # One running-balance row per leave type for the current year
+        year_balances = leave_ledger.get_year_balances(db, user_id, datetime.now().year)
+
         balances = []
-        for lt in leave_types:
-            # Calculate used days from approved leave requests (all time for this leave type)
-            used_result = db.query(func.sum(LeaveRequest.num_days)).filter(
-                LeaveRequest.user_id == user_id,
-                LeaveRequest.leave_type_id == lt.id,
-                LeaveRequest.status == 'approved'
-            ).scalar()
-            
-            used = float(used_result) if used_result else 0
-            total = float(lt.max_days_per_year)
+        for lt in year_balances:
+            used = lt["used"]
+            total = lt["allocated"]
             remaining = total - used
             
             balances.append({
-                "id": lt.id,
-                "name": lt.name,
+                "id": lt["leave_type_id"],
+                "name": lt["name"],
                 "used": used,
                 "total": total,
                 "remaining": remaining
@@ -2021,10 +1797,8 @@ def get_leave_balance():
         return jsonify(balances), 200
         
     except Exception as e:
-        print(f"Leave balance error: {str(e)}")
+        logger.error("Leave balance error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 # =============================================================================
@@ -2044,7 +1818,7 @@ def get_attendance_stats():
             "on_time_logins": 0
         }), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         now = datetime.now()
         start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -2091,8 +1865,7 @@ def get_attendance_stats():
         }), 200
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Monthly attendance stats error: %s", e)
         return jsonify({
             "error": str(e),
             "working_days": 0,
@@ -2101,8 +1874,6 @@ def get_attendance_stats():
             "on_time_logins": 0
         }), 500
 
-    finally:
-        db.close()
 
 @app.route('/api/leave_notification', methods=['GET'])
 def get_leave_notification():
@@ -2111,7 +1882,7 @@ def get_leave_notification():
     if not user_id:
         return jsonify({"notification": None}), 200
 
-    db = SessionLocal()
+    db = g.db
     try:
         # Get the most recent approved or rejected leave request
         leave = db.query(LeaveRequest).filter(
@@ -2131,15 +1902,13 @@ def get_leave_notification():
         }), 200
 
     except Exception as e:
-        print(f"Leave notification error: {str(e)}")
+        logger.error("Leave notification error: %s", e)
         return jsonify({"notification": None}), 200
-    finally:
-        db.close()
 
 @app.route('/api/admin/pending_counts', methods=['GET'])
 def get_admin_pending_counts():
     """Get pending approvals and pending leave requests count for admin dashboard notification"""
-    db = SessionLocal()
+    db = g.db
     try:
         # Pending leave approvals (regularization requests pending)
         pending_approvals = db.query(func.count(Regularization.id)).filter(
@@ -2157,13 +1926,56 @@ def get_admin_pending_counts():
         }), 200
 
     except Exception as e:
-        print(f"Pending counts error: {str(e)}")
+        logger.error("Pending counts error: %s", e)
         return jsonify({
             "pending_approvals": 0,
             "pending_leave_requests": 0
         }), 200
-    finally:
-        db.close()
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events replacing the notification/pending-count polling (see event_stream.py).
+    EventSource cannot set headers: the access token may be passed as ?access_token=.
+    """
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.split(' ', 1)[1] if auth_header.startswith('Bearer ') else request.args.get('access_token')
+    payload = verify_token(token, expected_type="access") if token else None
+    if not payload:
+        return jsonify({"message": "Invalid or expired token"}), 401
+
+    subscriber = event_stream.hub.subscribe(payload["user_id"], payload["role"])
+    if subscriber is None:
+        response = jsonify({"message": "Too many open streams, keep polling"})
+        response.headers['Retry-After'] = str(int(event_stream.MAX_STREAM_SECONDS))
+        return response, 503
+    event_stream.listener.start()
+
+    initial_events = [("hello", {"user_id": subscriber.user_id, "heartbeat": event_stream.HEARTBEAT_SECONDS})]
+    if subscriber.role == 'admin':
+        # Subscribed first: deltas published from here on apply on top of this snapshot
+        try:
+            with session_scope() as db:
+                initial_events.append(("pending_counts_snapshot", {
+                    "pending_approvals": db.query(func.count(Regularization.id)).filter(
+                        Regularization.status == 'pending').scalar() or 0,
+                    "pending_leave_requests": db.query(func.count(LeaveRequest.id)).filter(
+                        LeaveRequest.status == 'pending').scalar() or 0,
+                }))
+        except Exception as e:
+            event_stream.hub.unsubscribe(subscriber)
+            logger.error("Stream snapshot error: %s", e)
+            return jsonify({"message": "Could not open stream"}), 500
+
+    # Close no later than the token expires; the client reconnects with a fresh one
+    seconds_left = payload["exp"] - time.time() if payload.get("exp") else event_stream.MAX_STREAM_SECONDS
+    deadline = time.monotonic() + max(1, min(event_stream.MAX_STREAM_SECONDS, seconds_left))
+
+    return Response(
+        event_stream.event_stream(subscriber, initial_events, deadline),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 @app.route('/api/leave_stats', methods=['GET'])
 def get_leave_stats():
@@ -2171,102 +1983,32 @@ def get_leave_stats():
     Optional query param: user_id (or set X-User-ID header)."""
     user_id = request.headers.get('X-User-ID') or request.args.get('user_id')
 
-    db = SessionLocal()
+    db = g.db
     try:
         now = datetime.now().date()
 
-        # Months: last 5 months including current
-        months = []
-        for offset in range(4, -1, -1):
-            # compute year/month for offset months ago
-            m = now.month - offset
-            y = now.year
-            while m <= 0:
-                m += 12
-                y -= 1
-
-            start = date(y, m, 1)
-            if m == 12:
-                next_month = date(y + 1, 1, 1)
-            else:
-                next_month = date(y, m + 1, 1)
-            end = next_month - timedelta(days=1)
-
-            q = db.query(func.coalesce(func.sum(LeaveRequest.num_days), 0)).filter(
-                LeaveRequest.status == 'approved',
-                LeaveRequest.start_date >= start,
-                LeaveRequest.start_date <= end,
-            )
-            if user_id:
-                try:
-                    q = q.filter(LeaveRequest.user_id == int(user_id))
-                except Exception:
-                    q = q.filter(LeaveRequest.user_id == user_id)
-
-            total_days = float(q.scalar() or 0)
-            months.append({"month": start.strftime('%b'), "value": round(total_days, 2)})
-
-        # Weeks: split current month into sequential weeks (W1..W5)
-        start_of_month = now.replace(day=1)
-        if start_of_month.month == 12:
-            first_next = date(start_of_month.year + 1, 1, 1)
+        if user_id:
+            try:
+                user_id = int(user_id)
+            except (ValueError, TypeError):
+                pass
         else:
-            first_next = date(start_of_month.year, start_of_month.month + 1, 1)
-        month_end = first_next - timedelta(days=1)
-
-        weeks = []
-        ws = start_of_month
-        idx = 1
-        while ws <= month_end and idx <= 5:
-            we = min(ws + timedelta(days=6), month_end)
-            q = db.query(func.coalesce(func.sum(LeaveRequest.num_days), 0)).filter(
-                LeaveRequest.status == 'approved',
-                LeaveRequest.start_date >= ws,
-                LeaveRequest.start_date <= we,
-            )
-            if user_id:
-                try:
-                    q = q.filter(LeaveRequest.user_id == int(user_id))
-                except Exception:
-                    q = q.filter(LeaveRequest.user_id == user_id)
-
-            total_days = float(q.scalar() or 0)
-            weeks.append({"label": f"W{idx}", "value": round(total_days, 2)})
-            ws = we + timedelta(days=1)
-            idx += 1
-
-        # Days: current week Mon-Fri
-        wd = now.weekday()
-        monday = now - timedelta(days=wd)
-        days = []
-        for i in range(5):
-            d = monday + timedelta(days=i)
-            q = db.query(func.coalesce(func.sum(LeaveRequest.num_days), 0)).filter(
-                LeaveRequest.status == 'approved',
-                LeaveRequest.start_date == d,
-            )
-            if user_id:
-                try:
-                    q = q.filter(LeaveRequest.user_id == int(user_id))
-                except Exception:
-                    q = q.filter(LeaveRequest.user_id == user_id)
+            user_id = None
 
-            total_days = float(q.scalar() or 0)
-            days.append({"label": d.strftime('%a'), "value": round(total_days, 2)})
-
-        return jsonify({"months": months, "weeks": weeks, "days": days}), 200
+        # Months, weeks of the current month and weekdays in a single query.
+        # Leaves spanning several buckets are split across them.
+        stats = compute_leave_stats(db, now, user_id)
+        return jsonify(stats), 200
 
     except Exception as e:
-        print(f"Leave stats error: {str(e)}")
+        logger.error("Leave stats error: %s", e)
         return jsonify({"months": [], "weeks": [], "days": []}), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/who_is_on_leave', methods=['GET'])
 def get_who_is_on_leave():
     """Get all approved leave requests for admin view"""
-    db = SessionLocal()
+    db = g.db
     try:
         # Get all approved leave requests with user and leave type info
         requests_data = db.query(LeaveRequest, LeaveType, User).join(
@@ -2301,17 +2043,15 @@ def get_who_is_on_leave():
         return jsonify(leave_list), 200
         
     except Exception as e:
-        print(f"Who is on leave error: {str(e)}")
+        logger.error("Who is on leave error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/myleave', methods=['GET'])
 def get_leave_data():
     user_id = request.headers.get('X-User-ID')
     
-    db = SessionLocal()
+    db = g.db
     try:
         requests_data = db.query(LeaveRequest, LeaveType).join(
             LeaveType, LeaveRequest.leave_type_id == LeaveType.id
@@ -2347,10 +2087,8 @@ def get_leave_data():
         return jsonify(leave_data), 200
         
     except Exception as e:
-        print(f"Leave data error: {str(e)}")
+        logger.error("Leave data error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/myregularization', methods=['GET'])
@@ -2361,7 +2099,7 @@ def get_regularization_data():
     if not user_id:
         return jsonify({"message": "User ID header required"}), 400
 
-    db = SessionLocal()
+    db = g.db
     try:
         requests_data = db.query(Regularization).filter(
             Regularization.user_id == int(user_id)
@@ -2382,10 +2120,8 @@ def get_regularization_data():
         return jsonify(regularization_data), 200
         
     except Exception as e:
-        print(f"Regularization error: {str(e)}")
+        logger.error("Regularization error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 @app.route('/api/regularization', methods=['POST'])
 def create_regularization():
@@ -2411,7 +2147,7 @@ def create_regularization():
         return jsonify({"message": "Attendance type is required"}), 400
 
     # ---------- Insert ----------
-    db = SessionLocal()
+    db = g.db
     try:
         new_regularization = Regularization(
             user_id=int(user_id),
@@ -2433,18 +2169,16 @@ def create_regularization():
 
     except Exception as e:
         db.rollback()
-        print("Create Regularization Error:", str(e))
+        logger.error("Create Regularization Error: %s", e)
         return jsonify({"message": "Failed to submit regularization"}), 500
 
-    finally:
-        db.close()
 
 @app.route('/api/regularization/<int:reg_id>', methods=['PUT'])
 def update_regularization(reg_id):
     user_id = request.headers.get('X-User-ID')
     data = request.get_json() or {}
 
-    db = SessionLocal()
+    db = g.db
     try:
         reg = db.query(Regularization).filter_by(
             id=reg_id,
@@ -2467,16 +2201,14 @@ def update_regularization(reg_id):
 
     except Exception as e:
         db.rollback()
-        print(e)
+        logger.error("Update regularization error: %s", e)
         return jsonify({"message": "Update failed"}), 500
-    finally:
-        db.close()
 
 @app.route('/api/regularization/<int:reg_id>', methods=['DELETE'])
 def delete_regularization(reg_id):
     user_id = request.headers.get('X-User-ID')
 
-    db = SessionLocal()
+    db = g.db
     try:
         reg = db.query(Regularization).filter_by(
             id=reg_id,
@@ -2493,157 +2225,28 @@ def delete_regularization(reg_id):
 
     except Exception as e:
         db.rollback()
-        print(e)
+        logger.error("Delete regularization error: %s", e)
         return jsonify({"message": "Delete failed"}), 500
-    finally:
-        db.close()
 
 
 
 
 @app.route('/api/myholidays', methods=['GET'])
+@conditional_get('holidays', variant=lambda: request.args.get('year') or str(datetime.now().year))
 def get_holidays():
     """Get holidays from database merged with Indian national/government holidays"""
-    db = SessionLocal()
+    db = g.db
     try:
         year_param = request.args.get('year')
         current_year = int(year_param) if year_param else datetime.now().year
 
-        # ── 1. Comprehensive Indian Government / National Observance Days ──
-        #    (Gazetted + widely observed days for the current year)
-        NATIONAL_HOLIDAYS = [
-            # JANUARY
-            {"date": f"{current_year}-01-01",  "title": "New Year's Day",      "type": "National"},
-            {"date": f"{current_year}-01-14",  "title": "Pongal / Makar Sankranti", "type": "National"},
-            {"date": f"{current_year}-01-15",  "title": "Army Day",            "type": "Observance"},
-            {"date": f"{current_year}-01-23",  "title": "Netaji Subhas Chandra Bose Jayanti", "type": "National"},
-            {"date": f"{current_year}-01-24",  "title": "National Girl Child Day", "type": "Observance"},
-            {"date": f"{current_year}-01-25",  "title": "National Voters' Day","type": "Observance"},
-            {"date": f"{current_year}-01-26",  "title": "Republic Day",        "type": "National"},
-            {"date": f"{current_year}-01-30",  "title": "Martyrs' Day (Mahatma Gandhi)", "type": "National"},
-            # FEBRUARY
-            {"date": f"{current_year}-02-04",  "title": "World Cancer Day",    "type": "Observance"},
-            {"date": f"{current_year}-02-14",  "title": "Valentine's Day",     "type": "Observance"},
-            {"date": f"{current_year}-02-19",  "title": "Chhatrapati Shivaji Maharaj Jayanti", "type": "National"},
-            {"date": f"{current_year}-02-20",  "title": "Arunachal Pradesh Statehood Day", "type": "Observance"},
-            {"date": f"{current_year}-02-28",  "title": "National Science Day", "type": "Observance"},
-            # MARCH
-            {"date": f"{current_year}-03-01",  "title": "Holi",               "type": "National"},
-            {"date": f"{current_year}-03-04",  "title": "Maha Shivaratri",     "type": "National"},
-            {"date": f"{current_year}-03-08",  "title": "International Women's Day", "type": "Observance"},
-            {"date": f"{current_year}-03-15",  "title": "World Consumer Rights Day", "type": "Observance"},
-            {"date": f"{current_year}-03-22",  "title": "Bihar Diwas / World Water Day", "type": "Observance"},
-            {"date": f"{current_year}-03-30",  "title": "Ram Navami",          "type": "National"},
-            # APRIL
-            {"date": f"{current_year}-04-03",  "title": "Good Friday",         "type": "National"},
-            {"date": f"{current_year}-04-05",  "title": "Easter Saturday",     "type": "Observance"},
-            {"date": f"{current_year}-04-06",  "title": "Mahavir Jayanti",     "type": "National"},
-            {"date": f"{current_year}-04-07",  "title": "World Health Day",    "type": "Observance"},
-            {"date": f"{current_year}-04-14",  "title": "Dr. B.R. Ambedkar Jayanti / Tamil New Year", "type": "National"},
-            {"date": f"{current_year}-04-22",  "title": "Earth Day",           "type": "Observance"},
-            # MAY
-            {"date": f"{current_year}-05-01",  "title": "International Labour Day / Maharashtra Day", "type": "National"},
-            {"date": f"{current_year}-05-07",  "title": "Rabindranath Tagore Jayanti", "type": "National"},
-            {"date": f"{current_year}-05-11",  "title": "National Technology Day", "type": "Observance"},
-            {"date": f"{current_year}-05-12",  "title": "International Nurses Day", "type": "Observance"},
-            {"date": f"{current_year}-05-31",  "title": "World No Tobacco Day", "type": "Observance"},
-            # JUNE
-            {"date": f"{current_year}-06-01",  "title": "World Milk Day",      "type": "Observance"},
-            {"date": f"{current_year}-06-05",  "title": "World Environment Day", "type": "Observance"},
-            {"date": f"{current_year}-06-21",  "title": "International Yoga Day", "type": "National"},
-            {"date": f"{current_year}-06-23",  "title": "Rath Yatra",          "type": "National"},
-            # JULY
-            {"date": f"{current_year}-07-01",  "title": "National Doctor's Day / Chartered Accountants Day", "type": "Observance"},
-            {"date": f"{current_year}-07-11",  "title": "World Population Day", "type": "Observance"},
-            {"date": f"{current_year}-07-18",  "title": "Nelson Mandela International Day", "type": "Observance"},
-            {"date": f"{current_year}-07-26",  "title": "Kargil Vijay Diwas",  "type": "National"},
-            # AUGUST
-            {"date": f"{current_year}-08-09",  "title": "Quit India Movement Day / Nagasaki Day", "type": "National"},
-            {"date": f"{current_year}-08-12",  "title": "International Youth Day", "type": "Observance"},
-            {"date": f"{current_year}-08-15",  "title": "Independence Day",    "type": "National"},
-            {"date": f"{current_year}-08-19",  "title": "Janmashtami",         "type": "National"},
-            {"date": f"{current_year}-08-29",  "title": "National Sports Day (Dhyan Chand Jayanti)", "type": "National"},
-            # SEPTEMBER
-            {"date": f"{current_year}-09-02",  "title": "Onam",               "type": "National"},
-            {"date": f"{current_year}-09-05",  "title": "Teachers' Day (Dr. Radhakrishnan Jayanti)", "type": "National"},
-            {"date": f"{current_year}-09-08",  "title": "International Literacy Day", "type": "Observance"},
-            {"date": f"{current_year}-09-14",  "title": "Hindi Diwas",         "type": "National"},
-            {"date": f"{current_year}-09-16",  "title": "Ganesh Chaturthi",    "type": "National"},
-            {"date": f"{current_year}-09-25",  "title": "Antyodaya Diwas (Deendayal Upadhyaya Jayanti)", "type": "Observance"},
-            # OCTOBER
-            {"date": f"{current_year}-10-02",  "title": "Gandhi Jayanti / Lal Bahadur Shastri Jayanti", "type": "National"},
-            {"date": f"{current_year}-10-08",  "title": "Indian Air Force Day", "type": "National"},
-            {"date": f"{current_year}-10-11",  "title": "Navratri Begins / Durga Puja",     "type": "National"},
-            {"date": f"{current_year}-10-16",  "title": "World Food Day",      "type": "Observance"},
-            {"date": f"{current_year}-10-19",  "title": "Ayudha Puja / Maha Navami", "type": "National"},
-            {"date": f"{current_year}-10-20",  "title": "Dussehra / Vijayadasami / Saraswati Puja", "type": "National"},
-            {"date": f"{current_year}-10-31",  "title": "Sardar Vallabhbhai Patel Jayanti / National Unity Day", "type": "National"},
-            # NOVEMBER
-            {"date": f"{current_year}-11-08",  "title": "Diwali",             "type": "National"},
-            {"date": f"{current_year}-11-09",  "title": "Bhai Dooj",          "type": "National"},
-            {"date": f"{current_year}-11-14",  "title": "Children's Day (Nehru Jayanti)", "type": "National"},
-            {"date": f"{current_year}-11-17",  "title": "Guru Nanak Jayanti", "type": "National"},
-            {"date": f"{current_year}-11-19",  "title": "National Integration Day", "type": "Observance"},
-            {"date": f"{current_year}-11-26",  "title": "Constitution Day (Samvidhan Diwas)", "type": "National"},
-            # DECEMBER
-            {"date": f"{current_year}-12-01",  "title": "World AIDS Day",     "type": "Observance"},
-            {"date": f"{current_year}-12-04",  "title": "Indian Navy Day",    "type": "National"},
-            {"date": f"{current_year}-12-10",  "title": "Human Rights Day",   "type": "Observance"},
-            {"date": f"{current_year}-12-16",  "title": "Vijay Diwas (1971 War Victory)", "type": "National"},
-            {"date": f"{current_year}-12-19",  "title": "Goa Liberation Day", "type": "Observance"},
-            {"date": f"{current_year}-12-22",  "title": "National Mathematics Day (Ramanujan Jayanti)", "type": "Observance"},
-            {"date": f"{current_year}-12-23",  "title": "Kisan Diwas (National Farmers Day)", "type": "National"},
-            {"date": f"{current_year}-12-25",  "title": "Christmas Day",      "type": "National"},
-        ]
-
-        # Build a date→national_holiday map
-        national_map = {}
-        for idx, nh in enumerate(NATIONAL_HOLIDAYS):
-            try:
-                d = datetime.strptime(nh["date"], "%Y-%m-%d").date()
-                national_map[nh["date"]] = {
-                    "id": f"nat-{idx}",
-                    "date": d.strftime('%d %B, %A'),
-                    "full_date": nh["date"],
-                    "title": nh["title"],
-                    "type": nh["type"],
-                    "source": "national"
-                }
-            except Exception:
-                pass
-
-        # ── 2. Custom holidays from database ──
-        db_holidays = db.query(Holiday).filter(
-            Holiday.year == current_year
-        ).order_by(Holiday.date).all()
-
-        db_map = {}
-        for h in db_holidays:
-            date_key = h.date.isoformat()
-            holiday_type = "Restricted" if h.is_optional else "Mandatory"
-            db_map[date_key] = {
-                "id": h.id,
-                "date": h.date.strftime('%d %B, %A'),
-                "full_date": date_key,
-                "title": h.title,
-                "type": holiday_type,
-                "source": "custom"
-            }
-
-        # ── 3. Merge: DB custom holidays override national ones on same date ──
-        merged = dict(national_map)
-        merged.update(db_map)
-
-        # Sort by date
-        holiday_data = sorted(merged.values(), key=lambda x: x["full_date"])
-
-        return jsonify(holiday_data), 200
+        # Built once per year and cached (holiday_calendar.py)
+        return jsonify(holiday_calendar.get_calendar(db, current_year).entries), 200
 
     except Exception as e:
-        print(f"Holidays error: {str(e)}") 
+        logger.error("Holidays error: %s", e)
+        skip_etag()
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/myholidays', methods=['POST'])
@@ -2657,7 +2260,7 @@ def create_holiday():
     if not title or not date_str:
         return jsonify({"message": "Title and date are required"}), 400
         
-    db = SessionLocal()
+    db = g.db
     try:
         holiday_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         year = holiday_date.year
@@ -2686,10 +2289,8 @@ def create_holiday():
         
     except Exception as e:
         db.rollback()
-        print(f"Error creating holiday: {str(e)}")
+        logger.error("Error creating holiday: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/attendance', methods=['GET'])
@@ -2697,7 +2298,7 @@ def get_attendance_data():
     """Get user's attendance data from database"""
     user_id = request.headers.get('X-User-ID')
     
-    db = SessionLocal()
+    db = g.db
     try:
         attendance_records = db.query(Attendance).filter(
             Attendance.user_id == user_id
@@ -2724,10 +2325,8 @@ def get_attendance_data():
         return jsonify(attendance_data), 200
         
     except Exception as e:
-        print(f"Attendance error: {str(e)}")
+        logger.error("Attendance error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 #now for admin page datas
@@ -2737,7 +2336,7 @@ def get_attendance_data():
 @app.route('/api/staff_list', methods=['GET'])
 def get_staff_list():
     """Get all users to populate supervisor and HR manager selects"""
-    db = SessionLocal()
+    db = g.db
     try:
         users = db.query(User).all()
         staff = []
@@ -2750,15 +2349,13 @@ def get_staff_list():
             })
         return jsonify(staff), 200
     except Exception as e:
-        print(f"Staff list error: {str(e)}")
+        logger.error("Staff list error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 @app.route('/api/employeeslist', methods=['GET'])
 def get_employees_data():
     """Get all employees from database"""
-    db = SessionLocal()
+    db = g.db
     try:
         # Get all employees with their profiles
         employees = db.query(User).outerjoin(
@@ -2766,36 +2363,31 @@ def get_employees_data():
         ).filter(
             User.role == 'employee'
         ).all()
-        
+
+        # Resolve all profiles in one query instead of one per employee
+        cards = load_employee_cards(db, [user.id for user in employees])
+
         employees_data = []
         for user in employees:
-            # Get profile if exists
-            profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
-            name = f"{user.first_name or ''} {user.last_name or ''}".strip()
-            if not name:
-                name = user.username
-            
+            card = cards.get(user.id) or empty_card(user.id, user.username)
+            has_profile = card["has_profile"]
+
             employees_data.append({
                 "id": user.id,
-                "name": name,
+                "name": card["name"],
                 "email": user.email,
-                "empId": profile.emp_id if profile and profile.emp_id else str(user.id),
-                "position": profile.position if profile else "Employee",
-                "department": profile.department if profile else "General",
-                "status": profile.status if profile else "Active",
-                "image": profile.profile_image if profile and profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote(name)}&background=random"
+                "empId": card["emp_id"],
+                "position": card["position"] if has_profile else "Employee",
+                "department": card["department"] if has_profile else "General",
+                "status": card["status"] if has_profile else "Active",
+                "image": card["image"]
             })
         
         return jsonify(employees_data), 200
         
     except Exception as e:
-        print(f"Employees list error: {str(e)}")
+        logger.error("Employees list error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/employees', methods=['POST'])
@@ -2816,7 +2408,7 @@ def add_employee():
     if not all([first_name, last_name, email, phone]):
         return jsonify({"message": "Missing required fields"}), 400
         
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if email/username already exists
         username = email.split('@')[0]
@@ -2835,7 +2427,7 @@ def add_employee():
                         max_numeric_id = max(max_numeric_id, int(eid))
                 emp_id = str(max_numeric_id + 1)
             except Exception as e:
-                print(f"Error generating emp_id: {str(e)}")
+                logger.error("Error generating emp_id: %s", e)
                 # Falling back to a timestamp-based ID or just letting it error if critical
                 emp_id = str(int(datetime.now().timestamp()))
         
@@ -2897,11 +2489,8 @@ def add_employee():
         if 'profileImage' in request.files:
             file = request.files['profileImage']
             if file and file.filename != '':
-                import base64
-                file_content = file.read()
-                base64_encoded = base64.b64encode(file_content).decode('utf-8')
-                mime_type = file.content_type if file.content_type else 'image/png'
-                profile_image_url = f"data:{mime_type};base64,{base64_encoded}"
+                # Stored once on disk by content hash (media_store.py)
+                profile_image_url = media_store.save_image_upload(file)
 
         new_profile = EmployeeProfile(
             user_id=new_user.id,
@@ -2935,10 +2524,8 @@ def add_employee():
         
     except Exception as e:
         db.rollback()
-        print(f"Error adding employee: {str(e)}")
+        logger.error("Error adding employee: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/employees/<int:user_id>', methods=['PUT'])
@@ -2948,7 +2535,7 @@ def update_employee(user_id):
     else:
         data = request.get_json() or {}
         
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
@@ -3012,21 +2599,15 @@ def update_employee(user_id):
         if 'profileImage' in request.files:
             file = request.files['profileImage']
             if file and file.filename != '':
-                import base64
-                file_content = file.read()
-                base64_encoded = base64.b64encode(file_content).decode('utf-8')
-                mime_type = file.content_type if file.content_type else 'image/png'
-                profile.profile_image = f"data:{mime_type};base64,{base64_encoded}"
+                profile.profile_image = media_store.save_image_upload(file)
 
         db.commit()
         return jsonify({"message": "Employee updated successfully"}), 200
         
     except Exception as e:
         db.rollback()
-        print(f"Error updating employee: {str(e)}")
+        logger.error("Error updating employee: %s", e)
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 # Redundant endpoint removed. Using get_admin_profile_data instead.
 
@@ -3037,7 +2618,7 @@ def update_employee(user_id):
 @app.route('/api/attendancelist', methods=['GET'])
 def get_admin_attendance_data():
     """Get all attendance records for admin view with filtering"""
-    db = SessionLocal()
+    db = g.db
     try:
         # Get filter parameters from request
         name_filter = request.args.get('name', '').strip()
@@ -3047,7 +2628,8 @@ def get_admin_attendance_data():
         to_date_str = request.args.get('to_date')
         sort_order = request.args.get('order', 'newest')
         
-        print(f"DEBUG Attendance Filter: name={name_filter}, status={status_filter}, days={days_filter}, from={from_date_str}, to={to_date_str}")
+        logger.debug("Attendance filter: name=%s, status=%s, days=%s, from=%s, to=%s",
+                     name_filter, status_filter, days_filter, from_date_str, to_date_str)
         
         # Base query
         query = db.query(Attendance, User).join(
@@ -3099,22 +2681,18 @@ def get_admin_attendance_data():
             query = query.order_by(Attendance.date.desc())
             
         attendance_records = query.all()
-        
+
+        # Employee profiles for every row in one query
+        cards = load_employee_cards(db, [user.id for att, user in attendance_records])
+
         attendance_data = []
         for att, user in attendance_records:
-            # Get employee profile for position info
-            profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
-            name = f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username
-            role = profile.position if profile else "Employee"
-            emp_id = profile.emp_id if profile and profile.emp_id else str(user.id)
-            
+            card = cards.get(user.id) or empty_card(user.id, user.username)
+
             attendance_data.append({
-                "id": emp_id,
-                "employee": name,
-                "role": role,
+                "id": card["emp_id"],
+                "employee": card["name"],
+                "role": card["position"] if card["has_profile"] else "Employee",
                 "status": att.status or "Absent",
                 "date": att.date.strftime('%d %b %Y') if att.date else "",
                 "checkIn": att.check_in.strftime('%H:%M') if att.check_in else "00:00",
@@ -3125,18 +2703,14 @@ def get_admin_attendance_data():
         return jsonify(attendance_data), 200
         
     except Exception as e:
-        print(f"Admin attendance error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Admin attendance error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/leaveapproval', methods=['GET'])
 def get_admin_leave_approval_data():
     """Get all leave requests for admin approval"""
-    db = SessionLocal()
+    db = g.db
     try:
         # Get all leave requests with user and leave type info
         requests_data = db.query(LeaveRequest, User, LeaveType).join(
@@ -3144,17 +2718,16 @@ def get_admin_leave_approval_data():
         ).join(
             LeaveType, LeaveRequest.leave_type_id == LeaveType.id
         ).order_by(LeaveRequest.applied_date.desc()).all()
-        
+
+        # Employee profiles for every request in one query
+        cards = load_employee_cards(db, [user.id for req, user, leave_type in requests_data])
+
         leave_approval_data = []
         for req, user, leave_type in requests_data:
-            # Get employee profile for employee ID
-            profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
-            name = f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username
-            emp_id = profile.emp_id if profile and profile.emp_id else str(user.id)
-            
+            card = cards.get(user.id) or empty_card(user.id, user.username)
+            name = card["name"]
+            emp_id = card["emp_id"]
+
             # Calculate display duration for robustness (especially for half-days)
             actual_days = (req.end_date - req.start_date).days + 1
             if req.day_type == 'half_day':
@@ -3176,35 +2749,32 @@ def get_admin_leave_approval_data():
                 "document": "",
                 "reason": req.reason or "",
                 "status": req.status.capitalize() if req.status else "Pending",
-                "image": profile.profile_image if profile and profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote(name)}&background=random",
+                "image": card["image"],
                 "request_id": req.id
             })
-        
+
         return jsonify(leave_approval_data), 200
         
     except Exception as e:
-        print(f"Leave approval error: {str(e)}")
+        logger.error("Leave approval error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/leavepolicies', methods=['GET'])
+@conditional_get('leave_types')
 def get_admin_leave_policies():
     """Get all leave types/policies from database"""
-    db = SessionLocal()
+    db = g.db
     try:
-        leave_types = db.query(LeaveType).all()
-        
         leave_policies = []
-        for lt in leave_types:
+        for lt in reference_cache.leave_types(db):
             leave_policies.append({
-                "id": lt.id,
-                "name": lt.name,
-                "createdOn": lt.created_at.strftime("%d %b %Y") if lt.created_at else "",  # Add created_at to LeaveType model if needed
-                "type": lt.type,
-                "max_days": lt.max_days_per_year,
-                "description": lt.description or ""
+                "id": lt["id"],
+                "name": lt["name"],
+                "createdOn": lt["created_at"].strftime("%d %b %Y") if lt["created_at"] else "",
+                "type": lt["type"],
+                "max_days": lt["max_days_per_year"],
+                "description": lt["description"] or ""
             })
         
         # If no leave types in DB, provide defaults
@@ -3218,14 +2788,13 @@ def get_admin_leave_policies():
         return jsonify(leave_policies), 200
         
     except Exception as e:
-        print(f"Leave policies error: {str(e)}")
+        logger.error("Leave policies error: %s", e)
+        skip_etag()
         return jsonify([]), 200
-    finally:
-        db.close()
 
 @app.route('/api/leavepolicies/<int:leave_id>', methods=['PUT'])
 def update_leave_policy(leave_id):
-    db = SessionLocal()
+    db = g.db
     try:
         data = request.json
 
@@ -3236,23 +2805,25 @@ def update_leave_policy(leave_id):
         # Update fields only if provided
         leave_type.name = data.get("name", leave_type.name)
         leave_type.description = data.get("description", leave_type.description)
-        leave_type.max_days_per_year = data.get("max_days", leave_type.max_days_per_year)
+        old_max_days = leave_type.max_days_per_year
+        leave_type.max_days_per_year = int(data.get("max_days", leave_type.max_days_per_year))
         leave_type.type = data.get("type", leave_type.type)
 
+        # Credit/debit the allocation change on this year's open balances
+        leave_ledger.record_policy_change(db, leave_id, old_max_days, leave_type.max_days_per_year)
+
         db.commit()
 
         return jsonify({"message": "Leave policy updated successfully"}), 200
 
     except Exception as e:
         db.rollback()
-        print("Update error:", str(e))
+        logger.error("Update error: %s", e)
         return jsonify({"message": "Failed to update leave policy"}), 500
-    finally:
-        db.close()
 
 @app.route('/api/leavepolicies/<int:leave_id>', methods=['DELETE'])
 def delete_leave_policy(leave_id):
-    db = SessionLocal()
+    db = g.db
     try:
         leave_type = db.query(LeaveType).filter(LeaveType.id == leave_id).first()
         if not leave_type:
@@ -3265,14 +2836,12 @@ def delete_leave_policy(leave_id):
 
     except Exception as e:
         db.rollback()
-        print("Delete error:", str(e))
+        logger.error("Delete error: %s", e)
         return jsonify({"message": "Failed to delete leave policy"}), 500
-    finally:
-        db.close()
 
 @app.route('/api/leavepolicies', methods=['POST'])
 def create_leave_policy():
-    db = SessionLocal()
+    db = g.db
     try:
         data = request.json
 
@@ -3310,11 +2879,9 @@ def create_leave_policy():
 
     except Exception as e:
         db.rollback()
-        print("Create error:", str(e))
+        logger.error("Create error: %s", e)
         return jsonify({"message": "Failed to create leave policy"}), 500
 
-    finally:
-        db.close()
 
 
 @app.route('/api/myteamla', methods=['GET'])
@@ -3322,7 +2889,7 @@ def get_my_team_la():
     """Get team members' leave requests for manager approval"""
     user_id = request.headers.get('X-User-ID')
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Get team members for this manager
         team_members = db.query(TeamMember).filter(
@@ -3341,16 +2908,15 @@ def get_my_team_la():
                 ).join(
                     LeaveType, LeaveRequest.leave_type_id == LeaveType.id
                 ).order_by(LeaveRequest.applied_date.desc()).all()
-                
+
+                cards = load_employee_cards(db, [user.id for req, user, leave_type in requests_data])
+
                 my_team_la = []
                 for idx, (req, user, leave_type) in enumerate(requests_data, 1):
-                    profile = db.query(EmployeeProfile).filter(
-                        EmployeeProfile.user_id == user.id
-                    ).first()
-                    
-                    name = f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username
-                    emp_id = profile.emp_id if profile and profile.emp_id else str(user.id)
-                    image = profile.profile_image if profile and profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote(name)}&background=random"
+                    card = cards.get(user.id) or empty_card(user.id, user.username)
+                    name = card["name"]
+                    emp_id = card["emp_id"]
+                    image = card["image"]
                     
                     # Calculate display duration for robustness (especially for half-days)
                     actual_days = (req.end_date - req.start_date).days + 1
@@ -3389,16 +2955,16 @@ def get_my_team_la():
         ).filter(
             LeaveRequest.user_id.in_(member_ids)
         ).order_by(LeaveRequest.applied_date.desc()).all()
-        
+
+        # Employee profiles for every request in one query
+        cards = load_employee_cards(db, [user.id for req, user, leave_type in requests_data])
+
         my_team_la = []
         for idx, (req, user, leave_type) in enumerate(requests_data, 1):
-            profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
-            name = f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username
-            emp_id = profile.emp_id if profile and profile.emp_id else str(user.id)
-            image = profile.profile_image if profile and profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote(name)}&background=random"
+            card = cards.get(user.id) or empty_card(user.id, user.username)
+            name = card["name"]
+            emp_id = card["emp_id"]
+            image = card["image"]
             
             # Calculate display duration for robustness (especially for half-days)
             actual_days = (req.end_date - req.start_date).days + 1
@@ -3428,10 +2994,8 @@ def get_my_team_la():
         return jsonify(my_team_la), 200
         
     except Exception as e:
-        print(f"My team LA error: {str(e)}")
+        logger.error("My team LA error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/myteamra', methods=['GET'])
@@ -3439,7 +3003,7 @@ def get_myteam_ra():
     """Get team members' regularization requests for manager approval"""
     user_id = request.headers.get('X-User-ID')
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Get team members for this manager
         team_members = db.query(TeamMember).filter(
@@ -3472,24 +3036,26 @@ def get_myteam_ra():
             ).filter(
                 Regularization.user_id.in_(member_ids)
             ).order_by(Regularization.request_date.desc()).all()
-        
+
+        # Requesters and approvers resolved together in one query
+        cards = load_employee_cards(
+            db,
+            [user.id for req, user in requests_data] +
+            [req.approved_by for req, user in requests_data if req.approved_by]
+        )
+
         my_team_ra = []
         for req, user in requests_data:
-            profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
-            name = f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username
-            emp_id = profile.emp_id if profile and profile.emp_id else str(user.id)
-            image = profile.profile_image if profile and profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote(name)}&background=random"
-            
+            card = cards.get(user.id) or empty_card(user.id, user.username)
+            name = card["name"]
+            emp_id = card["emp_id"]
+            image = card["image"]
+
             session_str = req.session_type or "Full Day"
-            
+
             approver_name = ""
-            if req.approved_by:
-                approver = db.query(User).filter(User.id == req.approved_by).first()
-                if approver:
-                    approver_name = f"{approver.first_name or ''} {approver.last_name or ''}".strip() or approver.username
+            if req.approved_by and req.approved_by in cards:
+                approver_name = cards[req.approved_by]["name"]
 
             my_team_ra.append({
                 "id": req.id,
@@ -3511,39 +3077,39 @@ def get_myteam_ra():
         return jsonify(my_team_ra), 200
         
     except Exception as e:
-        print(f"My team RA error: {str(e)}")
+        logger.error("My team RA error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/regularizationapproval', methods=['GET'])
 def get_regularization_approval():
     """Get all regularization requests for admin approval"""
-    db = SessionLocal()
+    db = g.db
     try:
         # Get all regularization requests with user info
         requests_data = db.query(Regularization, User).join(
             User, Regularization.user_id == User.id
         ).order_by(Regularization.request_date.desc()).all()
-        
+
+        # Requesters and approvers resolved together in one query
+        cards = load_employee_cards(
+            db,
+            [user.id for req, user in requests_data] +
+            [req.approved_by for req, user in requests_data if req.approved_by]
+        )
+
         regularization_approval = []
         for req, user in requests_data:
-            profile = db.query(EmployeeProfile).filter(
-                EmployeeProfile.user_id == user.id
-            ).first()
-            
-            name = f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username
-            emp_id = profile.emp_id if profile and profile.emp_id else str(user.id)
-            image = profile.profile_image if profile and profile.profile_image else f"https://ui-avatars.com/api/?name={urllib.parse.quote(name)}&background=random"
-            
+            card = cards.get(user.id) or empty_card(user.id, user.username)
+            name = card["name"]
+            emp_id = card["emp_id"]
+            image = card["image"]
+
             session_str = req.session_type or "Full Day"
-            
+
             approver_name = ""
-            if req.approved_by:
-                approver = db.query(User).filter(User.id == req.approved_by).first()
-                if approver:
-                    approver_name = f"{approver.first_name or ''} {approver.last_name or ''}".strip() or approver.username
+            if req.approved_by and req.approved_by in cards:
+                approver_name = cards[req.approved_by]["name"]
 
             regularization_approval.append({
                 "id": req.id,
@@ -3563,10 +3129,8 @@ def get_regularization_approval():
         return jsonify(regularization_approval), 200
         
     except Exception as e:
-        print(f"Regularization approval error: {str(e)}")
+        logger.error("Regularization approval error: %s", e)
         return jsonify([]), 200
-    finally:
-        db.close()
 
 
 @app.route('/api/admin/regularization/<int:request_id>', methods=['PUT', 'PATCH', 'OPTIONS'])
@@ -3581,7 +3145,7 @@ def update_regularization_status(request_id):
     if status not in ['approved', 'rejected']:
         return jsonify({"message": "Invalid status"}), 400
         
-    db = SessionLocal()
+    db = g.db
     try:
         req = db.query(Regularization).filter(Regularization.id == request_id).first()
         if not req:
@@ -3617,19 +3181,17 @@ def update_regularization_status(request_id):
             )
             db.add(new_notif)
             db.commit()
-            print(f"DEBUG: Created regularization notification for user {req.user_id} (Status: {status})")
+            logger.debug("Created regularization notification for user %s (status: %s)", req.user_id, status)
         except Exception as notif_err:
-            print(f"Error creating regularization notification: {notif_err}")
+            logger.error("Error creating regularization notification: %s", notif_err)
             # Don't fail the main request if notification fails
 
         return jsonify({"message": f"Regularization {status} successfully"}), 200
         
     except Exception as e:
         db.rollback()
-        print(f"Error updating regularization: {str(e)}")
+        logger.error("Error updating regularization: %s", e)
         return jsonify({"message": str(e)}), 500
-    finally:
-        db.close()
 
 
 #Mansoor code added 
@@ -3641,9 +3203,8 @@ def get_admin_profile_data(user_id):
     """
     Returns admin profile data for the specified user from database.
     """
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         user = db.query(User).filter(User.id == user_id).first()
         
         if not user:
@@ -3688,8 +3249,8 @@ def get_admin_profile_data(user_id):
         # Return data from database
         admin_profile_data = {
             "profile": {
-                "profileImage": emp_profile.profile_image if emp_profile and emp_profile.profile_image else "",
-                "profile_image": emp_profile.profile_image if emp_profile and emp_profile.profile_image else "",
+                "profileImage": media_store.public_url(emp_profile.profile_image) if emp_profile and emp_profile.profile_image else "",
+                "profile_image": media_store.public_url(emp_profile.profile_image) if emp_profile and emp_profile.profile_image else "",
                 "name": f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username,
                 "first_name": user.first_name or (user.username.split()[0] if user.username else ""),
                 "last_name": user.last_name or (user.username.split()[1] if user.username and len(user.username.split()) > 1 else ""),
@@ -3749,11 +3310,8 @@ def get_admin_profile_data(user_id):
     except Exception as e:
         if db:
             db.rollback()
-        print(f"Error getting admin profile: {str(e)}")
+        logger.error("Error getting admin profile: %s", e)
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
-    finally:
-        if db:
-            db.close()
 
 
 # --- Employee Profile Endpoint ---
@@ -3768,9 +3326,8 @@ def get_employee_profile_data(user_id):
     if current_user_id != user_id and request.user_role != 'admin':
         return jsonify({"message": "Unauthorized to view this profile."}), 403
     
-    db = None
     try:
-        db = SessionLocal()
+        db = g.db
         user = db.query(User).filter(User.id == user_id).first()
         
         if not user:
@@ -3781,7 +3338,7 @@ def get_employee_profile_data(user_id):
         
         # Format profile data
         profile_data = {
-            "profileImage": profile.profile_image if profile else "",
+            "profileImage": media_store.public_url(profile.profile_image) if profile else "",
             "name": f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username,
             "gender": profile.gender if profile else "",
             "dob": profile.dob.strftime('%Y-%m-%d') if profile and profile.dob else "",
@@ -3866,7 +3423,7 @@ def get_employee_profile_data(user_id):
         # Return data from database
         employee_profile_data = {
             "profile": {
-                "profileImage": emp_profile.profile_image if emp_profile and emp_profile.profile_image else "",
+                "profileImage": media_store.public_url(emp_profile.profile_image) if emp_profile and emp_profile.profile_image else "",
                 "name": f"{user.first_name or ''} {user.last_name or ''}".strip() or user.username,
                 "gender": emp_profile.gender if emp_profile and emp_profile.gender else "",
                 "dob": emp_profile.dob.strftime('%Y-%m-%d') if emp_profile and emp_profile.dob else "",
@@ -3922,11 +3479,8 @@ def get_employee_profile_data(user_id):
     except Exception as e:
         if db:
             db.rollback()
-        print(f"Error getting employee profile: {str(e)}")
+        logger.error("Error getting employee profile: %s", e)
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
-    finally:
-        if db:
-            db.close()
 
 
 @app.route('/pyver')
@@ -3941,7 +3495,7 @@ def pyver():
 @app.route('/api/salary_structure', methods=['GET'])
 def get_all_salary_structures():
     """Get all salary structures (admin view)"""
-    db = SessionLocal()
+    db = g.db
     try:
         structures = db.query(SalaryStructure).all()
         result = []
@@ -3965,14 +3519,12 @@ def get_all_salary_structures():
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/salary_structure/<int:user_id>', methods=['GET'])
 def get_salary_structure(user_id):
     """Get salary structure for a specific user"""
-    db = SessionLocal()
+    db = g.db
     try:
         structure = db.query(SalaryStructure).filter(SalaryStructure.user_id == user_id).first()
         if not structure:
@@ -3994,8 +3546,6 @@ def get_salary_structure(user_id):
         }), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/salary_structure', methods=['POST'])
@@ -4007,7 +3557,7 @@ def create_salary_structure():
     if not user_id:
         return jsonify({"message": "User ID is required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if structure exists
         existing = db.query(SalaryStructure).filter(SalaryStructure.user_id == user_id).first()
@@ -4049,14 +3599,12 @@ def create_salary_structure():
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/payroll', methods=['GET'])
 def get_all_payroll():
     """Get all payroll records (admin view)"""
-    db = SessionLocal()
+    db = g.db
     try:
         month = request.args.get('month', type=int)
         year = request.args.get('year', type=int)
@@ -4090,14 +3638,12 @@ def get_all_payroll():
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/payroll/<int:user_id>', methods=['GET'])
 def get_employee_payroll(user_id):
     """Get payroll records for a specific employee"""
-    db = SessionLocal()
+    db = g.db
     try:
         payrolls = db.query(Payroll).filter(Payroll.user_id == user_id).order_by(Payroll.year.desc(), Payroll.month.desc()).all()
         result = []
@@ -4119,8 +3665,6 @@ def get_employee_payroll(user_id):
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/payroll', methods=['POST'])
@@ -4134,7 +3678,7 @@ def create_payroll():
     if not all([user_id, month, year]):
         return jsonify({"message": "User ID, month, and year are required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if payroll already exists
         existing = db.query(Payroll).filter(
@@ -4184,14 +3728,12 @@ def create_payroll():
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/payroll/<int:payroll_id>/pay', methods=['PUT'])
 def mark_payroll_paid(payroll_id):
     """Mark payroll as paid"""
-    db = SessionLocal()
+    db = g.db
     try:
         payroll = db.query(Payroll).filter(Payroll.id == payroll_id).first()
         if not payroll:
@@ -4209,14 +3751,12 @@ def mark_payroll_paid(payroll_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/payroll/summary', methods=['GET'])
 def get_payroll_summary():
     """Get payroll summary statistics"""
-    db = SessionLocal()
+    db = g.db
     try:
         current_month = datetime.now().month
         current_year = datetime.now().year
@@ -4255,8 +3795,6 @@ def get_payroll_summary():
         }), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # =============================================================================
@@ -4266,7 +3804,7 @@ def get_payroll_summary():
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
     """Get tasks - optionally filtered by user_id"""
-    db = SessionLocal()
+    db = g.db
     try:
         user_id = request.args.get('user_id', type=int)
         status = request.args.get('status')
@@ -4297,8 +3835,6 @@ def get_tasks():
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/tasks', methods=['POST'])
@@ -4311,7 +3847,7 @@ def create_task():
     if not user_id or not title:
         return jsonify({"message": "User ID and title are required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         new_task = Task(
             user_id=user_id,
@@ -4330,15 +3866,13 @@ def create_task():
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
 def update_task(task_id):
     """Update a task"""
     data = request.get_json()
-    db = SessionLocal()
+    db = g.db
     try:
         task = db.query(Task).filter(Task.id == task_id).first()
         if not task:
@@ -4364,14 +3898,12 @@ def update_task(task_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
 def delete_task(task_id):
     """Delete a task"""
-    db = SessionLocal()
+    db = g.db
     try:
         task = db.query(Task).filter(Task.id == task_id).first()
         if not task:
@@ -4383,14 +3915,12 @@ def delete_task(task_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/performance', methods=['GET'])
 def get_performance_reviews():
     """Get performance reviews"""
-    db = SessionLocal()
+    db = g.db
     try:
         user_id = request.args.get('user_id', type=int)
         year = request.args.get('year', type=int)
@@ -4422,8 +3952,6 @@ def get_performance_reviews():
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/performance', methods=['POST'])
@@ -4437,7 +3965,7 @@ def create_performance_review():
     if not all([user_id, month, year]):
         return jsonify({"message": "User ID, month, and year are required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         # Check if review exists
         existing = db.query(PerformanceReview).filter(
@@ -4469,14 +3997,12 @@ def create_performance_review():
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/performance/summary', methods=['GET'])
 def get_performance_summary():
     """Get performance summary statistics"""
-    db = SessionLocal()
+    db = g.db
     try:
         current_month = datetime.now().month
         current_year = datetime.now().year
@@ -4509,8 +4035,81 @@ def get_performance_summary():
         }), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
+
+
+# =============================================================================
+# MEDIA (content-addressed uploads, see media_store.py)
+# =============================================================================
+
+@app.route('/media/<digest>', methods=['GET'])
+def get_media(digest):
+    """Serve a stored file; its name is its SHA-256, so it can be cached forever"""
+    if not media_store.store.exists(digest):
+        return jsonify({"message": "Not found"}), 404
+
+    mime_type = media_store.media_mime(digest)
+    response = send_file(
+        media_store.store.path(digest),
+        mimetype=mime_type,
+        as_attachment=not mime_type.startswith('image/'),
+        download_name=digest,
+        etag=digest,
+        conditional=True,
+    )
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+@app.route('/api/avatar/<int:user_id>', methods=['GET'])
+def get_avatar(user_id):
+    """
+    Square WebP thumbnail of the user's stored picture, or an initials SVG
+    (avatar_service.py). Pictures are only rendered from the media store:
+    other values, e.g. external URLs, get the initials too. Needs the
+    exp/sig of an avatar_url() link instead of a token, so <img> can load it.
+    """
+    remaining = avatar_service.check_url(user_id, request.args)
+    if remaining is None:
+        return jsonify({"message": "Invalid or expired avatar link"}), 403
+
+    size = avatar_service.pick_size(request.args.get('size', type=int))
+    db = g.db
+    try:
+        row = db.query(
+            User.first_name, User.last_name, User.username, EmployeeProfile.profile_image
+        ).outerjoin(
+            EmployeeProfile, EmployeeProfile.user_id == User.id
+        ).filter(User.id == user_id).first()
+        if not row:
+            return jsonify({"message": "User not found"}), 404
+
+        image = row.profile_image
+        name = display_name(row.first_name, row.last_name, row.username)
+        version = avatar_service.avatar_version(image, name)
+        digest = avatar_service.source_digest(image)
+        etag = f"{version}-{size}"
+        if digest:
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = send_file(avatar_service.get_variant(digest, size), mimetype='image/webp')
+        else:
+            svg = avatar_service.initials_svg(user_id, avatar_service.initials(row.first_name, row.last_name, row.username), size)
+            response = Response(svg, mimetype='image/svg+xml')
+        response.set_etag(etag)
+        response.make_conditional(request)
+
+        if request.args.get('v') == version:
+            # the URL changes when the avatar does; cached no longer than the link is valid
+            response.headers['Cache-Control'] = f'private, max-age={remaining}, immutable'
+        else:
+            response.headers['Cache-Control'] = f'private, max-age={min(remaining, 300)}'
+        return response
+
+    except Exception as e:
+        logger.error("Avatar error: %s", e)
+        return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
 # =============================================================================
@@ -4520,7 +4119,7 @@ def get_performance_summary():
 @app.route('/api/documents', methods=['GET'])
 def get_documents():
     """Get documents for a user"""
-    db = SessionLocal()
+    db = g.db
     try:
         user_id = request.args.get('user_id', type=int)
         doc_type = request.args.get('type')
@@ -4540,6 +4139,7 @@ def get_documents():
                 "document_type": d.document_type,
                 "file_name": d.file_name,
                 "file_size": d.file_size,
+                "mime_type": d.mime_type,
                 "description": d.description,
                 "is_verified": d.is_verified,
                 "created_at": d.created_at.isoformat() if d.created_at else None
@@ -4547,48 +4147,105 @@ def get_documents():
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/documents', methods=['POST'])
+@jwt_required()
 def upload_document():
-    """Upload a document (metadata only - file handling to be added)"""
-    data = request.get_json()
-    user_id = data.get('user_id')
-    doc_type = data.get('document_type')
-    file_name = data.get('file_name')
-    
-    if not all([user_id, doc_type, file_name]):
-        return jsonify({"message": "User ID, document type, and file name are required"}), 400
-    
-    db = SessionLocal()
+    """
+    Upload a document as multipart/form-data: the file in field "file",
+    document_type and optional description as form fields. The document
+    belongs to the authenticated user; admins may set user_id to upload
+    for an employee. The file is streamed to the documents store
+    (document_store.py).
+    """
+    if request.mimetype != 'multipart/form-data':
+        return jsonify({"message": "Send the document as multipart/form-data with a 'file' field"}), 400
+
+    try:
+        form, files, spools = document_store.parse_upload()
+    except RequestEntityTooLarge:
+        return jsonify({"message": f"File exceeds {document_store.MAX_DOCUMENT_BYTES} bytes"}), 413
+
+    db = g.db
     try:
+        upload = files.get('file')
+        user_id = request.user_id
+        if request.user_role == 'admin' and form.get('user_id'):
+            user_id = form.get('user_id', type=int)
+        doc_type = form.get('document_type')
+        file_name = document_store.clean_file_name(form.get('file_name') or (upload.filename if upload else None))
+
+        if not all([upload, user_id, doc_type, file_name]):
+            return jsonify({"message": "Document type and file are required"}), 400
+
+        spool = upload.stream  # the UploadSpool the parser wrote the part into
+        if spool.size == 0:
+            return jsonify({"message": "File is empty"}), 400
+        digest = spool.commit()
+
         new_doc = Document(
             user_id=user_id,
             document_type=doc_type,
             file_name=file_name,
-            file_path=data.get('file_path', f'/uploads/{user_id}/{file_name}'),
-            file_size=data.get('file_size', 0),
-            mime_type=data.get('mime_type', 'application/octet-stream'),
-            uploaded_by=int(request.headers.get('X-User-ID')) if request.headers.get('X-User-ID') else None,
-            description=data.get('description', '')
+            file_path=document_store.document_path(digest),
+            file_size=spool.size,
+            mime_type=document_store.detect_mime(digest, file_name),
+            uploaded_by=request.user_id,
+            description=form.get('description', '')
         )
         db.add(new_doc)
         db.commit()
         db.refresh(new_doc)
-        return jsonify({"message": "Document uploaded", "id": new_doc.id}), 201
+        return jsonify({
+            "message": "Document uploaded",
+            "id": new_doc.id,
+            "file_size": new_doc.file_size,
+            "mime_type": new_doc.mime_type,
+            "sha256": digest
+        }), 201
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
     finally:
-        db.close()
+        for spool in spools:
+            spool.discard()
+
+
+@app.route('/api/documents/<int:doc_id>/download', methods=['GET'])
+@jwt_required()
+def download_document(doc_id):
+    """
+    Document file for its owner or an admin (?inline=1 to view PDFs/images
+    in the browser); supports Range and If-None-Match
+    """
+    db = g.db
+    try:
+        doc = db.query(Document).filter(Document.id == doc_id).first()
+        # 404 for other users' documents too: ids are sequential
+        if not doc or (doc.user_id != request.user_id and request.user_role != 'admin'):
+            return jsonify({"message": "Document not found"}), 404
+
+        digest = document_store.digest_from_path(doc.file_path)
+        if digest is None:
+            return jsonify({"message": "Document file not found"}), 404
+        if not document_store.store.exists(digest):
+            # stored once, gone now: lost storage (e.g. DOCUMENTS_ROOT not on a persistent disk)
+            logger.error("Document %s: file %s is missing under %s", doc.id, doc.file_path, document_store.DOCUMENTS_ROOT)
+            return jsonify({"message": "Document file is no longer available"}), 410
+
+        return document_store.send_document(
+            digest, doc.file_name, doc.mime_type, inline=request.args.get('inline') == '1'
+        )
+    except Exception as e:
+        logger.error("Document download error: %s", e)
+        return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
 @app.route('/api/documents/<int:doc_id>', methods=['DELETE'])
 def delete_document(doc_id):
     """Delete a document"""
-    db = SessionLocal()
+    db = g.db
     try:
         doc = db.query(Document).filter(Document.id == doc_id).first()
         if not doc:
@@ -4600,14 +4257,12 @@ def delete_document(doc_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/documents/<int:doc_id>/verify', methods=['PUT'])
 def verify_document(doc_id):
     """Mark a document as verified"""
-    db = SessionLocal()
+    db = g.db
     try:
         doc = db.query(Document).filter(Document.id == doc_id).first()
         if not doc:
@@ -4619,8 +4274,6 @@ def verify_document(doc_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # =============================================================================
@@ -4631,7 +4284,7 @@ def verify_document(doc_id):
 def update_employee_profile(user_id):
     """Update employee profile with nested content"""
     data = request.get_json()
-    db = SessionLocal()
+    db = g.db
     try:
         profile = db.query(EmployeeProfile).filter(EmployeeProfile.user_id == user_id).first()
         
@@ -4654,7 +4307,7 @@ def update_employee_profile(user_id):
             if 'department' in p: profile.department = p['department']
             if 'location' in p: profile.location = p['location']
             if 'status' in p: profile.status = p['status']
-            if 'profileImage' in p: profile.profile_image = p['profileImage']
+            if 'profileImage' in p: profile.profile_image = media_store.image_value(p['profileImage'])
             if 'empId' in p: profile.emp_id = p['empId']
 
         # Update Education
@@ -4701,15 +4354,13 @@ def update_employee_profile(user_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/user/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     """Update basic user information"""
     data = request.get_json()
-    db = SessionLocal()
+    db = g.db
     try:
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
@@ -4732,8 +4383,6 @@ def update_user(user_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # =============================================================================
@@ -4743,28 +4392,18 @@ def update_user(user_id):
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
     """Get all system settings"""
-    db = SessionLocal()
+    db = g.db
     try:
-        settings = db.query(SystemSettings).all()
-        result = {}
-        for s in settings:
-            result[s.setting_key] = {
-                "value": s.setting_value,
-                "type": s.setting_type,
-                "description": s.description
-            }
-        return jsonify(result), 200
+        return jsonify(reference_cache.settings(db)), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/settings', methods=['PUT'])
 def update_settings():
     """Update system settings"""
     data = request.get_json()
-    db = SessionLocal()
+    db = g.db
     try:
         for key, value in data.items():
             setting = db.query(SystemSettings).filter(SystemSettings.setting_key == key).first()
@@ -4784,25 +4423,23 @@ def update_settings():
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/notifications', methods=['GET'])
 def get_notifications():
-    """Get notifications for a user"""
+    """Get notifications for a user: direct ones merged with broadcasts (computed on read)"""
     user_id = request.headers.get('X-User-ID')
-    print(f"DEBUG: Fetching notifications for user_id={user_id}")
+    logger.debug("Fetching notifications for user %s", user_id)
     if not user_id:
         return jsonify({"message": "User ID required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         notifications = db.query(Notification).filter(
             Notification.user_id == int(user_id)
         ).order_by(Notification.created_at.desc()).limit(50).all()
         
-        print(f"DEBUG: Found {len(notifications)} notifications for user {user_id}")
+        logger.debug("Found %s notifications for user %s", len(notifications), user_id)
         
         result = []
         for n in notifications:
@@ -4815,17 +4452,21 @@ def get_notifications():
                 "link": n.link,
                 "created_at": n.created_at.isoformat() if n.created_at else None
             })
+
+        user = db.query(User).filter(User.id == int(user_id)).first()
+        if user:
+            result.extend(list_broadcast_notifications(db, user, limit=50))
+            result.sort(key=lambda item: item["created_at"] or "", reverse=True)
+            result = result[:50]
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/notifications/<int:notif_id>/read', methods=['PUT'])
 def mark_notification_read(notif_id):
     """Mark a notification as read"""
-    db = SessionLocal()
+    db = g.db
     try:
         notification = db.query(Notification).filter(Notification.id == notif_id).first()
         if not notification:
@@ -4837,14 +4478,60 @@ def mark_notification_read(notif_id):
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
+
+
+@app.route('/api/notifications/broadcast-<int:broadcast_id>/read', methods=['PUT'])
+def mark_broadcast_notification_read(broadcast_id):
+    """Mark a broadcast read for the requesting user"""
+    user_id = request.headers.get('X-User-ID')
+    if not user_id:
+        return jsonify({"message": "User ID required"}), 400
+
+    db = g.db
+    try:
+        user = db.query(User).filter(User.id == int(user_id)).first()
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+        if not db.query(Broadcast.id).filter(Broadcast.id == broadcast_id).first():
+            return jsonify({"message": "Notification not found"}), 404
+
+        mark_broadcast_read(db, user, broadcast_id)
+        db.commit()
+        return jsonify({"message": "Notification marked as read"}), 200
+    except Exception as e:
+        db.rollback()
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+
+@app.route('/api/notifications/read_all', methods=['PUT'])
+def mark_all_notifications_read():
+    """Mark every direct notification and broadcast read for the requesting user"""
+    user_id = request.headers.get('X-User-ID')
+    if not user_id:
+        return jsonify({"message": "User ID required"}), 400
+
+    db = g.db
+    try:
+        user = db.query(User).filter(User.id == int(user_id)).first()
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+
+        db.query(Notification).filter(
+            Notification.user_id == user.id,
+            Notification.is_read == False
+        ).update({"is_read": True}, synchronize_session=False)
+        mark_all_broadcasts_read(db, user)
+        db.commit()
+        return jsonify({"message": "All notifications marked as read"}), 200
+    except Exception as e:
+        db.rollback()
+        return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
 @app.route('/api/broadcast', methods=['GET'])
 def get_broadcasts():
     """Get active broadcasts"""
-    db = SessionLocal()
+    db = g.db
     try:
         broadcasts = db.query(Broadcast).filter(
             Broadcast.is_active == True,
@@ -4870,8 +4557,6 @@ def get_broadcasts():
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 @app.route('/api/broadcast', methods=['POST'])
@@ -4884,45 +4569,26 @@ def create_broadcast():
     if not title or not message:
         return jsonify({"message": "Title and message are required"}), 400
     
-    db = SessionLocal()
+    db = g.db
     try:
         new_broadcast = Broadcast(
             title=title,
             message=message,
             sent_by=int(request.headers.get('X-User-ID')) if request.headers.get('X-User-ID') else None,
             target_audience=data.get('target_audience', 'all'),
-            expires_at=datetime.strptime(data['expires_at'], '%Y-%m-%d %H:%M:%S') if data.get('expires_at') else None
+            expires_at=datetime.strptime(data['expires_at'], '%Y-%m-%d %H:%M:%S') if data.get('expires_at') else None,
+            send_notifications=bool(data.get('send_notifications', False))
         )
         db.add(new_broadcast)
         db.commit()
         db.refresh(new_broadcast)
         
-        # Optionally create notifications for all users
-        if data.get('send_notifications', False):
-            target = data.get('target_audience', 'all')
-            query = db.query(User)
-            if target == 'employees':
-                query = query.filter(User.role == 'employee')
-            elif target == 'admins':
-                query = query.filter(User.role == 'admin')
-            
-            users = query.all()
-            for user in users:
-                notif = Notification(
-                    user_id=user.id,
-                    title=title,
-                    message=message,
-                    notification_type='broadcast'
-                )
-                db.add(notif)
-            db.commit()
-        
+        # No per-user notification rows: with send_notifications, GET
+        # /api/notifications shows the broadcast to its audience (broadcast_inbox.py)
         return jsonify({"message": "Broadcast created", "id": new_broadcast.id}), 201
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Error: {str(e)}"}), 500
-    finally:
-        db.close()
 
 
 # ==========================================================
@@ -4953,46 +4619,71 @@ def refresh_token_endpoint():
     return jsonify({"access_token": new_access_token}), 200
 
 
-@app.route('/api/logout', methods=['POST'])
-def logout_endpoint():
-    """Logout by blacklisting the current access and refresh tokens"""
-    # Blacklist access token from Authorization header
+def _logout_token_payloads():
+    """(type, token, payload) of the tokens sent to logout; signature checked, expiry ignored"""
+    tokens = []
     auth_header = request.headers.get('Authorization', '')
     if auth_header.startswith('Bearer '):
-        access_token = auth_header.split(' ', 1)[1]
+        tokens.append(('access', auth_header.split(' ', 1)[1]))
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        tokens.append(('refresh', data['refresh_token']))
+
+    payloads = []
+    for token_type, token in tokens:
         try:
-            import jwt as pyjwt
-            payload = pyjwt.decode(access_token, options={"verify_exp": False}, algorithms=["HS256"],
-                                   key=os.getenv('JWT_SECRET_KEY', 'stafio_jwt_secret_key_2026_change_in_production'))
-            blacklist_token(
-                jti=payload.get('jti'),
-                token_type='access',
-                user_id=payload.get('user_id'),
-                expires_at=datetime.utcfromtimestamp(payload.get('exp', 0))
-            )
+            payload = jwt.decode(token, options={"verify_exp": False}, algorithms=["HS256"],
+                                 key=os.getenv('JWT_SECRET_KEY', 'stafio_jwt_secret_key_2026_change_in_production'))
+            payloads.append((token_type, token, payload))
         except Exception:
             pass  # If token is already invalid, that's fine
-    
-    # Blacklist refresh token from request body
-    data = request.get_json() or {}
-    refresh_token_str = data.get('refresh_token')
-    if refresh_token_str:
-        try:
-            import jwt as pyjwt
-            payload = pyjwt.decode(refresh_token_str, options={"verify_exp": False}, algorithms=["HS256"],
-                                   key=os.getenv('JWT_SECRET_KEY', 'stafio_jwt_secret_key_2026_change_in_production'))
+    return payloads
+
+
+@app.route('/api/logout', methods=['POST'])
+def logout_endpoint():
+    """
+    Logout. With the JTI blacklist enabled (the default) the current access
+    and refresh tokens are blacklisted; in 'version' mode every token of the
+    user is revoked (the only way to revoke a token without per-token state).
+    """
+    payloads = _logout_token_payloads()
+
+    if USE_JTI_BLACKLIST:
+        for token_type, _token, payload in payloads:
             blacklist_token(
                 jti=payload.get('jti'),
-                token_type='refresh',
+                token_type=token_type,
                 user_id=payload.get('user_id'),
                 expires_at=datetime.utcfromtimestamp(payload.get('exp', 0))
             )
-        except Exception:
-            pass
-    
+    else:
+        # Revoking every session needs a token that is still valid: an old
+        # (expired or already revoked) token must not be replayable for it
+        user_ids = {
+            payload.get('user_id') for token_type, token, payload in payloads
+            if payload.get('user_id') and verify_token(token, token_type)
+        }
+        for user_id in user_ids:
+            revoke_all_tokens(user_id)
+
     return jsonify({"message": "Logged out successfully"}), 200
 
 
+@app.route('/api/logout_all', methods=['POST'])
+@jwt_required(allow_headers=False)  # X-User-ID alone would let anyone log anyone out
+def logout_all_endpoint():
+    """Log the current user out on every device (bumps their token version)"""
+    if not USE_TOKEN_VERSIONS:
+        return jsonify({"message": "Token versions are disabled (JWT_REVOCATION_MODE=blacklist)"}), 400
+    try:
+        revoke_all_tokens(request.user_id)
+        return jsonify({"message": "Logged out from all devices"}), 200
+    except Exception as e:
+        logger.error("Logout all error: %s", e)
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+
 # Run the Flask application
 if __name__ == '__main__':
     # Print startup info
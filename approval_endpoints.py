@@ -11,9 +11,13 @@ NOTE: Leave approval endpoints are in the main app file (app_py_for_leave_manage
 To integrate: Call register_regularization_approval_endpoints(app) after app initialization
 """
 
-from flask import request, jsonify
+import logging
+
+from flask import request, jsonify, g
 from datetime import datetime
-from database import SessionLocal, User, Regularization, Notification
+from database import User, Regularization, Notification
+
+logger = logging.getLogger(__name__)
 
 
 def register_regularization_approval_endpoints(app):
@@ -35,7 +39,7 @@ def register_regularization_approval_endpoints(app):
         if not approver_id:
             return jsonify({"message": "Approver ID required"}), 400
         
-        db = SessionLocal()
+        db = g.db
         try:
             reg = db.query(Regularization).filter(Regularization.id == reg_id).first()
             
@@ -79,10 +83,8 @@ def register_regularization_approval_endpoints(app):
             
         except Exception as e:
             db.rollback()
-            print(f"Approve regularization error: {str(e)}")
+            logger.error("Approve regularization error: %s", e)
             return jsonify({"message": f"Error: {str(e)}"}), 500
-        finally:
-            db.close()
     
     
     @app.route('/api/regularization/<int:reg_id>/reject', methods=['PUT'])
@@ -96,7 +98,7 @@ def register_regularization_approval_endpoints(app):
         if not approver_id:
             return jsonify({"message": "Approver ID required"}), 400
         
-        db = SessionLocal()
+        db = g.db
         try:
             reg = db.query(Regularization).filter(Regularization.id == reg_id).first()
             
@@ -139,10 +141,8 @@ def register_regularization_approval_endpoints(app):
             
         except Exception as e:
             db.rollback()
-            print(f"Reject regularization error: {str(e)}")
+            logger.error("Reject regularization error: %s", e)
             return jsonify({"message": f"Error: {str(e)}"}), 500
-        finally:
-            db.close()
     
     
-    print("[OK] Regularization approval/rejection endpoints registered with authorization checks")
+    logger.info("Regularization approval/rejection endpoints registered")
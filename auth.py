@@ -3,21 +3,27 @@ JWT Authentication & RBAC Module for Stafio
 ============================================
 Provides:
 - JWT access/refresh token generation & verification
-- Token blacklist checking
+- Token revocation: per-user token versions and/or the JTI blacklist
 - Role-based decorators: @jwt_required(), @role_required(), @permission_required()
-- Permission mapping per role
+- Permission mapping per role, carried in tokens as a compact bitmask
 """
 
 import jwt
 import uuid
 import os
+import hashlib
+import logging
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import wraps, lru_cache
 from flask import request, jsonify
 from dotenv import load_dotenv
 
+from logging_setup import redact_headers
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
@@ -26,6 +32,14 @@ JWT_SECRET = os.getenv('JWT_SECRET_KEY', 'stafio_jwt_secret_key_2026_change_in_p
 ACCESS_EXPIRY_MINUTES = int(os.getenv('JWT_ACCESS_EXPIRY_MINUTES', '15'))
 REFRESH_EXPIRY_DAYS = int(os.getenv('JWT_REFRESH_EXPIRY_DAYS', '7'))
 
+# How tokens are revoked:
+#   'version'   - per-user token_version claim only; logout = log out everywhere
+#   'blacklist' - per-token JTI blacklist (blacklisted_tokens table)
+#   'both'      - logout blacklists the token, /api/logout_all bumps the version (default)
+JWT_REVOCATION_MODE = os.getenv('JWT_REVOCATION_MODE', 'both').lower()
+USE_TOKEN_VERSIONS = JWT_REVOCATION_MODE in ('version', 'both')
+USE_JTI_BLACKLIST = JWT_REVOCATION_MODE in ('blacklist', 'both')
+
 
 # =============================================================================
 # ROLE → PERMISSION MAPPING
@@ -76,26 +90,83 @@ ROLE_PERMISSIONS = {
 }
 
 
+# =============================================================================
+# COMPACT PERMISSION CLAIMS
+# =============================================================================
+# Access tokens carry permissions as a bitmask ("pm") over PERMISSION_TABLE
+# plus the version of that table ("pv") instead of the full list of strings.
+# The version is derived from the table itself, so adding/removing/renaming a
+# permission changes it; tokens minted against another table fall back to
+# the current permissions of their role.
+
+PERMISSION_TABLE = tuple(sorted({p for perms in ROLE_PERMISSIONS.values() for p in perms}))
+PERMISSIONS_VERSION = hashlib.sha1("\n".join(PERMISSION_TABLE).encode()).hexdigest()[:8]
+_PERMISSION_BITS = {p: 1 << i for i, p in enumerate(PERMISSION_TABLE)}
+
+ROLE_PERMISSION_SETS = {role: frozenset(perms) for role, perms in ROLE_PERMISSIONS.items()}
+
+
+def encode_permissions(permissions):
+    """Bitmask of the given permissions over PERMISSION_TABLE"""
+    mask = 0
+    for permission in permissions:
+        mask |= _PERMISSION_BITS[permission]
+    return mask
+
+
+@lru_cache(maxsize=256)
+def decode_permissions(mask):
+    """frozenset of the permissions in a bitmask (cached: few distinct masks exist)"""
+    return frozenset(p for p, bit in _PERMISSION_BITS.items() if mask & bit)
+
+
+@lru_cache(maxsize=256)
+def _legacy_permissions(permissions):
+    return frozenset(permissions)
+
+
+def permissions_from_payload(payload):
+    """Permission set of a decoded access token"""
+    if payload.get("pv") == PERMISSIONS_VERSION and "pm" in payload:
+        return decode_permissions(payload["pm"])
+    if "permissions" in payload:
+        # Tokens issued before the compact claims
+        return _legacy_permissions(tuple(payload["permissions"]))
+    return ROLE_PERMISSION_SETS.get(payload.get("role"), frozenset())
+
+
 # =============================================================================
 # TOKEN GENERATION
 # =============================================================================
 
-def generate_access_token(user_id, role):
+def _with_token_version(payload, user_id, token_version):
+    """Embed the user's current token version (tv claim) when versions are on"""
+    if USE_TOKEN_VERSIONS:
+        if token_version is None:
+            from token_versions import current_token_version
+            token_version = current_token_version(user_id)
+        payload["tv"] = token_version
+    return payload
+
+
+def generate_access_token(user_id, role, token_version=None):
     """Generate a short-lived access token (15 min default)"""
     permissions = ROLE_PERMISSIONS.get(role, [])
     payload = {
         "user_id": user_id,
         "role": role,
-        "permissions": permissions,
+        "pm": encode_permissions(permissions),
+        "pv": PERMISSIONS_VERSION,
         "type": "access",
         "jti": str(uuid.uuid4()),
         "iat": datetime.utcnow(),
         "exp": datetime.utcnow() + timedelta(minutes=ACCESS_EXPIRY_MINUTES),
     }
+    payload = _with_token_version(payload, user_id, token_version)
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 
-def generate_refresh_token(user_id, role):
+def generate_refresh_token(user_id, role, token_version=None):
     """Generate a long-lived refresh token (7 days default)"""
     payload = {
         "user_id": user_id,
@@ -105,14 +176,19 @@ def generate_refresh_token(user_id, role):
         "iat": datetime.utcnow(),
         "exp": datetime.utcnow() + timedelta(days=REFRESH_EXPIRY_DAYS),
     }
+    payload = _with_token_version(payload, user_id, token_version)
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
 
 def generate_tokens(user_id, role):
     """Generate both access and refresh tokens"""
+    token_version = None
+    if USE_TOKEN_VERSIONS:
+        from token_versions import current_token_version
+        token_version = current_token_version(user_id)
     return {
-        "access_token": generate_access_token(user_id, role),
-        "refresh_token": generate_refresh_token(user_id, role),
+        "access_token": generate_access_token(user_id, role, token_version),
+        "refresh_token": generate_refresh_token(user_id, role, token_version),
     }
 
 
@@ -124,7 +200,7 @@ def verify_token(token, expected_type="access"):
     """
     Decode and verify a JWT token.
     Returns the payload dict on success, or None on failure.
-    Also checks the blacklist.
+    Also checks revocation (token version and/or blacklist, see JWT_REVOCATION_MODE).
     """
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
@@ -133,8 +209,10 @@ def verify_token(token, expected_type="access"):
         if payload.get("type") != expected_type:
             return None
         
-        # Check blacklist
-        if _is_token_blacklisted(payload.get("jti")):
+        # Check revocation
+        if USE_TOKEN_VERSIONS and not _is_token_version_current(payload):
+            return None
+        if USE_JTI_BLACKLIST and _is_token_blacklisted(payload.get("jti")):
             return None
         
         return payload
@@ -145,43 +223,54 @@ def verify_token(token, expected_type="access"):
 
 
 def _is_token_blacklisted(jti):
-    """Check if a token JTI is in the blacklist"""
+    """Check if a token JTI is in the blacklist (process-local cache, see token_blacklist.py)"""
     if not jti:
         return False
     try:
-        from database import SessionLocal, BlacklistedToken
-        db = SessionLocal()
-        try:
-            exists = db.query(BlacklistedToken).filter(
-                BlacklistedToken.jti == jti
-            ).first()
-            return exists is not None
-        finally:
-            db.close()
+        from token_blacklist import blacklist_cache
+        return blacklist_cache.is_blacklisted(jti)
     except Exception:
         return False
 
 
+def _is_token_version_current(payload):
+    """Check the token's tv claim against the user's current token version"""
+    try:
+        from token_versions import is_token_version_current
+        return is_token_version_current(payload)
+    except Exception:
+        return True
+
+
+def revoke_all_tokens(user_id):
+    """Log a user out everywhere by bumping their token version"""
+    from db_session import session_scope
+    from token_versions import revoke_user_tokens
+    with session_scope() as db:
+        return revoke_user_tokens(db, user_id)
+
+
 def blacklist_token(jti, token_type="access", user_id=None, expires_at=None):
     """Add a token to the blacklist"""
     try:
-        from database import SessionLocal, BlacklistedToken
-        db = SessionLocal()
-        try:
-            entry = BlacklistedToken(
-                jti=jti,
-                token_type=token_type,
-                user_id=user_id,
-                expires_at=expires_at,
-            )
-            db.add(entry)
-            db.commit()
-            return True
-        except Exception:
-            db.rollback()
-            return False
-        finally:
-            db.close()
+        from database import BlacklistedToken
+        from db_session import session_scope
+        with session_scope() as db:
+            try:
+                entry = BlacklistedToken(
+                    jti=jti,
+                    token_type=token_type,
+                    user_id=user_id,
+                    expires_at=expires_at,
+                )
+                db.add(entry)
+                db.commit()
+            except Exception:
+                db.rollback()
+                return False
+        from token_blacklist import blacklist_cache
+        blacklist_cache.add(jti)
+        return True
     except Exception:
         return False
 
@@ -198,7 +287,8 @@ def refresh_access_token(refresh_token_str):
     user_id = payload.get("user_id")
     role = payload.get("role")
     
-    new_access_token = generate_access_token(user_id, role)
+    # The refresh token passed the version check, so its tv is current
+    new_access_token = generate_access_token(user_id, role, payload.get("tv"))
     return new_access_token, None
 
 
@@ -206,13 +296,14 @@ def refresh_access_token(refresh_token_str):
 # DECORATORS
 # =============================================================================
 
-def jwt_required():
+def jwt_required(allow_headers=True):
     """
     Decorator that verifies the JWT access token.
     Sets request.user_id, request.user_role, request.permissions.
     
     Backward compatible: falls back to X-User-ID / X-User-Role headers
     if no Authorization header is present (for migration period).
+    allow_headers=False requires the Bearer token.
     """
     def wrapper(fn):
         @wraps(fn)
@@ -228,8 +319,10 @@ def jwt_required():
                 
                 request.user_id = payload["user_id"]
                 request.user_role = payload["role"]
-                request.permissions = payload.get("permissions", [])
+                request.permissions = permissions_from_payload(payload)
                 request.token_jti = payload.get("jti")
+            elif not allow_headers:
+                return jsonify({"message": "Bearer token required"}), 401
             else:
                 # Backward compatibility: use headers during migration
                 user_id = request.headers.get("X-User-ID")
@@ -244,7 +337,7 @@ def jwt_required():
                     return jsonify({"message": "Invalid user ID"}), 401
                 
                 request.user_role = user_role
-                request.permissions = ROLE_PERMISSIONS.get(user_role, [])
+                request.permissions = ROLE_PERMISSION_SETS.get(user_role, frozenset())
                 request.token_jti = None
             
             return fn(*args, **kwargs)
@@ -261,23 +354,22 @@ def role_required(*roles):
     """
     # Normalize required roles to lowercase
     required_roles = [r.lower() for r in roles]
-    
-    import os
-    log_file = os.path.join(os.path.dirname(__file__), "debug_auth.log")
 
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
             user_id = getattr(request, 'user_id', None)
             user_role = getattr(request, 'user_role', None)
-            
-            with open(log_file, "a") as f_log:
-                f_log.write(f"{datetime.now()}: Checking role. Required: {required_roles}, Actual: {user_role}, UserID: {user_id}, Headers: {dict(request.headers)}\n")
-            
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Role check on %s: required %s, actual %s, user %s",
+                             request.path, required_roles, user_role, user_id,
+                             extra={"headers": redact_headers(request.headers)})
+
             # Case-insensitive comparison
             if not user_role or user_role.lower() not in required_roles:
-                with open(log_file, "a") as f_log:
-                    f_log.write(f"{datetime.now()}: ACCESS DENIED\n")
+                logger.warning("Access denied on %s: required role %s, actual %s, user %s",
+                               request.path, required_roles, user_role, user_id)
                 return jsonify({
                     "message": f"Access denied. Required role: {', '.join(roles)}"
                 }), 403
@@ -294,12 +386,14 @@ def permission_required(*permissions):
     Usage: @permission_required('leave:approve')
            @permission_required('employee:read', 'employee:write')
     """
+    required = frozenset(permissions)
+
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            user_permissions = getattr(request, 'permissions', [])
-            missing = [p for p in permissions if p not in user_permissions]
-            if missing:
+            user_permissions = getattr(request, 'permissions', frozenset())
+            if not required.issubset(user_permissions):
+                missing = [p for p in permissions if p not in user_permissions]
                 return jsonify({
                     "message": f"Permission denied. Missing: {', '.join(missing)}"
                 }), 403
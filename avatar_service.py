@@ -0,0 +1,219 @@
+"""
+Avatar Thumbnails for Stafio
+============================
+GET /api/avatar/<user_id>?size=N returns a square thumbnail of the user's
+profile picture instead of the full upload the UI used to scale down:
+
+  - the stored picture (media_store.py) is decoded, cropped and resized
+    with Pillow in a process pool (CPU work stays off the gthread request
+    threads and outside the GIL) and encoded as WebP;
+  - each (picture, size) variant is written once under AVATAR_CACHE_ROOT
+    and served from disk afterwards;
+  - users without a stored picture get a deterministic initials SVG
+    generated here (no more ui-avatars.com requests). External image URLs
+    are never fetched or redirected to.
+
+avatar_url() links work in a plain <img src>: instead of the
+Authorization header they carry `exp` and `sig`, an HMAC over (user id,
+size, v, exp) that the API hands out only in authenticated responses.
+`exp` is rounded to AVATAR_URL_TTL_SECONDS so the URL, and the browser's
+cached copy, stays the same for a while; links are valid for one to two
+TTLs.
+
+Requested sizes are rounded up to one of AVATAR_SIZES so the number of
+variants per picture stays bounded. avatar_url() adds a `v` parameter that
+changes with the picture (or the name, for initials), so responses to
+versioned URLs can be cached as immutable until they expire.
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html import escape
+from multiprocessing import get_all_start_methods, get_context
+
+from PIL import Image, ImageOps
+
+import auth
+import media_store
+
+logger = logging.getLogger(__name__)
+
+AVATAR_CACHE_ROOT = os.getenv('AVATAR_CACHE_ROOT', os.path.join(media_store.MEDIA_ROOT, 'avatars'))
+AVATAR_SIZES = (32, 40, 48, 64, 80, 96, 128, 192, 256, 512)
+# lists render 40px avatars: 80 covers 2x screens
+LIST_AVATAR_SIZE = int(os.getenv('AVATAR_LIST_SIZE', '80'))
+POOL_WORKERS = int(os.getenv('AVATAR_POOL_WORKERS', '2'))
+RENDER_TIMEOUT_SECONDS = float(os.getenv('AVATAR_RENDER_TIMEOUT_SECONDS', '10'))
+WEBP_QUALITY = int(os.getenv('AVATAR_WEBP_QUALITY', '80'))
+# signed avatar_url() links (default secret: the JWT secret)
+URL_SECRET = (os.getenv('AVATAR_URL_SECRET') or auth.JWT_SECRET).encode()
+URL_TTL_SECONDS = int(os.getenv('AVATAR_URL_TTL_SECONDS', '86400'))
+
+# initials background colours, picked by a hash of the user id
+PALETTE = ('#1abc9c', '#2e86de', '#8e44ad', '#e67e22', '#c0392b', '#16a085', '#2c3e50', '#d35400', '#7f8c8d', '#27ae60')
+
+
+def pick_size(requested):
+    """Smallest supported size >= requested (LIST_AVATAR_SIZE when missing)"""
+    if not requested:
+        requested = LIST_AVATAR_SIZE
+    for size in AVATAR_SIZES:
+        if size >= requested:
+            return size
+    return AVATAR_SIZES[-1]
+
+
+# =============================================================================
+# RESIZING (process pool)
+# =============================================================================
+
+def render_variant(source_path, target_path, size):
+    """Crop/resize source to a size x size WebP at target_path (runs in a pool process)"""
+    with Image.open(source_path) as image:
+        image.draft('RGB', (size * 2, size * 2))  # JPEG: decode at reduced scale
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+        os.replace(tmp_path, target_path)
+    return target_path
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _mp_context():
+    # Not fork: forking a process that runs request and listener threads is
+    # unsafe. The fork server starts clean, imports this module (and Pillow)
+    # once and forks the pool processes from there.
+    if 'forkserver' in get_all_start_methods():
+        context = get_context('forkserver')
+        context.set_forkserver_preload(['avatar_service'])
+        return context
+    return get_context('spawn')
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=_mp_context())
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def variant_path(digest, size):
+    return os.path.join(AVATAR_CACHE_ROOT, digest[:2], f"{digest}-{size}.webp")
+
+
+def get_variant(digest, size):
+    """Path of the WebP thumbnail of a stored picture, rendered on first use"""
+    target = variant_path(digest, size)
+    if os.path.exists(target):
+        return target
+    try:
+        future = _get_pool().submit(render_variant, media_store.store.path(digest), target, size)
+        return future.result(timeout=RENDER_TIMEOUT_SECONDS)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+
+
+def source_digest(profile_image):
+    """Media store digest of a profile_image value (legacy data URLs are stored first)"""
+    digest = media_store.digest_from_value(profile_image)
+    if digest is None and profile_image and profile_image.startswith('data:'):
+        try:
+            _mime, data = media_store.decode_data_url(profile_image)
+        except ValueError:
+            return None
+        digest, _size = media_store.store.save_bytes(data)
+    if digest is None or not media_store.store.exists(digest):
+        return None
+    return digest
+
+
+# =============================================================================
+# INITIALS
+# =============================================================================
+
+def initials(first_name, last_name, username):
+    parts = [p for p in (first_name, last_name) if p and p.strip()]
+    if not parts:
+        parts = (username or '?').replace('.', ' ').replace('_', ' ').split()[:2] or ['?']
+    return ''.join(p.strip()[0] for p in parts).upper()[:2]
+
+
+def initials_svg(user_id, text, size):
+    """Deterministic initials avatar"""
+    color = PALETTE[int(hashlib.sha1(str(user_id).encode()).hexdigest(), 16) % len(PALETTE)]
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 100 100">'
+        f'<rect width="100" height="100" fill="{color}"/>'
+        f'<text x="50" y="50" dy=".35em" text-anchor="middle" fill="#fff" '
+        f'font-family="Helvetica, Arial, sans-serif" font-size="42" font-weight="600">{escape(text)}</text>'
+        f'</svg>'
+    )
+
+
+# =============================================================================
+# URLS
+# =============================================================================
+
+def avatar_version(profile_image, name):
+    """Changes whenever the avatar would: the picture's hash, else the name"""
+    digest = media_store.digest_from_value(profile_image)
+    if digest:
+        return digest[:12]
+    # legacy data URLs are rendered too; anything else (e.g. external URLs) gets initials
+    source = profile_image if profile_image and profile_image.startswith('data:') else f"initials:{name}"
+    return hashlib.sha256(source.encode()).hexdigest()[:12]
+
+
+# =============================================================================
+# SIGNED URLS
+# =============================================================================
+
+def url_signature(user_id, size, version, expires):
+    message = f"{user_id}:{size}:{version}:{expires}".encode()
+    return hmac.new(URL_SECRET, message, hashlib.sha256).hexdigest()[:32]
+
+
+def avatar_url(user_id, profile_image=None, name='', size=LIST_AVATAR_SIZE):
+    """Absolute, versioned and signed /api/avatar URL of a user"""
+    version = avatar_version(profile_image, name)
+    # at least one full TTL left, and the same value for everyone within a TTL
+    expires = (int(time.time()) // URL_TTL_SECONDS + 2) * URL_TTL_SECONDS
+    signature = url_signature(user_id, size, version, expires)
+    return media_store.absolute_url(f"/api/avatar/{user_id}?size={size}&v={version}&exp={expires}&sig={signature}")
+
+
+def check_url(user_id, args):
+    """Seconds until a signed avatar URL (its query args) expires, None if it is invalid or expired"""
+    try:
+        expires = int(args.get('exp', ''))
+    except ValueError:
+        return None
+    expected = url_signature(user_id, args.get('size', ''), args.get('v', ''), expires)
+    if not hmac.compare_digest(expected, args.get('sig', '')):
+        return None
+    remaining = expires - int(time.time())
+    return remaining if remaining > 0 else None
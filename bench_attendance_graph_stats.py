@@ -0,0 +1,205 @@
+"""
+Benchmark: /api/attendance_graph_stats before vs after
+
+Seeds a scratch schema with users + attendance rows (1,000,000 by default),
+then times the old per-bucket COUNT implementation against
+dashboard_stats.compute_attendance_graph_stats() for the global (admin) view
+and for a single user, reporting the number of SQL statements and latency.
+
+The data lives in its own schema (dropped at the end unless --keep), so it
+can be pointed at a development database without touching real tables.
+
+Usage:
+    python bench_attendance_graph_stats.py
+    python bench_attendance_graph_stats.py --rows 200000 --repeat 3
+    python bench_attendance_graph_stats.py --database-url postgresql://... --keep
+"""
+
+import argparse
+import calendar
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from database import DATABASE_URL, Base, User, Attendance
+from dashboard_stats import compute_attendance_graph_stats
+
+SCHEMA = "bench_attendance_graph"
+
+
+# =============================================================================
+# PREVIOUS IMPLEMENTATION (17 COUNT queries + 1 User count)
+# =============================================================================
+
+def legacy_attendance_graph_stats(db, today, target_id=None):
+    """Verbatim logic of the endpoint before it was moved to dashboard_stats"""
+    is_individual = target_id is not None
+    total_users_count = max(1, db.query(User).count())
+
+    query = db.query(Attendance)
+    if is_individual:
+        query = query.filter(Attendance.user_id == target_id)
+
+    months_data = []
+    for i in range(5, -1, -1):
+        m = today.month - i
+        y = today.year
+        while m <= 0:
+            m += 12
+            y -= 1
+        month_start = date(y, m, 1)
+        if m == 12:
+            month_end = date(y + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(y, m + 1, 1) - timedelta(days=1)
+
+        present_count = query.filter(
+            Attendance.date >= month_start,
+            Attendance.date <= month_end,
+            Attendance.check_in.isnot(None)
+        ).count()
+
+        if y == today.year and m == today.month:
+            expected_per_user = min(22, max(1, (today.day * 5) // 7))
+        else:
+            expected_per_user = 22
+
+        denominator = expected_per_user if is_individual else expected_per_user * total_users_count
+        percent = min(100, (present_count / max(1, denominator)) * 100)
+        months_data.append({"label": calendar.month_abbr[m], "value": round(percent)})
+
+    weeks_data = []
+    for i in range(3, -1, -1):
+        start_week = today - timedelta(days=today.weekday()) - timedelta(days=7 * i)
+        end_week = start_week + timedelta(days=6)
+        present_count = query.filter(
+            Attendance.date >= start_week,
+            Attendance.date <= end_week,
+            Attendance.check_in.isnot(None)
+        ).count()
+        denominator = 5 if is_individual else 5 * total_users_count
+        percent = min(100, (present_count / max(1, denominator)) * 100)
+        weeks_data.append({"label": f"W{4 - i}", "value": round(percent)})
+
+    days_data = []
+    monday = today - timedelta(days=today.weekday())
+    for i in range(7):
+        target_day = monday + timedelta(days=i)
+        count = query.filter(
+            Attendance.date == target_day,
+            Attendance.check_in.isnot(None)
+        ).count()
+        if is_individual:
+            value = 100 if count > 0 else 0
+        else:
+            value = round((count / total_users_count) * 100)
+        days_data.append({"label": calendar.day_abbr[target_day.weekday()], "value": value})
+
+    return {"months": months_data, "weeks": weeks_data, "days": days_data}
+
+
+# =============================================================================
+# SEEDING
+# =============================================================================
+
+def seed(engine, rows, users):
+    """Create the scratch schema and fill it with `rows` attendance records"""
+    days = max(1, rows // users)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    Base.metadata.create_all(engine, tables=[User.__table__, Attendance.__table__])
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO users (username, password_hash, email, role, created_at)
+            SELECT 'bench' || g, 'x', 'bench' || g || '@example.com', 'employee', now()
+            FROM generate_series(1, :users) AS g
+        """), {"users": users})
+        # ~90% of rows have a check-in, like a real attendance table
+        conn.execute(text("""
+            INSERT INTO attendance (user_id, date, check_in, status)
+            SELECT u.id,
+                   d::date,
+                   CASE WHEN random() < 0.9 THEN d + interval '9 hours' END,
+                   'On Time'
+            FROM users u
+            CROSS JOIN generate_series(CURRENT_DATE - (:days - 1), CURRENT_DATE, interval '1 day') AS d
+        """), {"days": days})
+        conn.execute(text("ANALYZE users"))
+        conn.execute(text("ANALYZE attendance"))
+        return conn.execute(text("SELECT count(*) FROM attendance")).scalar()
+
+
+# =============================================================================
+# TIMING
+# =============================================================================
+
+def measure(engine, Session, fn, today, target_id, repeat):
+    """Run fn `repeat` times; return (result, statements per call, latencies in ms)"""
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        latencies = []
+        result = None
+        for _ in range(repeat):
+            statements.clear()
+            db = Session()
+            try:
+                started = time.perf_counter()
+                result = fn(db, today, target_id)
+                latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                db.close()
+        return result, len(statements), latencies
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="attendance rows to seed")
+    parser.add_argument("--users", type=int, default=2000, help="users to spread the rows over")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per implementation")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema afterwards")
+    args = parser.parse_args()
+
+    engine = create_engine(
+        args.database_url,
+        connect_args={"options": f"-csearch_path={SCHEMA}"}
+    )
+    Session = sessionmaker(bind=engine)
+
+    try:
+        print(f"Seeding {args.rows:,} attendance rows for {args.users:,} users into schema '{SCHEMA}'...")
+        started = time.perf_counter()
+        seeded = seed(engine, args.rows, args.users)
+        print(f"Seeded {seeded:,} rows in {time.perf_counter() - started:.1f}s\n")
+
+        today = date.today()
+        print(f"{'view':<12} {'implementation':<16} {'queries':>8} {'median ms':>10} {'min ms':>10}")
+        for view, target_id in [("global", None), ("individual", 1)]:
+            results = []
+            for name, fn in [("before (legacy)", legacy_attendance_graph_stats),
+                             ("after", compute_attendance_graph_stats)]:
+                result, queries, latencies = measure(engine, Session, fn, today, target_id, args.repeat)
+                results.append(result)
+                print(f"{view:<12} {name:<16} {queries:>8} {statistics.median(latencies):>10.1f} {min(latencies):>10.1f}")
+            print(f"{view:<12} identical output: {results[0] == results[1]}")
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: JWT permission claims before vs after
+
+Compares access tokens carrying the full ROLE_PERMISSIONS list (before)
+with the compact role + bitmask + table version claims (after):
+  - size of the Authorization header per role;
+  - cost per request of @jwt_required() + @permission_required(...) around
+    an empty view (token decode, permission resolution, permission check).
+
+Revocation checks (token version / blacklist) are switched off for the
+timing so only the claim handling is measured; no database is needed.
+
+Usage:
+    python bench_jwt_claims.py
+    python bench_jwt_claims.py --requests 50000
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+import jwt
+from flask import Flask, request, jsonify
+
+import auth
+
+
+# =============================================================================
+# PREVIOUS IMPLEMENTATION (full permission list, list scans)
+# =============================================================================
+
+def legacy_generate_access_token(user_id, role):
+    """Verbatim payload of generate_access_token before the compact claims"""
+    payload = {
+        "user_id": user_id,
+        "role": role,
+        "permissions": auth.ROLE_PERMISSIONS.get(role, []),
+        "type": "access",
+        "jti": str(uuid.uuid4()),
+        "iat": datetime.utcnow(),
+        "exp": datetime.utcnow() + timedelta(minutes=auth.ACCESS_EXPIRY_MINUTES),
+    }
+    return jwt.encode(payload, auth.JWT_SECRET, algorithm="HS256")
+
+
+def legacy_jwt_required():
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            token = request.headers.get("Authorization", "").split(" ", 1)[1]
+            payload = auth.verify_token(token, expected_type="access")
+            if not payload:
+                return jsonify({"message": "Invalid or expired token"}), 401
+            request.user_id = payload["user_id"]
+            request.user_role = payload["role"]
+            request.permissions = payload.get("permissions", [])
+            request.token_jti = payload.get("jti")
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
+
+
+def legacy_permission_required(*permissions):
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            user_permissions = getattr(request, 'permissions', [])
+            missing = [p for p in permissions if p not in user_permissions]
+            if missing:
+                return jsonify({"message": f"Permission denied. Missing: {', '.join(missing)}"}), 403
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
+
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+
+REQUIRED = ("leave:approve", "report:read", "employee:read")
+
+
+def build_views():
+    def view():
+        return "ok"
+
+    before = legacy_jwt_required()(legacy_permission_required(*REQUIRED)(view))
+    after = auth.jwt_required()(auth.permission_required(*REQUIRED)(view))
+    return before, after
+
+
+def time_view(app, view, token, requests, rounds):
+    headers = {"Authorization": f"Bearer {token}"}
+    per_request = []
+    with app.test_request_context("/bench", headers=headers):
+        assert view() == "ok"
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(requests):
+                view()
+            per_request.append((time.perf_counter() - started) / requests * 1e6)
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="decorated calls per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    # Measure claim handling only
+    auth.USE_TOKEN_VERSIONS = False
+    auth.USE_JTI_BLACKLIST = False
+
+    print(f"{'role':<10} {'header bytes before':>20} {'after':>8}")
+    for role in auth.ROLE_PERMISSIONS:
+        before = len("Bearer " + legacy_generate_access_token(1, role))
+        after = len("Bearer " + auth.generate_access_token(1, role))
+        print(f"{role:<10} {before:>20} {after:>8}")
+
+    app = Flask(__name__)
+    before_view, after_view = build_views()
+    old_token = legacy_generate_access_token(1, "admin")
+    new_token = auth.generate_access_token(1, "admin")
+
+    print(f"\n@jwt_required + @permission_required({len(REQUIRED)}) per request, admin token")
+    print(f"{'implementation':<16} {'median us':>10} {'min us':>10}")
+    for name, view, token in [("before", before_view, old_token), ("after", after_view, new_token)]:
+        latencies = time_view(app, view, token, args.requests, args.rounds)
+        print(f"{name:<16} {statistics.median(latencies):>10.2f} {min(latencies):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
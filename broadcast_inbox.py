@@ -0,0 +1,148 @@
+"""
+Broadcast Inbox for Stafio (fan-out on read)
+============================================
+Broadcasts/announcements are not copied into `notifications` once per
+user. GET /api/notifications computes them at read time from the active
+Broadcast rows matching the user's audience (announcements, and broadcasts
+posted with send_notifications) and merges them with the
+user's direct notifications, so storage grows with the number of
+announcements, not announcements x headcount.
+
+Read state per user is
+  - users.last_seen_broadcast_id: every broadcast with id <= it is read;
+  - broadcast_read_exceptions: the few broadcasts above the watermark the
+    user read out of order.
+Marking broadcasts read moves the watermark up over the run of read ones
+and drops the exceptions it now covers, so the set stays small.
+
+Broadcasts created before the user's account are not shown (users never
+got notifications for those before either). Broadcast items carry the id
+"broadcast-<id>", marked read with PUT /api/notifications/broadcast-<id>/read.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+
+from database import Broadcast, BroadcastReadException, User
+
+
+ANNOUNCEMENT_LINK = "/employee/dashboard"
+
+
+def audiences_for_role(role):
+    """Broadcast.target_audience values addressed to a user with this role"""
+    audiences = ['all']
+    if role == 'employee':
+        audiences.append('employees')
+    elif role == 'admin':
+        audiences.append('admins')
+    return audiences
+
+
+def visible_broadcasts(db, user):
+    """Query of the active broadcasts sent as notifications to this user"""
+    query = db.query(Broadcast).filter(
+        Broadcast.is_active == True,
+        Broadcast.send_notifications == True,
+        or_(Broadcast.expires_at == None, Broadcast.expires_at > datetime.utcnow()),
+        Broadcast.target_audience.in_(audiences_for_role(user.role)),
+    )
+    if user.created_at is not None:
+        query = query.filter(Broadcast.created_at >= user.created_at)
+    return query
+
+
+def read_exceptions(db, user, broadcast_ids=None):
+    """Ids above the watermark this user has read"""
+    query = db.query(BroadcastReadException.broadcast_id).filter(
+        BroadcastReadException.user_id == user.id,
+        BroadcastReadException.broadcast_id > user.last_seen_broadcast_id,
+    )
+    if broadcast_ids is not None:
+        query = query.filter(BroadcastReadException.broadcast_id.in_(broadcast_ids))
+    return {row.broadcast_id for row in query}
+
+
+def broadcast_notification(broadcast, is_read):
+    """A broadcast shaped like an item of GET /api/notifications"""
+    message = broadcast.message or ''
+    if broadcast.event_name:
+        # Announcements (admin_endpoints.create_announcement)
+        title = f"New Announcement: {broadcast.title}"
+        message = message[:100] + ("..." if len(message) > 100 else "")
+        link = ANNOUNCEMENT_LINK
+    else:
+        title = broadcast.title
+        link = None
+    return {
+        "id": f"broadcast-{broadcast.id}",
+        "broadcast_id": broadcast.id,
+        "title": title,
+        "message": message,
+        "type": "broadcast",
+        "is_read": is_read,
+        "link": link,
+        "created_at": broadcast.created_at.isoformat() if broadcast.created_at else None,
+    }
+
+
+def list_broadcast_notifications(db, user, limit=50):
+    """The user's newest `limit` broadcasts as notification items"""
+    broadcasts = visible_broadcasts(db, user).order_by(Broadcast.id.desc()).limit(limit).all()
+    unseen = [b.id for b in broadcasts if b.id > user.last_seen_broadcast_id]
+    read = read_exceptions(db, user, unseen) if unseen else set()
+    return [
+        broadcast_notification(b, b.id <= user.last_seen_broadcast_id or b.id in read)
+        for b in broadcasts
+    ]
+
+
+# =============================================================================
+# READ STATE
+# =============================================================================
+
+def _advance_watermark(db, user, watermark):
+    """Raise last_seen_broadcast_id (never lowers it) and drop covered exceptions"""
+    db.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(last_seen_broadcast_id=func.greatest(User.last_seen_broadcast_id, watermark))
+    )
+    db.query(BroadcastReadException).filter(
+        BroadcastReadException.user_id == user.id,
+        BroadcastReadException.broadcast_id <= watermark,
+    ).delete(synchronize_session=False)
+    db.refresh(user, ['last_seen_broadcast_id'])
+
+
+def mark_broadcast_read(db, user, broadcast_id):
+    """Record one broadcast as read for the user"""
+    if broadcast_id <= user.last_seen_broadcast_id:
+        return
+    db.execute(
+        insert(BroadcastReadException)
+        .values(user_id=user.id, broadcast_id=broadcast_id)
+        .on_conflict_do_nothing()
+    )
+
+    # Compact: move the watermark over the unread-free run above it
+    read = read_exceptions(db, user)
+    pending = visible_broadcasts(db, user).with_entities(Broadcast.id).filter(
+        Broadcast.id > user.last_seen_broadcast_id
+    ).order_by(Broadcast.id).limit(len(read) + 1)
+    watermark = user.last_seen_broadcast_id
+    for row in pending:
+        if row.id not in read:
+            break
+        watermark = row.id
+    if watermark > user.last_seen_broadcast_id:
+        _advance_watermark(db, user, watermark)
+
+
+def mark_all_broadcasts_read(db, user):
+    """Everything broadcast so far is read for the user"""
+    latest = db.query(func.max(Broadcast.id)).scalar()
+    if latest:
+        _advance_watermark(db, user, latest)
@@ -0,0 +1,288 @@
+"""
+Dashboard Statistics for Stafio
+===============================
+Aggregations behind the dashboard charts. Each chart is computed with a
+single conditional-aggregation query (COUNT/SUM ... FILTER (WHERE ...) per
+bucket) instead of one query per bucket.
+"""
+
+import calendar
+from datetime import date, timedelta
+
+from sqlalchemy import func, select, and_
+
+from database import User, Attendance, LeaveRequest, LeaveBalance
+from holiday_calendar import holidays_between
+
+
+# =============================================================================
+# EMPLOYEE DASHBOARD CARDS
+# =============================================================================
+
+def compute_employee_dashboard(db, user_id, today):
+    """
+    Counters for the employee dashboard cards, from one query.
+
+    The attendance counts are conditional aggregates over the user's rows of
+    the current year; leave balance and leaves taken ride along as scalar
+    subqueries. Every date predicate is a plain range (no EXTRACT(year ...))
+    so the (user_id, date) indexes can be used. This week's holidays come
+    from the cached holiday calendar.
+    """
+    year_start = date(today.year, 1, 1)
+    next_year_start = date(today.year + 1, 1, 1)
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+
+    total_leaves = select(func.sum(LeaveBalance.balance)).where(
+        LeaveBalance.user_id == user_id,
+        LeaveBalance.year == today.year
+    ).scalar_subquery()
+
+    leaves_taken = select(func.sum(LeaveRequest.num_days)).where(
+        LeaveRequest.user_id == user_id,
+        LeaveRequest.status == 'approved',
+        LeaveRequest.start_date >= year_start,
+        LeaveRequest.start_date < next_year_start
+    ).scalar_subquery()
+
+    query = select(
+        total_leaves.label('total_leaves'),
+        leaves_taken.label('leaves_taken'),
+        func.count(Attendance.id).filter(Attendance.status == 'Absent').label('absent_days'),
+        func.count(Attendance.id).filter(Attendance.status.in_(['On Time', 'Late Login'])).label('worked_days')
+    ).where(
+        Attendance.user_id == user_id,
+        Attendance.date >= year_start,
+        Attendance.date < next_year_start
+    )
+
+    row = db.execute(query).one()
+    return {
+        "total_leaves": float(row.total_leaves) if row.total_leaves else 0,
+        "leaves_taken": int(row.leaves_taken) if row.leaves_taken else 0,
+        "absent_days": row.absent_days or 0,
+        "worked_days": row.worked_days or 0,
+        "completed_projects": 0,
+        "this_week_holiday": len(holidays_between(db, week_start, week_end, source='custom'))
+    }
+
+
+# =============================================================================
+# ATTENDANCE GRAPH (months / weeks / days)
+# =============================================================================
+
+def _month_buckets(today):
+    """(label, start, end, expected_per_user) for the last 6 months, oldest first"""
+    buckets = []
+    for i in range(5, -1, -1):
+        m = today.month - i
+        y = today.year
+        while m <= 0:
+            m += 12
+            y -= 1
+
+        month_start = date(y, m, 1)
+        if m == 12:
+            month_end = date(y + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(y, m + 1, 1) - timedelta(days=1)
+
+        # Expected working days: the current month only counts up to today
+        if y == today.year and m == today.month:
+            expected_per_user = min(22, max(1, (today.day * 5) // 7))
+        else:
+            expected_per_user = 22
+
+        buckets.append((calendar.month_abbr[m], month_start, month_end, expected_per_user))
+    return buckets
+
+
+def _week_buckets(today):
+    """(label, start, end) for the last 4 Monday-Sunday weeks, oldest first"""
+    buckets = []
+    for i in range(3, -1, -1):
+        start_week = today - timedelta(days=today.weekday()) - timedelta(days=7 * i)
+        buckets.append((f"W{4 - i}", start_week, start_week + timedelta(days=6)))
+    return buckets
+
+
+def _day_buckets(today):
+    """(label, day) for Monday..Sunday of the current week"""
+    monday = today - timedelta(days=today.weekday())
+    days = [monday + timedelta(days=i) for i in range(7)]
+    return [(calendar.day_abbr[d.weekday()], d) for d in days]
+
+
+def compute_attendance_graph_stats(db, today, target_id=None):
+    """
+    Attendance percentages for the dashboard graph.
+
+    target_id=None computes the organisation-wide view (present counts are
+    divided by the number of users), otherwise the view of one user.
+
+    All 17 buckets plus the user count come from one query over the
+    attendance rows in the covered date range.
+    """
+    is_individual = target_id is not None
+
+    months = _month_buckets(today)
+    weeks = _week_buckets(today)
+    days = _day_buckets(today)
+
+    range_start = min(months[0][1], weeks[0][1], days[0][1])
+    range_end = max(months[-1][2], weeks[-1][2], days[-1][1])
+
+    columns = []
+    for label, start, end, expected in months:
+        columns.append(func.count().filter(Attendance.date.between(start, end)))
+    for label, start, end in weeks:
+        columns.append(func.count().filter(Attendance.date.between(start, end)))
+    for label, day in days:
+        columns.append(func.count().filter(Attendance.date == day))
+    columns.append(select(func.count(User.id)).scalar_subquery())
+
+    query = select(*columns).where(
+        Attendance.date >= range_start,
+        Attendance.date <= range_end,
+        Attendance.check_in.isnot(None)
+    )
+    if is_individual:
+        query = query.where(Attendance.user_id == target_id)
+
+    row = db.execute(query).one()
+    month_counts = row[:len(months)]
+    week_counts = row[len(months):len(months) + len(weeks)]
+    day_counts = row[len(months) + len(weeks):-1]
+    total_users_count = max(1, row[-1] or 0)
+
+    months_data = []
+    for (label, start, end, expected), present_count in zip(months, month_counts):
+        denominator = expected if is_individual else expected * total_users_count
+        percent = min(100, (present_count / max(1, denominator)) * 100)
+        months_data.append({"label": label, "value": round(percent)})
+
+    weeks_data = []
+    for (label, start, end), present_count in zip(weeks, week_counts):
+        denominator = 5 if is_individual else 5 * total_users_count
+        percent = min(100, (present_count / max(1, denominator)) * 100)
+        weeks_data.append({"label": label, "value": round(percent)})
+
+    days_data = []
+    for (label, day), count in zip(days, day_counts):
+        if is_individual:
+            value = 100 if count > 0 else 0
+        else:
+            value = round((count / total_users_count) * 100)
+        days_data.append({"label": label, "value": value})
+
+    return {
+        "months": months_data,
+        "weeks": weeks_data,
+        "days": days_data
+    }
+
+
+# =============================================================================
+# LEAVE STATS (months / weeks of month / weekdays)
+# =============================================================================
+
+def _leave_month_buckets(today):
+    """(label, start, end) for the last 5 months including the current one"""
+    buckets = []
+    for offset in range(4, -1, -1):
+        m = today.month - offset
+        y = today.year
+        while m <= 0:
+            m += 12
+            y -= 1
+
+        start = date(y, m, 1)
+        if m == 12:
+            next_month = date(y + 1, 1, 1)
+        else:
+            next_month = date(y, m + 1, 1)
+        buckets.append((start.strftime('%b'), start, next_month - timedelta(days=1)))
+    return buckets
+
+
+def _leave_week_buckets(today):
+    """(label, start, end) splitting the current month into W1..W5"""
+    start_of_month = today.replace(day=1)
+    if start_of_month.month == 12:
+        first_next = date(start_of_month.year + 1, 1, 1)
+    else:
+        first_next = date(start_of_month.year, start_of_month.month + 1, 1)
+    month_end = first_next - timedelta(days=1)
+
+    buckets = []
+    ws = start_of_month
+    idx = 1
+    while ws <= month_end and idx <= 5:
+        we = min(ws + timedelta(days=6), month_end)
+        buckets.append((f"W{idx}", ws, we))
+        ws = we + timedelta(days=1)
+        idx += 1
+    return buckets
+
+
+def _leave_day_buckets(today):
+    """(label, day, day) for Monday..Friday of the current week"""
+    monday = today - timedelta(days=today.weekday())
+    days = [monday + timedelta(days=i) for i in range(5)]
+    return [(d.strftime('%a'), d, d) for d in days]
+
+
+def _leave_days_in(start, end):
+    """
+    SUM of approved leave days falling inside [start, end].
+
+    A leave spanning several buckets is split by calendar overlap:
+    num_days * overlapping_days / total_days, so a 4-day leave crossing a
+    month boundary counts 2 + 2 instead of 4 in the month it started in.
+    """
+    overlap = func.least(LeaveRequest.end_date, end) - func.greatest(LeaveRequest.start_date, start) + 1
+    span = LeaveRequest.end_date - LeaveRequest.start_date + 1
+    return func.coalesce(
+        func.sum(LeaveRequest.num_days * overlap / span).filter(
+            and_(LeaveRequest.start_date <= end, LeaveRequest.end_date >= start)
+        ),
+        0
+    )
+
+
+def compute_leave_stats(db, today, user_id=None):
+    """
+    Approved leave days for the last 5 months, the weeks of the current
+    month and the weekdays of the current week, from one query.
+
+    user_id=None aggregates over everyone.
+    """
+    months = _leave_month_buckets(today)
+    weeks = _leave_week_buckets(today)
+    days = _leave_day_buckets(today)
+    buckets = months + weeks + days
+
+    range_start = min(b[1] for b in buckets)
+    range_end = max(b[2] for b in buckets)
+
+    query = select(*[_leave_days_in(start, end) for label, start, end in buckets]).where(
+        LeaveRequest.status == 'approved',
+        LeaveRequest.start_date <= range_end,
+        LeaveRequest.end_date >= range_start
+    )
+    if user_id is not None:
+        query = query.where(LeaveRequest.user_id == user_id)
+
+    row = db.execute(query).one()
+    values = [round(float(v or 0), 2) for v in row]
+
+    month_values = values[:len(months)]
+    week_values = values[len(months):len(months) + len(weeks)]
+    day_values = values[len(months) + len(weeks):]
+
+    return {
+        "months": [{"month": label, "value": v} for (label, s, e), v in zip(months, month_values)],
+        "weeks": [{"label": label, "value": v} for (label, s, e), v in zip(weeks, week_values)],
+        "days": [{"label": label, "value": v} for (label, s, e), v in zip(days, day_values)]
+    }
@@ -1,14 +1,22 @@
 """
 Database configuration and models for PostgreSQL using SQLAlchemy
 """
-from sqlalchemy import create_engine, Column, Integer, String, Text, Date, DateTime, DECIMAL, ForeignKey, Enum, UniqueConstraint, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, Date, DateTime, DECIMAL, ForeignKey, Enum, UniqueConstraint, Boolean, Index, Computed
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy import func, extract
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.pool import QueuePool, NullPool
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy import func, extract, text, event, DDL
+from sqlalchemy.dialects.postgresql import DATERANGE, ExcludeConstraint
 from datetime import datetime, date, timedelta
 import os
+import random
+import re
+from contextlib import contextmanager
 from dotenv import load_dotenv
 from sqlalchemy import Float
+from pool_monitor import InstrumentedQueuePool, InstrumentedNullPool, instrument, pool_status
 
 load_dotenv()
 
@@ -30,11 +38,102 @@ encoded_password = urllib.parse.quote(DB_CONFIG['password'])
 
 DATABASE_URL = f"postgresql://{DB_CONFIG['user']}:{encoded_password}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
 
+# Connection pool (per gunicorn worker), tuned through the environment
+POOL_CONFIG = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+    'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+    # Close connections older than this (seconds) instead of reusing them
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    # Test each connection on checkout so a Postgres restart doesn't surface as errors
+    'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+}
+
+# Behind PgBouncer in transaction mode every transaction may land on a
+# different server connection: PgBouncer does the pooling, so keep no idle
+# connections here and don't rely on session state between transactions.
+PGBOUNCER_TRANSACTION_MODE = os.getenv('DB_PGBOUNCER_TRANSACTION_MODE', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _engine_options(instrumented=True):
+    if PGBOUNCER_TRANSACTION_MODE:
+        return {
+            'poolclass': InstrumentedNullPool if instrumented else NullPool,
+            'pool_pre_ping': POOL_CONFIG['pool_pre_ping'],
+        }
+    return dict(POOL_CONFIG, poolclass=InstrumentedQueuePool if instrumented else QueuePool)
+
+
+def get_pool_status():
+    """Pool occupancy and checkout statistics of this worker process"""
+    config = dict(POOL_CONFIG, pgbouncer_transaction_mode=PGBOUNCER_TRANSACTION_MODE)
+    return pool_status(engine, config)
+
+
 # Create engine
-engine = create_engine(DATABASE_URL, echo=False)
+engine = instrument(create_engine(DATABASE_URL, echo=False, **_engine_options()))
+
+# Optional read replicas, comma separated SQLAlchemy URLs. GET requests read
+# from one of them (see db_session.py); everything else uses the primary.
+REPLICA_URLS = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+replica_engines = [
+    create_engine(url, echo=False, **_engine_options(instrumented=False))
+    for url in REPLICA_URLS
+]
+
+_WRITE_SQL = re.compile(r'^\s*(insert|update|delete|merge|lock|call|select\b.*\bfor\s+(update|share)|select\s+pg_notify)\b', re.I | re.S)
+
+
+def _is_write(clause):
+    if isinstance(clause, UpdateBase):
+        return True
+    if isinstance(clause, TextClause):
+        return bool(_WRITE_SQL.match(clause.text))
+    # SELECT ... FOR UPDATE locks rows, which only the primary can do
+    return getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """
+    Session that can read from a replica.
+
+    Only after use_replica() is called: reads then go to the replica engine
+    until the first write (flush, DML, SELECT ... FOR UPDATE); from there on
+    the session sticks to the primary so it reads its own writes.
+    """
+    replica = None
+    wrote = False
+
+    def use_replica(self, replica=None):
+        if replica is None and replica_engines:
+            replica = random.choice(replica_engines)
+        self.replica = replica
+
+    def use_primary(self):
+        self.replica = None
+
+    @contextmanager
+    def primary_reads(self):
+        """Run the block's reads on the primary, then go back to the replica (unless it wrote)"""
+        replica = self.replica
+        self.replica = None
+        try:
+            yield self
+        finally:
+            if not self.wrote:
+                self.replica = replica
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or _is_write(clause):
+            self.wrote = True
+            self.replica = None
+        elif self.replica is not None:
+            return self.replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 
 # Database dependency
 def get_db():
@@ -59,6 +158,10 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     phone = Column(String(20), unique=True)
     theme = Column(String(20))
+    # Bumped to revoke every token issued so far (see token_versions.py)
+    token_version = Column(Integer, nullable=False, default=0, server_default='0')
+    # Broadcasts with id <= this are read (plus broadcast_read_exceptions, see broadcast_inbox.py)
+    last_seen_broadcast_id = Column(Integer, nullable=False, default=0, server_default='0')
 
     
     # Relationships
@@ -122,6 +225,8 @@ class LeaveRequest(Base):
     # NEW: Approver workflow fields
     approver_type = Column(String(20), default='admin')  # 'admin' or 'manager'
     designated_approver_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    # Inclusive [start_date, end_date] range, computed by PostgreSQL
+    period = Column(DATERANGE, Computed("daterange(start_date, end_date, '[]')", persisted=True))
 
     # Relationships
     user = relationship("User", foreign_keys=[user_id])
@@ -129,6 +234,28 @@ class LeaveRequest(Base):
     approver = relationship("User", foreign_keys=[approved_by])
     designated_approver = relationship("User", foreign_keys=[designated_approver_id])
 
+    __table_args__ = (
+        Index('ix_leave_requests_user_status', 'user_id', 'status'),
+        Index('ix_leave_requests_status_applied', 'status', 'applied_date'),
+        Index('ix_leave_requests_user_dates', 'user_id', 'start_date', 'end_date'),
+        Index('ix_leave_requests_approved_dates', 'start_date', 'end_date',
+              postgresql_where=text("status = 'approved'")),
+        # No two pending/approved requests of one user may share a day
+        ExcludeConstraint(
+            ('user_id', '='), ('period', '&&'),
+            name='excl_leave_requests_user_period',
+            using='gist',
+            where=text("status IN ('pending', 'approved')")
+        ),
+    )
+
+
+# user_id WITH = inside a GiST index needs the btree_gist operator classes
+event.listen(
+    LeaveRequest.__table__, 'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist")
+)
+
 
 class OTP(Base):
     __tablename__ = 'otps'
@@ -140,6 +267,11 @@ class OTP(Base):
     expires_at = Column(DateTime, nullable=False)
     is_used = Column(Integer, default=0)  # 0 = not used, 1 = used
 
+    __table_args__ = (
+        Index('ix_otps_unused_lookup', 'email', 'otp_code', 'expires_at',
+              postgresql_where=text("is_used = 0")),
+    )
+
 
 # Employee Extended Profile
 class EmployeeProfile(Base):
@@ -215,6 +347,7 @@ class Attendance(Base):
     
     __table_args__ = (
         UniqueConstraint('user_id', 'date', name='unique_attendance'),
+        Index('ix_attendance_date', 'date'),
     )
     
 #Calculating breaks
@@ -230,6 +363,12 @@ class BreakSession(Base):
 
     user = relationship("User")
 
+    __table_args__ = (
+        Index('ix_break_sessions_user_date', 'user_id', 'date'),
+        Index('ix_break_sessions_open', 'user_id', 'date',
+              postgresql_where=text("break_end IS NULL")),
+    )
+
 # Regularization Requests
 class Regularization(Base):
     __tablename__ = 'regularizations'
@@ -254,6 +393,11 @@ class Regularization(Base):
     approver = relationship("User", foreign_keys=[approved_by])
     designated_approver = relationship("User", foreign_keys=[designated_approver_id])
 
+    __table_args__ = (
+        Index('ix_regularizations_status_request_date', 'status', 'request_date'),
+        Index('ix_regularizations_user_request_date', 'user_id', 'request_date'),
+    )
+
 
 # Holidays
 class Holiday(Base):
@@ -460,6 +604,10 @@ class Notification(Base):
     
     user = relationship("User")
 
+    __table_args__ = (
+        Index('ix_notifications_user_created', 'user_id', 'created_at'),
+    )
+
 
 class Broadcast(Base):
     """Admin broadcast messages / Announcements"""
@@ -473,6 +621,8 @@ class Broadcast(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=True)
+    # Shown in the audience's GET /api/notifications (broadcast_inbox.py); announcements always are
+    send_notifications = Column(Boolean, nullable=False, default=True, server_default='true')
     
     # New fields from Add Announcement Form (Image 3)
     event_date = Column(Date, nullable=True)
@@ -511,6 +661,14 @@ class BroadcastReaction(Base):
     user = relationship("User")
 
 
+class BroadcastReadException(Base):
+    """A broadcast read out of order, above the user's last_seen_broadcast_id"""
+    __tablename__ = 'broadcast_read_exceptions'
+
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    broadcast_id = Column(Integer, ForeignKey('broadcasts.id', ondelete='CASCADE'), primary_key=True)
+
+
 # Aliases
 Announcement = Broadcast
 
@@ -532,6 +690,94 @@ class BlacklistedToken(Base):
     
     user = relationship("User")
 
+    __table_args__ = (
+        # incremental cache refresh (token_blacklist.py) and the expiry sweeper
+        Index('ix_blacklisted_tokens_blacklisted_at', 'blacklisted_at'),
+        Index('ix_blacklisted_tokens_expires_at', 'expires_at'),
+    )
+
+
+# =============================================================================
+# LEAVE LEDGER
+# =============================================================================
+
+class LeaveLedgerEntry(Base):
+    """Append-only credit/debit entry against a user's leave balance for a year"""
+    __tablename__ = 'leave_ledger_entries'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    leave_type_id = Column(Integer, ForeignKey('leave_types.id', ondelete='CASCADE'), nullable=False)
+    year = Column(Integer, nullable=False)
+    leave_request_id = Column(Integer, ForeignKey('leave_requests.id', ondelete='SET NULL'), nullable=True)
+    entry_type = Column(String(10), nullable=False)  # 'credit' or 'debit' (effect on available days)
+    event = Column(String(30), nullable=False)  # opening, policy_change, request_created, request_approved, ...
+    allocated_delta = Column(DECIMAL(6, 2), default=0, nullable=False)
+    pending_delta = Column(DECIMAL(6, 2), default=0, nullable=False)
+    used_delta = Column(DECIMAL(6, 2), default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_leave_ledger_entries_key', 'user_id', 'leave_type_id', 'year'),
+    )
+
+
+class LeaveLedgerBalance(Base):
+    """Running balance maintained from leave_ledger_entries (one row per user, leave type and year)"""
+    __tablename__ = 'leave_ledger_balances'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    leave_type_id = Column(Integer, ForeignKey('leave_types.id', ondelete='CASCADE'), nullable=False)
+    year = Column(Integer, nullable=False)
+    allocated = Column(DECIMAL(6, 2), default=0, nullable=False)
+    pending = Column(DECIMAL(6, 2), default=0, nullable=False)  # reserved by pending requests
+    used = Column(DECIMAL(6, 2), default=0, nullable=False)  # approved requests
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'leave_type_id', 'year', name='unique_ledger_balance'),
+    )
+
+
+# =============================================================================
+# EMAIL OUTBOX
+# =============================================================================
+
+class EmailOutbox(Base):
+    """Email queued by a request and delivered by the outbox worker (email_outbox.py)"""
+    __tablename__ = 'email_outbox'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    to_email = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    content_type = Column(String(10), nullable=False, default='html')  # 'html' or 'plain'
+    status = Column(String(10), nullable=False, default='pending')  # pending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    __table_args__ = (
+        # the worker's claim query: due pending rows, oldest first
+        Index('ix_email_outbox_due', 'next_attempt_at', postgresql_where=text("status = 'pending'")),
+    )
+
+
+
+# =============================================================================
+# RESOURCE VERSIONS
+# =============================================================================
+
+class ResourceVersion(Base):
+    """Change counter of a reference-data resource, the basis of its ETag (resource_versions.py)"""
+    __tablename__ = 'resource_versions'
+
+    resource = Column(String(50), primary_key=True)  # holidays, leave_types, departments, settings
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 # Create all tables
 def init_db():
@@ -0,0 +1,130 @@
+"""
+Request-Scoped Database Session for Stafio
+==========================================
+Views use `g.db` instead of opening and closing SessionLocal() by hand:
+
+    db = g.db
+    user = db.query(User).get(user_id)
+    ...
+    db.commit()        # optional: the request is committed centrally
+
+- The Session is created on first access to g.db, and it only checks out
+  a pool connection on its first query, so a request rejected before that
+  never touches the pool.
+- after_request commits what the view left pending when the response is
+  successful (< 400) and rolls it back otherwise. A failing commit turns
+  the response into a 500.
+- teardown_appcontext rolls back after an unhandled exception and always
+  closes the session, returning its connection to the pool.
+
+Read replicas (DB_REPLICA_URLS): GET requests read from a replica until
+their first write, after which the session sticks to the primary. A client
+reads from the primary instead when
+  - it sends `X-Read-Primary: true`, or
+  - it wrote something less than DB_REPLICA_STICKY_SECONDS ago (cookie set
+    on the response of the write), so e.g. the leave list fetched right
+    after create_leave_request already contains the new request, or
+  - the view calls use_primary().
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+
+from flask import g, has_app_context, has_request_context, jsonify, request
+from flask.ctx import _AppCtxGlobals
+
+from database import SessionLocal, replica_engines
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a client keeps reading from the primary after one of its writes
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', '5'))
+READ_PRIMARY_COOKIE = 'read_primary'
+READ_PRIMARY_HEADER = 'X-Read-Primary'
+
+
+def _reads_from_replica():
+    if not replica_engines or not has_request_context():
+        return False
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.headers.get(READ_PRIMARY_HEADER, '').lower() in ('1', 'true', 'yes'):
+        return False
+    return not request.cookies.get(READ_PRIMARY_COOKIE)
+
+
+class RequestGlobals(_AppCtxGlobals):
+    """flask.g with a lazily created `db` session"""
+
+    def __getattr__(self, name):
+        if name == 'db':
+            session = SessionLocal()
+            if _reads_from_replica():
+                session.use_replica()
+            self.db = session
+            return session
+        return super().__getattr__(name)
+
+
+def use_primary():
+    """Make the rest of this request read from the primary"""
+    g.db.use_primary()
+
+
+@contextmanager
+def session_scope():
+    """g.db inside a request, a short-lived session outside of one (scripts)"""
+    if has_app_context():
+        yield g.db
+        return
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _finish_request(response):
+    db = g.get('db')
+    if db is None:
+        return response
+
+    transaction = db.get_transaction()
+    if response.status_code >= 400 or (transaction is not None and not transaction.is_active):
+        db.rollback()
+        return response
+
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Request commit error: %s", e)
+        response = jsonify({"message": f"Error: {str(e)}"})
+        response.status_code = 500
+        return response
+
+    if db.wrote and replica_engines:
+        # Read-your-writes: the client's next reads skip the (lagging) replicas
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, '1', max_age=REPLICA_STICKY_SECONDS,
+            httponly=True, samesite='Lax', secure=request.is_secure
+        )
+    return response
+
+
+def _close_session(exc):
+    db = g.pop('db', None)
+    if db is None:
+        return
+    if exc is not None:
+        db.rollback()
+    db.close()
+
+
+def init_request_db(app):
+    """Install g.db and the central commit/rollback/close handlers on the app"""
+    app.app_ctx_globals_class = RequestGlobals
+    app.after_request(_finish_request)
+    app.teardown_appcontext(_close_session)
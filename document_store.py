@@ -0,0 +1,188 @@
+"""
+Document Files for Stafio
+=========================
+POST /api/documents takes the file itself as multipart/form-data. The body
+is never held in memory: the multipart parser writes each file part in
+64 KiB chunks into an UploadSpool, a temp file under DOCUMENTS_ROOT that
+hashes what it receives, and the finished file is renamed into a
+content-addressed ContentStore (media_store.py) named by its SHA-256.
+Identical uploads share one file on disk.
+
+Document.file_path holds the path relative to DOCUMENTS_ROOT
+("3f/3fa1...e9"), file_size the byte count and mime_type the type sniffed
+from the stored bytes (the file extension only where the bytes are
+ambiguous, never the client's Content-Type).
+
+Downloads go through send_document(): send_file with ETag (the SHA-256),
+If-None-Match and Range support. With DOCUMENTS_SENDFILE=x-accel (nginx)
+or x-sendfile (Apache/lighttpd) the worker only sends headers and the
+front server streams the file.
+
+Files are not removed when a Document row is deleted: another row (or a
+concurrent upload of the same bytes) may use the same file.
+"""
+
+import hashlib
+import mimetypes
+import os
+
+from flask import current_app, request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+from werkzeug.utils import send_file
+
+import media_store
+from media_store import ContentStore
+
+DOCUMENTS_ROOT = os.getenv('DOCUMENTS_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'documents'))
+MAX_DOCUMENT_BYTES = int(os.getenv('DOCUMENTS_MAX_BYTES', str(25 * 1024 * 1024)))
+# '', 'x-accel' (nginx) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+SENDFILE_MODE = os.getenv('DOCUMENTS_SENDFILE', '').lower()
+# nginx `internal` location aliased to DOCUMENTS_ROOT
+ACCEL_PREFIX = '/' + os.getenv('DOCUMENTS_ACCEL_PREFIX', '/protected-documents/').strip('/') + '/'
+
+# Types a browser may show inline; everything else is downloaded
+INLINE_TYPES = ('application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'image/webp')
+
+store = ContentStore(DOCUMENTS_ROOT)
+
+
+def document_path(digest):
+    """Document.file_path value for a stored file"""
+    return os.path.relpath(store.path(digest), store.root)
+
+
+def digest_from_path(file_path):
+    """SHA-256 named by a stored document's file_path, None for legacy/made-up paths"""
+    digest = os.path.basename(file_path or '')
+    try:
+        if document_path(digest) == file_path:
+            return digest
+    except ValueError:
+        pass
+    return None
+
+
+# =============================================================================
+# UPLOAD
+# =============================================================================
+
+def clean_file_name(name):
+    """Last path component of a client-supplied file name, at most 255 chars"""
+    return (name or '').replace('\\', '/').rsplit('/', 1)[-1].strip()[:255]
+
+
+class UploadSpool:
+    """Temp file in the store that hashes and counts what is written to it"""
+
+    def __init__(self, max_bytes=MAX_DOCUMENT_BYTES):
+        fd, self.tmp_path = store.temp_file()
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            # not a ValueError: parse_form_data(silent=True) would swallow it
+            raise RequestEntityTooLarge(f"File exceeds {self.max_bytes} bytes")
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        # read/seek/tell/... for werkzeug's FileStorage
+        return getattr(self.file, name)
+
+    def commit(self):
+        """Move the file into the store; returns its digest"""
+        self.file.close()
+        digest = self.sha256.hexdigest()
+        store.commit(self.tmp_path, digest)
+        return digest
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+def parse_upload():
+    """
+    Parse the current multipart request, streaming file parts to disk.
+    Returns (form, files, spools); the caller must discard() every spool
+    it does not commit(). Raises RequestEntityTooLarge.
+    """
+    if request.content_length is not None and request.content_length > MAX_DOCUMENT_BYTES + 64 * 1024:
+        raise RequestEntityTooLarge(f"File exceeds {MAX_DOCUMENT_BYTES} bytes")
+
+    spools = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        spool = UploadSpool()
+        spools.append(spool)
+        return spool
+
+    try:
+        _stream, form, files = parse_form_data(
+            request.environ, stream_factory=stream_factory, max_form_memory_size=500 * 1024
+        )
+    except BaseException:
+        for spool in spools:
+            spool.discard()
+        raise
+    return form, files, spools
+
+
+def detect_mime(digest, file_name):
+    """Type of a stored file from its first bytes, else from the file name"""
+    with open(store.path(digest), 'rb') as f:
+        head = f.read(16)
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    mime = media_store.sniff_mime(head)
+    if mime:
+        return mime
+    guessed, _encoding = mimetypes.guess_type(file_name or '')
+    # zip (docx, xlsx), OLE (doc, xls) and plain text files need the extension
+    if guessed and guessed not in INLINE_TYPES:
+        return guessed
+    return 'application/octet-stream'
+
+
+# =============================================================================
+# DOWNLOAD
+# =============================================================================
+
+def send_document(digest, file_name, mime_type, inline=False):
+    """Response for a stored document (Range/If-None-Match aware, optionally offloaded)"""
+    path = store.path(digest)
+    as_attachment = not (inline and mime_type in INLINE_TYPES)
+    offload = SENDFILE_MODE in ('x-accel', 'x-sendfile')
+
+    response = send_file(
+        path,
+        request.environ,
+        mimetype=mime_type or 'application/octet-stream',
+        as_attachment=as_attachment,
+        download_name=file_name or digest,
+        conditional=not offload,
+        etag=digest,
+        use_x_sendfile=offload,
+        response_class=current_app.response_class,
+    )
+
+    if offload:
+        # The front server handles Range; a matching If-None-Match is answered here
+        response = response.make_conditional(request.environ)
+        sendfile_path = response.headers.pop('X-Sendfile', None)
+        if response.status_code != 304:
+            if SENDFILE_MODE == 'x-accel':
+                response.headers['X-Accel-Redirect'] = ACCEL_PREFIX + document_path(digest)
+            else:
+                response.headers['X-Sendfile'] = sendfile_path
+
+    # personal files: revalidate every time, never in shared caches
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
@@ -0,0 +1,320 @@
+"""
+Email Outbox for Stafio
+=======================
+Requests never talk to the SMTP server. They queue a row in email_outbox
+with enqueue_email(), in their own transaction (so an OTP and its email
+are committed together), and a separate worker process delivers them:
+
+    python email_outbox.py worker     # run forever (deploy as a worker service)
+    python email_outbox.py drain      # deliver what is due once, then exit
+    python email_outbox.py stats      # row counts per status
+
+The worker claims due rows in batches (FOR UPDATE SKIP LOCKED, so several
+workers can run side by side) and sends them over one SMTP session that is
+kept open between batches and only closed after SMTP_IDLE_SECONDS without
+mail. Claiming a row pushes its next_attempt_at out by CLAIM_LEASE_SECONDS:
+a worker that dies mid-batch leaves the rows to be retried after that.
+
+Failures:
+  - 5xx replies for the message (bad recipient, rejected content) fail the
+    row permanently;
+  - anything else (4xx, connection errors, authentication) is retried with
+    exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS.
+
+For local testing point SMTP_SERVER/SMTP_PORT at smtp_stub.py;
+tests/test_email_outbox.py drains the outbox against it.
+"""
+
+import logging
+import os
+import random
+import signal
+import smtplib
+import sys
+import time
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from dotenv import load_dotenv
+from sqlalchemy import func, select, update
+
+from database import SessionLocal, EmailOutbox
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# SMTP configuration
+# no EMAIL_USER: the server is used without authentication
+EMAIL_USER = os.getenv('EMAIL_USER', '')
+EMAIL_PASS = os.getenv('EMAIL_PASS', '')
+EMAIL_FROM = os.getenv('EMAIL_FROM', 'example@example.com')
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', '60'))
+
+# Worker configuration
+BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+POLL_SECONDS = float(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', '2'))
+MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+BACKOFF_BASE_SECONDS = float(os.getenv('EMAIL_OUTBOX_BACKOFF_BASE_SECONDS', '30'))
+BACKOFF_MAX_SECONDS = float(os.getenv('EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', '3600'))
+CLAIM_LEASE_SECONDS = float(os.getenv('EMAIL_OUTBOX_CLAIM_LEASE_SECONDS', '300'))
+
+
+# =============================================================================
+# ENQUEUE (request side)
+# =============================================================================
+
+def enqueue_email(db, to_email, subject, body, content_type='html'):
+    """Queue an email on the given session; it is sent once the session commits"""
+    row = EmailOutbox(
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        content_type=content_type,
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(row)
+    return row
+
+
+# =============================================================================
+# SMTP SESSION
+# =============================================================================
+
+class SmtpConnection:
+    """One SMTP session reused across messages, reopened when it drops or idles"""
+
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, starttls=SMTP_STARTTLS,
+                 user=EMAIL_USER, password=EMAIL_PASS, timeout=SMTP_TIMEOUT,
+                 idle_seconds=SMTP_IDLE_SECONDS):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self._smtp = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _open(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, (self.password or '').strip())
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connects += 1
+
+    def send(self, from_addr, to_addr, message):
+        self.close_if_idle()
+        for attempt in range(2):
+            if self._smtp is None:
+                self._open()
+            try:
+                self._smtp.sendmail(from_addr, [to_addr], message)
+                return
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped the kept-open session: reconnect once
+                self._smtp = None
+                if attempt:
+                    raise
+            finally:
+                self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self.close()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+def build_message(row, from_addr=EMAIL_FROM):
+    msg = MIMEMultipart()
+    msg['From'] = from_addr
+    msg['To'] = row.to_email
+    msg['Subject'] = row.subject
+    msg.attach(MIMEText(row.body, row.content_type or 'html'))
+    return msg.as_string()
+
+
+def is_permanent_failure(exc):
+    """5xx about this message; auth and connection problems are worth retrying"""
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code >= 500
+    return False
+
+
+def is_connection_failure(exc):
+    """The session itself is unusable: stop the batch instead of failing every row"""
+    if isinstance(exc, (smtplib.SMTPConnectError, smtplib.SMTPAuthenticationError,
+                        smtplib.SMTPServerDisconnected)):
+        return True
+    # SMTPException subclasses OSError, but a reply about one message is not fatal
+    if isinstance(exc, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+        return False
+    return isinstance(exc, OSError)
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def claim_batch(db, limit=BATCH_SIZE):
+    """Lease up to `limit` due rows to this worker; returns their ids"""
+    now = datetime.utcnow()
+    due = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    ids = db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(attempts=EmailOutbox.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS))
+        .returning(EmailOutbox.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return sorted(ids)
+
+
+def deliver(db, connection, row):
+    """Send one claimed row and record the outcome; False when the session broke"""
+    try:
+        connection.send(EMAIL_FROM, row.to_email, build_message(row))
+    except Exception as e:
+        row.last_error = str(e)[:1000]
+        if is_permanent_failure(e) or row.attempts >= MAX_ATTEMPTS:
+            row.status = 'failed'
+            logger.error("Email %s to %s failed after %s attempt(s): %s", row.id, row.to_email, row.attempts, e)
+        else:
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(row.attempts))
+            logger.warning("Email %s to %s deferred (attempt %s): %s", row.id, row.to_email, row.attempts, e)
+        db.commit()
+        if is_connection_failure(e):
+            connection.close()
+            return False
+        return True
+
+    row.status = 'sent'
+    row.sent_at = datetime.utcnow()
+    row.last_error = None
+    db.commit()
+    return True
+
+
+def drain_once(connection, limit=BATCH_SIZE):
+    """Claim and deliver one batch; returns the number of rows claimed"""
+    db = SessionLocal()
+    try:
+        ids = claim_batch(db, limit)
+        for index, row_id in enumerate(ids):
+            row = db.get(EmailOutbox, row_id)
+            if not deliver(db, connection, row):
+                # Unclaimed again right away; their attempt is not counted
+                rest = ids[index + 1:]
+                if rest:
+                    db.execute(
+                        update(EmailOutbox)
+                        .where(EmailOutbox.id.in_(rest))
+                        .values(attempts=EmailOutbox.attempts - 1,
+                                next_attempt_at=row.next_attempt_at)
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.commit()
+                break
+        return len(ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run_worker(poll_seconds=POLL_SECONDS, batch_size=BATCH_SIZE):
+    """Drain the outbox until SIGTERM/SIGINT"""
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.append(True))
+
+    connection = SmtpConnection()
+    logger.info("Email outbox worker started (%s:%s, batch %s)", connection.host, connection.port, batch_size)
+    try:
+        while not stopping:
+            try:
+                claimed = drain_once(connection, batch_size)
+            except Exception as e:
+                logger.error("Email outbox worker error: %s", e)
+                claimed = 0
+            if claimed < batch_size:
+                connection.close_if_idle()
+                time.sleep(poll_seconds)
+    finally:
+        connection.close()
+        logger.info("Email outbox worker stopped")
+
+
+def outbox_stats():
+    db = SessionLocal()
+    try:
+        return dict(db.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all())
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    from logging_setup import setup_logging
+    setup_logging()
+
+    command = sys.argv[1] if len(sys.argv) == 2 else None
+    if command == "worker":
+        run_worker()
+    elif command == "drain":
+        connection = SmtpConnection()
+        total = 0
+        try:
+            while True:
+                claimed = drain_once(connection)
+                total += claimed
+                if claimed < BATCH_SIZE:
+                    break
+        finally:
+            connection.close()
+        print(f"Processed {total} email(s); {outbox_stats()}")
+    elif command == "stats":
+        print(outbox_stats())
+    else:
+        print("Usage: python email_outbox.py [worker|drain|stats]")
+        sys.exit(2)
@@ -0,0 +1,392 @@
+"""
+Server-Sent Events for Stafio
+=============================
+GET /api/stream pushes what the frontend used to poll for:
+
+    event: notification      a new direct notification for the user
+    event: broadcast         a new broadcast/announcement for the user's audience
+    event: leave_status      one of the user's leave requests was approved/rejected
+    event: pending_counts    admins: deltas of pending leave requests/regularizations
+    event: resync            events may have been lost: refetch over the REST API
+
+Change events are published with pg_notify() from a flush hook on the ORM
+session (install_change_events), so every writer that creates a
+Notification/Broadcast or changes a LeaveRequest/Regularization status
+fires them, and Postgres delivers them only if the transaction commits.
+Each worker process runs one LISTEN connection on a background thread
+and fans the events out to its local streams.
+
+gthread workers: every open stream occupies a worker thread, so a process
+serves at most SSE_MAX_CONNECTIONS streams (503 + Retry-After beyond that;
+the client keeps polling) and closes each stream after
+SSE_MAX_STREAM_SECONDS (EventSource reconnects by itself). A comment line
+every SSE_HEARTBEAT_SECONDS keeps proxies from timing out the stream and
+makes a write fail soon after the client went away, freeing the thread.
+"""
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import NullPool
+
+import database
+from broadcast_inbox import audiences_for_role, broadcast_notification
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = os.getenv('SSE_CHANNEL', 'stafio_events')
+MAX_CONNECTIONS = int(os.getenv('SSE_MAX_CONNECTIONS', '2'))
+HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+MAX_STREAM_SECONDS = float(os.getenv('SSE_MAX_STREAM_SECONDS', '300'))
+QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', '100'))
+RETRY_MS = int(os.getenv('SSE_RETRY_MS', '5000'))
+# LISTEN needs a session-level connection: set this when DB_HOST is PgBouncer in transaction mode
+LISTEN_URL = os.getenv('SSE_LISTEN_URL', '')
+
+# pg_notify payloads are limited to 8000 bytes
+MAX_MESSAGE_CHARS = 500
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+# =============================================================================
+# PUBLISHING (flush hook)
+# =============================================================================
+
+def _status_change(obj):
+    """(old_status, new_status) of a flushed object, None when unchanged"""
+    history = inspect(obj).attrs.status.history
+    if not history.has_changes():
+        return None
+    old = history.deleted[0] if history.deleted else None
+    new = history.added[0] if history.added else None
+    return old, new
+
+
+def _pending_delta(old, new):
+    return (new == 'pending') - (old == 'pending')
+
+
+def collect_events(session):
+    """Change events of the flush in progress"""
+    events = []
+    pending_leaves = 0
+    pending_regularizations = 0
+
+    for obj in session.new:
+        if isinstance(obj, database.Notification):
+            events.append({
+                "event": "notification",
+                "user_id": obj.user_id,
+                "data": {
+                    "id": obj.id,
+                    "title": obj.title,
+                    "message": (obj.message or '')[:MAX_MESSAGE_CHARS],
+                    "type": obj.notification_type,
+                    "is_read": bool(obj.is_read),
+                    "link": obj.link,
+                    "created_at": obj.created_at,
+                },
+            })
+        elif isinstance(obj, database.Broadcast) and obj.is_active is not False and obj.send_notifications is not False:
+            item = broadcast_notification(obj, False)
+            item["message"] = item["message"][:MAX_MESSAGE_CHARS]
+            events.append({"event": "broadcast", "audience": obj.target_audience or 'all', "data": item})
+        elif isinstance(obj, database.LeaveRequest):
+            pending_leaves += obj.status == 'pending'
+        elif isinstance(obj, database.Regularization):
+            pending_regularizations += obj.status == 'pending'
+
+    for obj in session.dirty:
+        if isinstance(obj, database.LeaveRequest):
+            change = _status_change(obj)
+            if change:
+                pending_leaves += _pending_delta(*change)
+                if change[1] in ('approved', 'rejected'):
+                    events.append({
+                        "event": "leave_status",
+                        "user_id": obj.user_id,
+                        "data": {
+                            "id": obj.id,
+                            "status": obj.status,
+                            "start_date": obj.start_date,
+                            "end_date": obj.end_date,
+                        },
+                    })
+        elif isinstance(obj, database.Regularization):
+            change = _status_change(obj)
+            if change:
+                pending_regularizations += _pending_delta(*change)
+
+    for obj in session.deleted:
+        if isinstance(obj, database.LeaveRequest):
+            pending_leaves -= obj.status == 'pending'
+        elif isinstance(obj, database.Regularization):
+            pending_regularizations -= obj.status == 'pending'
+
+    if pending_leaves or pending_regularizations:
+        events.append({
+            "event": "pending_counts",
+            "admins": True,
+            "data": {
+                # same keys as GET /api/admin/pending_counts, as deltas
+                "pending_leave_requests": pending_leaves,
+                "pending_approvals": pending_regularizations,
+            },
+        })
+    return events
+
+
+def _publish_after_flush(session, flush_context):
+    events = collect_events(session)
+    if not events:
+        return
+    connection = session.connection()
+    for change in events:
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": CHANNEL, "payload": json.dumps(change, default=_json_default)}
+        )
+
+
+def install_change_events(session_factory):
+    """Publish change events from every flush of sessions made by the factory"""
+    if not event.contains(session_factory, 'after_flush', _publish_after_flush):
+        event.listen(session_factory, 'after_flush', _publish_after_flush)
+
+
+# =============================================================================
+# SUBSCRIBERS
+# =============================================================================
+
+class Subscriber:
+    def __init__(self, user_id, role):
+        self.user_id = user_id
+        self.role = role
+        self.audiences = set(audiences_for_role(role))
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.connected_at = time.time()
+
+    def wants(self, change):
+        if change.get("admins"):
+            return self.role == 'admin'
+        if "audience" in change:
+            return change["audience"] in self.audiences
+        return change.get("user_id") == self.user_id
+
+
+class StreamHub:
+    """This process's open streams, their limit and counters"""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.stats = {
+            "accepted_total": 0, "rejected_total": 0, "closed_total": 0, "peak": 0,
+            "events_received": 0, "events_delivered": 0, "events_dropped": 0,
+        }
+
+    def subscribe(self, user_id, role):
+        """A new Subscriber, or None when this process is at its stream limit"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_connections:
+                self.stats["rejected_total"] += 1
+                return None
+            subscriber = Subscriber(user_id, role)
+            self._subscribers.add(subscriber)
+            self.stats["accepted_total"] += 1
+            self.stats["peak"] = max(self.stats["peak"], len(self._subscribers))
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.discard(subscriber)
+                self.stats["closed_total"] += 1
+
+    def _put(self, subscriber, change):
+        try:
+            subscriber.queue.put_nowait(change)
+            return True
+        except queue.Full:
+            # A stalled client: tell it to refetch instead of growing the queue
+            with subscriber.queue.mutex:
+                subscriber.queue.queue.clear()
+            subscriber.queue.put_nowait({"event": "resync", "data": {"reason": "overflow"}})
+            return False
+
+    def dispatch(self, change):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.stats["events_received"] += 1
+        delivered = dropped = 0
+        for subscriber in subscribers:
+            if subscriber.wants(change):
+                if self._put(subscriber, change):
+                    delivered += 1
+                else:
+                    dropped += 1
+        with self._lock:
+            self.stats["events_delivered"] += delivered
+            self.stats["events_dropped"] += dropped
+
+    def resync_all(self, reason):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._put(subscriber, {"event": "resync", "data": {"reason": reason}})
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            ages = sorted(now - s.connected_at for s in self._subscribers)
+            return dict(
+                self.stats,
+                open=len(ages),
+                max_connections=self.max_connections,
+                oldest_seconds=round(ages[-1], 1) if ages else None,
+            )
+
+
+hub = StreamHub()
+
+
+# =============================================================================
+# LISTENER
+# =============================================================================
+
+class ChangeListener:
+    """LISTEN on CHANNEL from a dedicated connection and feed the hub"""
+
+    def __init__(self, channel=CHANNEL):
+        self.channel = channel
+        self.connected = False
+        self.reconnects = 0
+        # bumped on every (re)connect: state kept in sync by notifications is
+        # only trustworthy while this stays the same
+        self.generation = 0
+        self.last_event_at = None
+        self._handlers = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add_handler(self, event_name, handler):
+        """Route events of this name to handler(change) instead of the streams"""
+        self._handlers[event_name] = handler
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sse-listener", daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        if LISTEN_URL:
+            raw = create_engine(LISTEN_URL, poolclass=NullPool).raw_connection()
+        else:
+            raw = database.engine.raw_connection()
+        connection = raw.driver_connection
+        raw.detach()  # kept for good, not a pool slot
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return connection
+
+    def _run(self):
+        backoff = 1
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                self.generation += 1
+                self.connected = True
+                backoff = 1
+                if self.reconnects:
+                    # Whatever was published while we were away is lost
+                    hub.resync_all("listener_reconnected")
+                while True:
+                    if select.select([connection], [], [], HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        self.last_event_at = time.time()
+                        try:
+                            change = json.loads(notify.payload)
+                        except ValueError:
+                            logger.warning("Ignoring malformed %s payload", self.channel)
+                            continue
+                        handler = self._handlers.get(change.get("event"))
+                        if handler:
+                            handler(change)
+                        else:
+                            hub.dispatch(change)
+            except Exception as e:
+                logger.error("SSE listener error: %s", e)
+            finally:
+                self.connected = False
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            self.reconnects += 1
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def status(self):
+        return {
+            "channel": self.channel,
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "last_event_at": datetime.utcfromtimestamp(self.last_event_at).isoformat() if self.last_event_at else None,
+        }
+
+
+listener = ChangeListener()
+
+
+def stream_status():
+    """Connection counters of this worker (GET /internal/stream)"""
+    return {"pid": os.getpid(), "streams": hub.snapshot(), "listener": listener.status()}
+
+
+# =============================================================================
+# SSE FORMAT
+# =============================================================================
+
+def format_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+def event_stream(subscriber, initial_events=(), deadline=None):
+    """Generator of the stream's text; unsubscribes when the client goes away"""
+    deadline = deadline or time.monotonic() + MAX_STREAM_SECONDS
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for name, data in initial_events:
+            yield format_event(name, data)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                change = subscriber.queue.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield format_event(change["event"], change["data"])
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,184 @@
+"""
+Holiday Calendar for Stafio
+===========================
+The merged holiday calendar of a year: the national/government observance
+days below plus the custom `holidays` rows (a custom holiday replaces the
+national one on the same date). Each year is built once and kept in the
+per-process reference-data cache (reference_cache.py) under the "holidays"
+resource, whose version every insert/update/delete of a Holiday bumps, so
+create_holiday and holiday edits - in any worker - invalidate it.
+
+    calendar = get_calendar(db, 2026)
+    calendar.entries              # sorted, the GET /api/myholidays items
+    calendar.is_holiday(day)      # O(1)
+    calendar.between(start, end)  # range query by bisect on the sorted dates
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from database import Holiday
+from reference_cache import cache
+
+# Comprehensive Indian Government / National Observance Days
+# (Gazetted + widely observed days), as (month, day, title, type)
+NATIONAL_HOLIDAYS = [
+    # JANUARY
+    (1, 1, "New Year's Day", "National"),
+    (1, 14, "Pongal / Makar Sankranti", "National"),
+    (1, 15, "Army Day", "Observance"),
+    (1, 23, "Netaji Subhas Chandra Bose Jayanti", "National"),
+    (1, 24, "National Girl Child Day", "Observance"),
+    (1, 25, "National Voters' Day", "Observance"),
+    (1, 26, "Republic Day", "National"),
+    (1, 30, "Martyrs' Day (Mahatma Gandhi)", "National"),
+    # FEBRUARY
+    (2, 4, "World Cancer Day", "Observance"),
+    (2, 14, "Valentine's Day", "Observance"),
+    (2, 19, "Chhatrapati Shivaji Maharaj Jayanti", "National"),
+    (2, 20, "Arunachal Pradesh Statehood Day", "Observance"),
+    (2, 28, "National Science Day", "Observance"),
+    # MARCH
+    (3, 1, "Holi", "National"),
+    (3, 4, "Maha Shivaratri", "National"),
+    (3, 8, "International Women's Day", "Observance"),
+    (3, 15, "World Consumer Rights Day", "Observance"),
+    (3, 22, "Bihar Diwas / World Water Day", "Observance"),
+    (3, 30, "Ram Navami", "National"),
+    # APRIL
+    (4, 3, "Good Friday", "National"),
+    (4, 5, "Easter Saturday", "Observance"),
+    (4, 6, "Mahavir Jayanti", "National"),
+    (4, 7, "World Health Day", "Observance"),
+    (4, 14, "Dr. B.R. Ambedkar Jayanti / Tamil New Year", "National"),
+    (4, 22, "Earth Day", "Observance"),
+    # MAY
+    (5, 1, "International Labour Day / Maharashtra Day", "National"),
+    (5, 7, "Rabindranath Tagore Jayanti", "National"),
+    (5, 11, "National Technology Day", "Observance"),
+    (5, 12, "International Nurses Day", "Observance"),
+    (5, 31, "World No Tobacco Day", "Observance"),
+    # JUNE
+    (6, 1, "World Milk Day", "Observance"),
+    (6, 5, "World Environment Day", "Observance"),
+    (6, 21, "International Yoga Day", "National"),
+    (6, 23, "Rath Yatra", "National"),
+    # JULY
+    (7, 1, "National Doctor's Day / Chartered Accountants Day", "Observance"),
+    (7, 11, "World Population Day", "Observance"),
+    (7, 18, "Nelson Mandela International Day", "Observance"),
+    (7, 26, "Kargil Vijay Diwas", "National"),
+    # AUGUST
+    (8, 9, "Quit India Movement Day / Nagasaki Day", "National"),
+    (8, 12, "International Youth Day", "Observance"),
+    (8, 15, "Independence Day", "National"),
+    (8, 19, "Janmashtami", "National"),
+    (8, 29, "National Sports Day (Dhyan Chand Jayanti)", "National"),
+    # SEPTEMBER
+    (9, 2, "Onam", "National"),
+    (9, 5, "Teachers' Day (Dr. Radhakrishnan Jayanti)", "National"),
+    (9, 8, "International Literacy Day", "Observance"),
+    (9, 14, "Hindi Diwas", "National"),
+    (9, 16, "Ganesh Chaturthi", "National"),
+    (9, 25, "Antyodaya Diwas (Deendayal Upadhyaya Jayanti)", "Observance"),
+    # OCTOBER
+    (10, 2, "Gandhi Jayanti / Lal Bahadur Shastri Jayanti", "National"),
+    (10, 8, "Indian Air Force Day", "National"),
+    (10, 11, "Navratri Begins / Durga Puja", "National"),
+    (10, 16, "World Food Day", "Observance"),
+    (10, 19, "Ayudha Puja / Maha Navami", "National"),
+    (10, 20, "Dussehra / Vijayadasami / Saraswati Puja", "National"),
+    (10, 31, "Sardar Vallabhbhai Patel Jayanti / National Unity Day", "National"),
+    # NOVEMBER
+    (11, 8, "Diwali", "National"),
+    (11, 9, "Bhai Dooj", "National"),
+    (11, 14, "Children's Day (Nehru Jayanti)", "National"),
+    (11, 17, "Guru Nanak Jayanti", "National"),
+    (11, 19, "National Integration Day", "Observance"),
+    (11, 26, "Constitution Day (Samvidhan Diwas)", "National"),
+    # DECEMBER
+    (12, 1, "World AIDS Day", "Observance"),
+    (12, 4, "Indian Navy Day", "National"),
+    (12, 10, "Human Rights Day", "Observance"),
+    (12, 16, "Vijay Diwas (1971 War Victory)", "National"),
+    (12, 19, "Goa Liberation Day", "Observance"),
+    (12, 22, "National Mathematics Day (Ramanujan Jayanti)", "Observance"),
+    (12, 23, "Kisan Diwas (National Farmers Day)", "National"),
+    (12, 25, "Christmas Day", "National"),
+]
+
+
+class HolidayCalendar:
+    """Immutable merged calendar of one year"""
+
+    def __init__(self, year, entries):
+        self.year = year
+        self.entries = entries
+        self.dates = [date.fromisoformat(e["full_date"]) for e in entries]
+        self._by_date = dict(zip(self.dates, entries))
+
+    def is_holiday(self, day, source=None):
+        entry = self._by_date.get(day)
+        return entry is not None and (source is None or entry["source"] == source)
+
+    def get(self, day):
+        """The calendar entry of a date, None if it is not a holiday"""
+        return self._by_date.get(day)
+
+    def between(self, start, end, source=None):
+        """Entries dated start..end (inclusive), optionally only 'national' or 'custom'"""
+        entries = self.entries[bisect_left(self.dates, start):bisect_right(self.dates, end)]
+        if source is not None:
+            entries = [e for e in entries if e["source"] == source]
+        return entries
+
+
+def _national_entries(year):
+    entries = {}
+    for idx, (month, day, title, holiday_type) in enumerate(NATIONAL_HOLIDAYS):
+        try:
+            d = date(year, month, day)
+        except ValueError:
+            continue
+        entries[d.isoformat()] = {
+            "id": f"nat-{idx}",
+            "date": d.strftime('%d %B, %A'),
+            "full_date": d.isoformat(),
+            "title": title,
+            "type": holiday_type,
+            "source": "national"
+        }
+    return entries
+
+
+def build_calendar(db, year):
+    """Merge the national days with the year's custom holidays (one query)"""
+    merged = _national_entries(year)
+    for h in db.query(Holiday).filter(Holiday.year == year).order_by(Holiday.date):
+        date_key = h.date.isoformat()
+        merged[date_key] = {
+            "id": h.id,
+            "date": h.date.strftime('%d %B, %A'),
+            "full_date": date_key,
+            "title": h.title,
+            "type": "Restricted" if h.is_optional else "Mandatory",
+            "source": "custom"
+        }
+    return HolidayCalendar(year, sorted(merged.values(), key=lambda x: x["full_date"]))
+
+
+def get_calendar(db, year):
+    """The cached calendar of a year, rebuilt when holidays changed"""
+    return cache.get('holidays', year, db, lambda session: build_calendar(session, year))
+
+
+def is_holiday(db, day, source=None):
+    return get_calendar(db, day.year).is_holiday(day, source)
+
+
+def holidays_between(db, start, end, source=None):
+    """Calendar entries dated start..end (inclusive), across year boundaries"""
+    entries = []
+    for year in range(start.year, end.year + 1):
+        entries.extend(get_calendar(db, year).between(start, end, source))
+    return entries
@@ -0,0 +1,179 @@
+"""
+Index Advisor for Stafio
+========================
+Runs EXPLAIN on a catalogue of the queries the API issues on its hot
+paths and reports every sequential scan in their plans.
+
+Each query is planned twice:
+  1. normally - what PostgreSQL would really do today;
+  2. with enable_seqscan = off - if a Seq Scan is STILL chosen, no index
+     can serve the query at all (missing index). Otherwise the planner just
+     prefers a scan because the table is small, which is fine.
+
+Usage:
+    python index_advisor.py
+    python index_advisor.py --database-url postgresql://... --verbose
+
+Exit code is 1 when at least one query has no usable index.
+"""
+
+import argparse
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, select, func, text
+
+from database import (
+    DATABASE_URL, User, OTP, LeaveRequest, Attendance, BreakSession,
+    Regularization, Notification, BlacklistedToken, LeaveLedgerBalance
+)
+
+
+# =============================================================================
+# QUERY CATALOGUE (mirrors the filters used by the endpoints)
+# =============================================================================
+
+def build_catalogue():
+    today = date.today()
+    now = datetime.utcnow()
+    year_start = date(today.year, 1, 1)
+    user_id = 1
+
+    return [
+        ("leave overlap check (create_leave_request)",
+         select(LeaveRequest.id).where(
+             LeaveRequest.user_id == user_id,
+             LeaveRequest.status.in_(['pending', 'approved']),
+             LeaveRequest.period.overlaps(func.daterange(today, today + timedelta(days=3), '[]'))
+         ).limit(1)),
+        ("pending leave count (admin dashboard)",
+         select(func.count(LeaveRequest.id)).where(LeaveRequest.status == 'pending')),
+        ("latest decided leave (leave_notification)",
+         select(LeaveRequest.id).where(
+             LeaveRequest.user_id == user_id,
+             LeaveRequest.status.in_(['approved', 'rejected'])
+         ).order_by(LeaveRequest.applied_date.desc()).limit(1)),
+        ("on leave today (admin dashboard)",
+         select(func.count(LeaveRequest.id)).where(
+             LeaveRequest.status == 'approved',
+             LeaveRequest.start_date <= today,
+             LeaveRequest.end_date >= today
+         )),
+        ("notifications bell (get_notifications)",
+         select(Notification.id).where(
+             Notification.user_id == user_id
+         ).order_by(Notification.created_at.desc()).limit(50)),
+        ("open break (break start/end)",
+         select(BreakSession.id).where(
+             BreakSession.user_id == user_id,
+             BreakSession.date == today,
+             BreakSession.break_end.is_(None)
+         ).order_by(BreakSession.id.desc()).limit(1)),
+        ("break minutes today (today attendance)",
+         select(func.sum(BreakSession.break_minutes)).where(
+             BreakSession.user_id == user_id,
+             BreakSession.date == today
+         )),
+        ("pending regularization count (pending_counts)",
+         select(func.count(Regularization.id)).where(Regularization.status == 'pending')),
+        ("my regularizations (myregularization)",
+         select(Regularization.id).where(
+             Regularization.user_id == user_id
+         ).order_by(Regularization.request_date.desc())),
+        ("OTP verification (forgot password)",
+         select(OTP.id).where(
+             OTP.email == 'someone@example.com',
+             OTP.otp_code == '123456',
+             OTP.is_used == 0,
+             OTP.expires_at > now
+         ).limit(1)),
+        ("attendance today (admin dashboard)",
+         select(func.count(Attendance.id)).join(User, Attendance.user_id == User.id).where(
+             Attendance.date == today,
+             Attendance.status == 'On Time',
+             User.role == 'employee'
+         )),
+        ("attendance graph range (attendance_graph_stats)",
+         select(func.count()).where(
+             Attendance.date >= today - timedelta(days=190),
+             Attendance.date <= today,
+             Attendance.check_in.isnot(None)
+         )),
+        ("attendance year for one user (/dashboard)",
+         select(func.count(Attendance.id)).where(
+             Attendance.user_id == user_id,
+             Attendance.date >= year_start,
+             Attendance.date < date(today.year + 1, 1, 1)
+         )),
+        ("token blacklist lookup (verify_token)",
+         select(BlacklistedToken.id).where(BlacklistedToken.jti == 'jti').limit(1)),
+        ("leave ledger balance (create_leave_request)",
+         select(LeaveLedgerBalance.id).where(
+             LeaveLedgerBalance.user_id == user_id,
+             LeaveLedgerBalance.leave_type_id == 1,
+             LeaveLedgerBalance.year == today.year
+         )),
+    ]
+
+
+# =============================================================================
+# PLAN INSPECTION
+# =============================================================================
+
+def _seq_scans(plan):
+    """Relation names of every Seq Scan node in a JSON plan tree"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def _explain(conn, statement, disable_seqscan):
+    # render_postcompile expands IN (...) lists into plain bound parameters
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    with conn.begin():
+        if disable_seqscan:
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        raw = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return raw[0]["Plan"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every query")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    missing = 0
+    try:
+        with engine.connect() as conn:
+            for name, statement in build_catalogue():
+                plan = _explain(conn, statement, disable_seqscan=False)
+                scans = _seq_scans(plan)
+                forced_scans = _seq_scans(_explain(conn, statement, disable_seqscan=True)) if scans else []
+
+                if forced_scans:
+                    missing += 1
+                    status = f"MISSING INDEX  seq scan on {', '.join(sorted(set(forced_scans)))}"
+                elif scans:
+                    status = f"ok (seq scan on small {', '.join(sorted(set(scans)))}, index available)"
+                else:
+                    status = "ok"
+                print(f"{name:<52} {status}")
+                if args.verbose:
+                    print(json.dumps(plan, indent=2))
+    finally:
+        engine.dispose()
+
+    print(f"\n{missing} quer{'y' if missing == 1 else 'ies'} without a usable index.")
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Leave Balance Queries for Stafio
+================================
+Per-leave-type usage for one employee or for many employees at once.
+
+Used days come from ONE `GROUP BY leave_type_id` aggregate over the
+year's approved leave requests (by start_date), joined to leave_types and
+to the year's leave_balances rows, instead of one SUM (or one full row
+fetch) per leave type.
+
+Each usage row is a dict:
+    {
+        "leave_type_id": 1,
+        "name": "Casual Leave",
+        "max_days_per_year": 12,
+        "allocated": 10.0 | None,     # leave_balances.balance for the year
+        "used": 3.5,                  # SUM(num_days), half days count 0.5
+        "used_calendar_days": 4,      # SUM(end_date - start_date + 1)
+    }
+"""
+
+from datetime import date
+
+from sqlalchemy import func, select, and_, true
+
+from database import User, EmployeeProfile, LeaveType, LeaveBalance, LeaveRequest
+
+
+# =============================================================================
+# QUERY BUILDING
+# =============================================================================
+
+def _used_days_subquery(user_filter, year):
+    """Approved days per (user, leave type) of leaves starting in `year`, aggregated in the database"""
+    return select(
+        LeaveRequest.user_id,
+        LeaveRequest.leave_type_id,
+        func.sum(LeaveRequest.num_days).label('used'),
+        func.sum(LeaveRequest.end_date - LeaveRequest.start_date + 1).label('used_calendar_days')
+    ).where(
+        LeaveRequest.status == 'approved',
+        LeaveRequest.start_date >= date(year, 1, 1),
+        LeaveRequest.start_date < date(year + 1, 1, 1),
+        user_filter
+    ).group_by(
+        LeaveRequest.user_id,
+        LeaveRequest.leave_type_id
+    ).subquery()
+
+
+def _usage_from_row(row):
+    return {
+        "leave_type_id": row.leave_type_id,
+        "name": row.name,
+        "max_days_per_year": row.max_days_per_year,
+        "allocated": float(row.balance) if row.balance is not None else None,
+        "used": float(row.used) if row.used else 0,
+        "used_calendar_days": int(row.used_calendar_days) if row.used_calendar_days else 0,
+    }
+
+
+# =============================================================================
+# SINGLE EMPLOYEE
+# =============================================================================
+
+def get_leave_type_usage(db, user_id, year):
+    """
+    Usage of every leave type for one employee in `year`, ordered by leave
+    type id.
+    One query regardless of the number of leave types.
+    """
+    used = _used_days_subquery(LeaveRequest.user_id == user_id, year)
+
+    rows = db.execute(
+        select(
+            LeaveType.id.label('leave_type_id'),
+            LeaveType.name,
+            LeaveType.max_days_per_year,
+            LeaveBalance.balance,
+            used.c.used,
+            used.c.used_calendar_days
+        ).outerjoin(
+            LeaveBalance, and_(
+                LeaveBalance.leave_type_id == LeaveType.id,
+                LeaveBalance.user_id == user_id,
+                LeaveBalance.year == year
+            )
+        ).outerjoin(
+            used, used.c.leave_type_id == LeaveType.id
+        ).order_by(LeaveType.id)
+    ).all()
+
+    return [_usage_from_row(row) for row in rows]
+
+
+# =============================================================================
+# BULK (ADMIN REPORTS)
+# =============================================================================
+
+def get_bulk_leave_type_usage(db, year, user_ids=None, department=None):
+    """
+    Usage of every leave type in `year` for many employees in one query.
+
+    Select employees by `user_ids`, by `department` (employee_profiles), or
+    both; with neither, every employee is included. Returns a list of
+    {"user_id", "name", "department", "balances": [usage rows]} ordered by
+    user id.
+    """
+    employee_filter = [User.role == 'employee']
+    if user_ids is not None:
+        employee_filter = [User.id.in_(list(user_ids))]
+    if department:
+        employee_filter.append(EmployeeProfile.department == department)
+
+    employees = select(User.id).outerjoin(
+        EmployeeProfile, EmployeeProfile.user_id == User.id
+    ).where(*employee_filter)
+
+    used = _used_days_subquery(LeaveRequest.user_id.in_(employees.scalar_subquery()), year)
+
+    rows = db.execute(
+        select(
+            User.id.label('user_id'),
+            User.username,
+            User.first_name,
+            User.last_name,
+            EmployeeProfile.department,
+            LeaveType.id.label('leave_type_id'),
+            LeaveType.name,
+            LeaveType.max_days_per_year,
+            LeaveBalance.balance,
+            used.c.used,
+            used.c.used_calendar_days
+        ).select_from(User).outerjoin(
+            EmployeeProfile, EmployeeProfile.user_id == User.id
+        ).join(
+            LeaveType, true()
+        ).outerjoin(
+            LeaveBalance, and_(
+                LeaveBalance.user_id == User.id,
+                LeaveBalance.leave_type_id == LeaveType.id,
+                LeaveBalance.year == year
+            )
+        ).outerjoin(
+            used, and_(
+                used.c.user_id == User.id,
+                used.c.leave_type_id == LeaveType.id
+            )
+        ).where(
+            *employee_filter
+        ).order_by(User.id, LeaveType.id)
+    ).all()
+
+    report = []
+    current = None
+    for row in rows:
+        if current is None or current["user_id"] != row.user_id:
+            current = {
+                "user_id": row.user_id,
+                "name": f"{row.first_name or ''} {row.last_name or ''}".strip() or row.username,
+                "department": row.department,
+                "balances": []
+            }
+            report.append(current)
+        current["balances"].append(_usage_from_row(row))
+    return report
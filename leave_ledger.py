@@ -0,0 +1,368 @@
+"""
+Leave Ledger for Stafio
+=======================
+Append-only record of every change to a user's leave balance, per user,
+leave type and year, plus a running balance row that is maintained in the
+same transaction as the change.
+
+    leave_ledger_entries   credit/debit rows, never updated or deleted
+    leave_ledger_balances  allocated / pending / used per (user, type, year)
+
+available = allocated - pending - used
+
+Balance checks and /api/leave_balance read the running balance instead of
+summing leave_requests history. The request handlers call the record_*
+functions before they commit; nothing here commits on its own.
+
+A year is the year of the leave's start date. Balance rows are opened
+lazily: the first touch of a (user, type, year) credits the leave type's
+max_days_per_year and replays that key's existing leave_requests, so the
+ledger is correct even for keys that predate it.
+
+Maintenance (replays everything from leave_requests):
+    python leave_ledger.py verify     # report drift, change nothing
+    python leave_ledger.py rebuild    # rewrite entries + balances
+"""
+
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import func, select, and_, insert, update, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import (
+    SessionLocal, LeaveType, LeaveRequest,
+    LeaveLedgerEntry, LeaveLedgerBalance
+)
+
+
+# =============================================================================
+# RUNNING BALANCE
+# =============================================================================
+
+def _dec(value):
+    return Decimal(str(value or 0))
+
+
+def available_days(balance):
+    """Days that can still be requested against a running balance row"""
+    return float(balance.allocated - balance.pending - balance.used)
+
+
+def _history(db, user_id, leave_type_id, year):
+    """(pending, used) days for one key, summed from leave_requests"""
+    row = db.execute(
+        select(
+            func.coalesce(func.sum(LeaveRequest.num_days).filter(LeaveRequest.status == 'pending'), 0),
+            func.coalesce(func.sum(LeaveRequest.num_days).filter(LeaveRequest.status == 'approved'), 0)
+        ).where(
+            LeaveRequest.user_id == user_id,
+            LeaveRequest.leave_type_id == leave_type_id,
+            LeaveRequest.start_date >= date(year, 1, 1),
+            LeaveRequest.start_date < date(year + 1, 1, 1)
+        )
+    ).one()
+    return row[0], row[1]
+
+
+def _append(db, balance, event, allocated=0, pending=0, used=0, leave_request_id=None):
+    """Append one ledger entry and apply it to the (locked) running balance"""
+    allocated, pending, used = _dec(allocated), _dec(pending), _dec(used)
+
+    db.add(LeaveLedgerEntry(
+        user_id=balance.user_id,
+        leave_type_id=balance.leave_type_id,
+        year=balance.year,
+        leave_request_id=leave_request_id,
+        entry_type='credit' if allocated - pending - used > 0 else 'debit',
+        event=event,
+        allocated_delta=allocated,
+        pending_delta=pending,
+        used_delta=used
+    ))
+
+    balance.allocated = balance.allocated + allocated
+    balance.pending = balance.pending + pending
+    balance.used = balance.used + used
+
+
+def lock_balance(db, user_id, leave_type_id, year):
+    """
+    Running balance row for (user, leave type, year), locked FOR UPDATE so
+    concurrent requests for the same key serialise on it. Opens the row
+    (allocation + existing history) if it does not exist yet.
+    """
+    def _select():
+        return db.query(LeaveLedgerBalance).filter(
+            LeaveLedgerBalance.user_id == user_id,
+            LeaveLedgerBalance.leave_type_id == leave_type_id,
+            LeaveLedgerBalance.year == year
+        ).with_for_update().first()
+
+    balance = _select()
+    if balance:
+        return balance
+
+    created_id = db.execute(
+        pg_insert(LeaveLedgerBalance).values(
+            user_id=user_id, leave_type_id=leave_type_id, year=year,
+            allocated=0, pending=0, used=0, updated_at=datetime.utcnow()
+        ).on_conflict_do_nothing(
+            constraint='unique_ledger_balance'
+        ).returning(LeaveLedgerBalance.id)
+    ).scalar()
+
+    balance = _select()
+    if created_id is not None:
+        # We created the row: open it from the policy and the existing requests
+        max_days = db.query(LeaveType.max_days_per_year).filter(LeaveType.id == leave_type_id).scalar() or 0
+        pending, used = _history(db, user_id, leave_type_id, year)
+        _append(db, balance, 'opening', allocated=max_days, pending=pending, used=used)
+    return balance
+
+
+# =============================================================================
+# REQUEST LIFECYCLE
+# =============================================================================
+
+def record_request_created(db, leave_request, balance=None, event='request_created'):
+    """Reserve the days of a new (pending) request"""
+    if leave_request.id is None:
+        db.flush()
+    balance = balance or lock_balance(db, leave_request.user_id, leave_request.leave_type_id, leave_request.start_date.year)
+    _append(db, balance, event, pending=leave_request.num_days, leave_request_id=leave_request.id)
+    return balance
+
+
+def record_request_approved(db, leave_request):
+    """Move the days of a pending request from reserved to used"""
+    balance = lock_balance(db, leave_request.user_id, leave_request.leave_type_id, leave_request.start_date.year)
+    _append(db, balance, 'request_approved',
+            pending=-leave_request.num_days, used=leave_request.num_days,
+            leave_request_id=leave_request.id)
+    return balance
+
+
+def record_request_rejected(db, leave_request):
+    """Release the days reserved by a pending request"""
+    balance = lock_balance(db, leave_request.user_id, leave_request.leave_type_id, leave_request.start_date.year)
+    _append(db, balance, 'request_rejected', pending=-leave_request.num_days, leave_request_id=leave_request.id)
+    return balance
+
+
+def record_request_withdrawn(db, leave_request, event='request_deleted'):
+    """
+    Undo whatever the request currently holds (reserved or used days).
+    Call BEFORE changing or deleting the request; for an edit, follow up
+    with record_request_created(..., event='request_updated').
+    """
+    balance = lock_balance(db, leave_request.user_id, leave_request.leave_type_id, leave_request.start_date.year)
+    if leave_request.status == 'approved':
+        _append(db, balance, event, used=-leave_request.num_days, leave_request_id=leave_request.id)
+    elif leave_request.status == 'pending':
+        _append(db, balance, event, pending=-leave_request.num_days, leave_request_id=leave_request.id)
+    return balance
+
+
+# =============================================================================
+# POLICY CHANGES
+# =============================================================================
+
+def record_policy_change(db, leave_type_id, old_max_days, new_max_days):
+    """
+    Credit/debit the allocation change of a leave type to every open
+    balance of the current and future years (past years keep the policy
+    they were granted under). Set-based: one INSERT ... SELECT + one UPDATE.
+    """
+    delta = _dec(new_max_days) - _dec(old_max_days)
+    if delta == 0:
+        return
+
+    affected = and_(
+        LeaveLedgerBalance.leave_type_id == leave_type_id,
+        LeaveLedgerBalance.year >= datetime.now().year
+    )
+
+    db.execute(
+        insert(LeaveLedgerEntry).from_select(
+            ['user_id', 'leave_type_id', 'year', 'entry_type', 'event',
+             'allocated_delta', 'pending_delta', 'used_delta', 'created_at'],
+            select(
+                LeaveLedgerBalance.user_id,
+                LeaveLedgerBalance.leave_type_id,
+                LeaveLedgerBalance.year,
+                literal('credit' if delta > 0 else 'debit'),
+                literal('policy_change'),
+                literal(delta), literal(0), literal(0),
+                literal(datetime.utcnow())
+            ).where(affected)
+        )
+    )
+    db.execute(
+        update(LeaveLedgerBalance).where(affected).values(
+            allocated=LeaveLedgerBalance.allocated + delta,
+            updated_at=datetime.utcnow()
+        )
+    )
+
+
+# =============================================================================
+# READS
+# =============================================================================
+
+def get_year_balances(db, user_id, year):
+    """
+    Balance of every leave type for one user and year: one query over the
+    running balance rows. Types without a row yet report their policy
+    allocation and nothing used.
+    """
+    rows = db.execute(
+        select(
+            LeaveType.id,
+            LeaveType.name,
+            LeaveType.max_days_per_year,
+            LeaveLedgerBalance.allocated,
+            LeaveLedgerBalance.pending,
+            LeaveLedgerBalance.used
+        ).outerjoin(
+            LeaveLedgerBalance, and_(
+                LeaveLedgerBalance.leave_type_id == LeaveType.id,
+                LeaveLedgerBalance.user_id == user_id,
+                LeaveLedgerBalance.year == year
+            )
+        ).order_by(LeaveType.id)
+    ).all()
+
+    balances = []
+    for row in rows:
+        allocated = float(row.allocated) if row.allocated is not None else float(row.max_days_per_year)
+        pending = float(row.pending or 0)
+        used = float(row.used or 0)
+        balances.append({
+            "leave_type_id": row.id,
+            "name": row.name,
+            "allocated": allocated,
+            "pending": pending,
+            "used": used,
+            "available": allocated - pending - used
+        })
+    return balances
+
+
+# =============================================================================
+# VERIFY / REBUILD
+# =============================================================================
+
+def _expected_from_requests(db):
+    """{(user, type, year): (pending, used)} replayed from leave_requests"""
+    year = func.extract('year', LeaveRequest.start_date)
+    rows = db.execute(
+        select(
+            LeaveRequest.user_id,
+            LeaveRequest.leave_type_id,
+            year.label('year'),
+            func.coalesce(func.sum(LeaveRequest.num_days).filter(LeaveRequest.status == 'pending'), 0),
+            func.coalesce(func.sum(LeaveRequest.num_days).filter(LeaveRequest.status == 'approved'), 0)
+        ).where(
+            LeaveRequest.status.in_(['pending', 'approved'])
+        ).group_by(LeaveRequest.user_id, LeaveRequest.leave_type_id, year)
+    ).all()
+    return {(r[0], r[1], int(r[2])): (_dec(r[3]), _dec(r[4])) for r in rows}
+
+
+def verify_ledger(db):
+    """
+    Compare the running balances with (a) the sum of their ledger entries
+    and (b) a replay of leave_requests. Returns a list of problem strings.
+    """
+    problems = []
+
+    entry_sums = {
+        (r[0], r[1], r[2]): (_dec(r[3]), _dec(r[4]), _dec(r[5]))
+        for r in db.execute(
+            select(
+                LeaveLedgerEntry.user_id, LeaveLedgerEntry.leave_type_id, LeaveLedgerEntry.year,
+                func.sum(LeaveLedgerEntry.allocated_delta),
+                func.sum(LeaveLedgerEntry.pending_delta),
+                func.sum(LeaveLedgerEntry.used_delta)
+            ).group_by(LeaveLedgerEntry.user_id, LeaveLedgerEntry.leave_type_id, LeaveLedgerEntry.year)
+        ).all()
+    }
+    expected = _expected_from_requests(db)
+
+    balances = {}
+    for b in db.query(LeaveLedgerBalance).all():
+        key = (b.user_id, b.leave_type_id, b.year)
+        balances[key] = b
+        if entry_sums.get(key) != (b.allocated, b.pending, b.used):
+            problems.append(f"{key}: balance {b.allocated}/{b.pending}/{b.used} != entries {entry_sums.get(key)}")
+        pending, used = expected.get(key, (Decimal(0), Decimal(0)))
+        if (b.pending, b.used) != (pending, used):
+            problems.append(f"{key}: pending/used {b.pending}/{b.used} != leave_requests {pending}/{used}")
+
+    for key in expected:
+        if key not in balances:
+            problems.append(f"{key}: has leave requests but no ledger balance")
+
+    return problems
+
+
+def rebuild_ledger(db):
+    """
+    Replay the ledger from leave_requests: every key gets one 'rebuild'
+    entry with its allocation (kept from the existing balance, else the
+    current policy) and the pending/used days of its requests. The caller
+    commits. Returns the number of balances written.
+    """
+    allocations = {
+        (b.user_id, b.leave_type_id, b.year): b.allocated
+        for b in db.query(LeaveLedgerBalance).all()
+    }
+    policies = dict(db.query(LeaveType.id, LeaveType.max_days_per_year).all())
+    expected = _expected_from_requests(db)
+
+    db.query(LeaveLedgerEntry).delete(synchronize_session=False)
+    db.query(LeaveLedgerBalance).delete(synchronize_session=False)
+
+    now = datetime.utcnow()
+    written = 0
+    for user_id, leave_type_id, year in sorted(set(allocations) | set(expected)):
+        if leave_type_id not in policies:
+            continue
+        written += 1
+        allocated = allocations.get((user_id, leave_type_id, year), _dec(policies[leave_type_id]))
+        pending, used = expected.get((user_id, leave_type_id, year), (Decimal(0), Decimal(0)))
+        db.add(LeaveLedgerBalance(
+            user_id=user_id, leave_type_id=leave_type_id, year=year,
+            allocated=allocated, pending=pending, used=used, updated_at=now
+        ))
+        db.add(LeaveLedgerEntry(
+            user_id=user_id, leave_type_id=leave_type_id, year=year,
+            entry_type='credit' if allocated - pending - used > 0 else 'debit',
+            event='rebuild',
+            allocated_delta=allocated, pending_delta=pending, used_delta=used,
+            created_at=now
+        ))
+    return written
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'verify'
+    db = SessionLocal()
+    try:
+        if command == 'rebuild':
+            count = rebuild_ledger(db)
+            db.commit()
+            print(f"Rebuilt {count} leave ledger balances from leave_requests.")
+        elif command == 'verify':
+            problems = verify_ledger(db)
+            for problem in problems:
+                print(problem)
+            print(f"{len(problems)} problem(s) found.")
+            sys.exit(1 if problems else 0)
+        else:
+            print("Usage: python leave_ledger.py [verify|rebuild]")
+            sys.exit(2)
+    finally:
+        db.close()
@@ -0,0 +1,50 @@
+"""
+Leave Period Overlap Detection for Stafio
+=========================================
+Every leave request carries a PostgreSQL `period` daterange (inclusive of
+both start and end date) and the table has an exclusion constraint:
+
+    EXCLUDE USING gist (user_id WITH =, period WITH &&)
+        WHERE (status IN ('pending', 'approved'))
+
+find_overlapping_leave() is the friendly pre-check used to build the error
+message: a single probe of that GiST index. The constraint itself is what
+makes the check race-free - when two submissions for the same days arrive
+together, the second INSERT/UPDATE fails and is_overlap_violation() lets
+the endpoint answer it like any other overlap.
+"""
+
+from sqlalchemy import func
+
+from database import LeaveRequest
+
+
+# Statuses that hold a period (rejected requests free their days again)
+ACTIVE_STATUSES = ('pending', 'approved')
+
+OVERLAP_CONSTRAINT = 'excl_leave_requests_user_period'
+
+# SQLSTATE exclusion_violation
+_EXCLUSION_VIOLATION = '23P01'
+
+
+def find_overlapping_leave(db, user_id, start_date, end_date, exclude_id=None):
+    """First active leave of the user sharing a day with [start_date, end_date]"""
+    query = db.query(LeaveRequest).filter(
+        LeaveRequest.user_id == user_id,
+        LeaveRequest.status.in_(ACTIVE_STATUSES),
+        LeaveRequest.period.overlaps(func.daterange(start_date, end_date, '[]'))
+    )
+    if exclude_id is not None:
+        query = query.filter(LeaveRequest.id != exclude_id)
+    return query.first()
+
+
+def is_overlap_violation(exc):
+    """True when an IntegrityError was raised by the period exclusion constraint"""
+    orig = getattr(exc, 'orig', None)
+    if getattr(orig, 'pgcode', None) != _EXCLUSION_VIOLATION:
+        return False
+    diag = getattr(orig, 'diag', None)
+    constraint = getattr(diag, 'constraint_name', None)
+    return constraint in (None, OVERLAP_CONSTRAINT)
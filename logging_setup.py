@@ -0,0 +1,162 @@
+"""
+Structured Logging for Stafio
+=============================
+Modules log through `logging.getLogger(__name__)`; setup_logging() routes
+every record through a QueueHandler, so the request thread only formats
+the message and puts it on an in-memory queue. A QueueListener thread owns
+the real handlers (stderr, and LOG_FILE when set) and does all the I/O.
+
+Configuration (environment):
+  - LOG_LEVEL: root level (default INFO)
+  - LOG_LEVELS: per-module overrides, e.g. "auth=DEBUG,admin_endpoints=WARNING"
+  - LOG_DEBUG_SAMPLE_RATE: fraction of DEBUG records kept (default 0.1);
+    records at INFO and above are never sampled
+  - LOG_FORMAT: "json" (default, one object per line) or "text"
+  - LOG_FILE: also write to this file (reopened when rotated externally)
+
+Extra fields passed as `logger.info("...", extra={"user_id": 3})` become
+keys of the JSON object. Use redact_headers() before logging request
+headers.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.1'))
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_FILE = os.getenv('LOG_FILE', '')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+SENSITIVE_HEADERS = frozenset({
+    'authorization', 'proxy-authorization', 'cookie', 'set-cookie',
+    'x-api-key', 'x-auth-token', 'x-csrf-token', 'x-xsrf-token',
+})
+REDACTED = '[REDACTED]'
+
+# Attributes every LogRecord has; anything else was passed via `extra`
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def redact_headers(headers):
+    """Copy of a headers mapping with credentials masked"""
+    return {
+        key: REDACTED if key.lower() in SENSITIVE_HEADERS else value
+        for key, value in dict(headers).items()
+    }
+
+
+# =============================================================================
+# FILTERS AND FORMATTERS
+# =============================================================================
+
+class DebugSampler(logging.Filter):
+    """Keeps `rate` of the DEBUG records; other levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extras"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Drops the record instead of blocking when the listener falls behind"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+# =============================================================================
+# SETUP
+# =============================================================================
+
+_listener = None
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Install the queue-based handlers on the root logger (once per process)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_FORMAT == 'text':
+        formatter = logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s')
+    else:
+        formatter = JsonFormatter()
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        handlers.append(logging.handlers.WatchedFileHandler(LOG_FILE, delay=True))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush the queue and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,210 @@
+"""
+Media Store for Stafio
+======================
+Uploaded files live on disk, named by the SHA-256 of their content:
+
+    MEDIA_ROOT/3f/3fa1...e9      (first two hex digits as a fan-out directory)
+
+The same bytes are stored once however often they are uploaded, and a
+file never changes once written, so GET /media/<sha256> is served with
+`Cache-Control: immutable` and a year of max-age.
+
+EmployeeProfile.profile_image used to hold the whole picture as a
+`data:image/...;base64,...` string, which every list endpoint loaded and
+serialised. It now holds the short path "/media/<sha256>"; public_url()
+turns it into the absolute URL the frontend (another origin) can load.
+The migration 0a6e4d2c9b71 moves existing data URLs into the store.
+
+MEDIA_ROOT must be persistent storage shared by all web workers.
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+from urllib.parse import urlsplit
+
+from flask import has_request_context, request
+
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media'))
+# optional public origin of this API, e.g. https://api.example.com (default: the request's)
+MEDIA_BASE_URL = os.getenv('MEDIA_BASE_URL', '').rstrip('/')
+MAX_IMAGE_BYTES = int(os.getenv('MEDIA_MAX_IMAGE_BYTES', str(10 * 1024 * 1024)))
+
+MEDIA_PREFIX = '/media/'
+CHUNK_SIZE = 64 * 1024
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+_DATA_URL = re.compile(r'^data:([\w.+/-]*)(;[\w=.+-]+)*?;base64,', re.I)
+
+# (magic prefix, mime type) of the formats served as images
+_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+]
+
+
+class ContentStore:
+    """Content-addressed files under one root directory"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        if not _SHA256.match(digest or ''):
+            raise ValueError("Not a SHA-256 digest")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        try:
+            return os.path.isfile(self.path(digest))
+        except ValueError:
+            return False
+
+    def save_stream(self, stream, max_bytes=None):
+        """
+        Copy a file object into the store in CHUNK_SIZE pieces, hashing as it
+        goes (memory use does not grow with the file). Returns (sha256, size).
+        Raises ValueError when the content exceeds max_bytes.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = self.temp_file()
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ValueError(f"File exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            sha256 = digest.hexdigest()
+            self.commit(tmp_path, sha256)
+            return sha256, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def temp_file(self):
+        """(fd, path) of a new temp file on the store's filesystem, for commit()"""
+        os.makedirs(self.root, exist_ok=True)
+        return tempfile.mkstemp(dir=self.root, prefix='.upload-')
+
+    def commit(self, tmp_path, sha256):
+        """Move a complete temp file whose content hashes to sha256 into place"""
+        target = self.path(sha256)
+        if os.path.exists(target):
+            os.unlink(tmp_path)  # already stored: deduplicated
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)  # atomic: readers never see a partial file
+        return target
+
+    def save_bytes(self, data, max_bytes=None):
+        return self.save_stream(io.BytesIO(data), max_bytes)
+
+
+store = ContentStore(MEDIA_ROOT)
+
+
+def sniff_mime(head):
+    """Image type from the first bytes of a file; None for anything else"""
+    for signature, mime in _SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def media_mime(digest):
+    with open(store.path(digest), 'rb') as f:
+        return sniff_mime(f.read(16)) or 'application/octet-stream'
+
+
+# =============================================================================
+# PROFILE IMAGE VALUES
+# =============================================================================
+
+def media_path(digest):
+    return f"{MEDIA_PREFIX}{digest}"
+
+
+def digest_from_value(value):
+    """The SHA-256 behind a stored "/media/<sha256>" value, else None"""
+    if value and value.startswith(MEDIA_PREFIX):
+        digest = value[len(MEDIA_PREFIX):]
+        if _SHA256.match(digest):
+            return digest
+    return None
+
+
+def save_image_upload(file_storage):
+    """Store an uploaded image (werkzeug FileStorage); returns its "/media/<sha256>" value"""
+    digest, _size = store.save_stream(file_storage.stream, MAX_IMAGE_BYTES)
+    return media_path(digest)
+
+
+def decode_data_url(value):
+    """(mime, bytes) of a base64 data URL; ValueError if it is not one"""
+    match = _DATA_URL.match(value or '')
+    if not match:
+        raise ValueError("Not a base64 data URL")
+    try:
+        return match.group(1) or None, base64.b64decode(value[match.end():], validate=False)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 data URL: {e}")
+
+
+def _own_media_path(url):
+    """"/media/<sha256>" for an absolute URL of a file in this store (as public_url() returns), else None"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or parts.query or parts.fragment:
+        return None
+    digest = digest_from_value(parts.path)
+    # any host: behind a proxy the URL the client saw is not request.host_url
+    if digest is None or not store.exists(digest):
+        return None
+    return media_path(digest)
+
+
+def image_value(value):
+    """
+    What to store in profile_image for a value sent by a client: data URLs
+    are moved into the store, this API's own absolute /media/ URLs (GET
+    responses sent back by profile forms) become the short path again, and
+    anything else (other URLs, "/media/..." or empty) is kept as it is.
+    """
+    if value and value.startswith('data:'):
+        _mime, data = decode_data_url(value)
+        digest, _size = store.save_bytes(data, MAX_IMAGE_BYTES)
+        return media_path(digest)
+    if value and value.startswith(('http://', 'https://')):
+        return _own_media_path(value) or value
+    return value
+
+
+def absolute_url(path):
+    """This API's public URL for a path ("/media/...", "/api/avatar/...")"""
+    base = MEDIA_BASE_URL
+    if not base and has_request_context():
+        base = request.host_url.rstrip('/')
+    return f"{base}{path}"
+
+
+def public_url(value):
+    """Absolute URL for a stored "/media/<sha256>" value; other values unchanged"""
+    if not value or not value.startswith(MEDIA_PREFIX):
+        return value
+    return absolute_url(value)
@@ -0,0 +1,178 @@
+"""
+Connection Pool Monitoring for Stafio
+=====================================
+Instrumented pool classes and the counters behind GET /internal/pool.
+
+Every gunicorn worker owns its own engine and pool, so the numbers are per
+process (the response carries the pid). Collected:
+  - checkout wait: time spent in pool.connect() (waiting for a free
+    connection, opening a new one, the pre-ping) as a histogram;
+  - checkout timeouts and invalidated (stale/broken) connections;
+  - the age of every DBAPI connection the pool currently holds open.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, NullPool
+
+
+# Upper bounds (ms) of the checkout wait histogram buckets, plus "+Inf"
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+# =============================================================================
+# COUNTERS
+# =============================================================================
+
+class PoolStats:
+    """Thread-safe counters shared by the pool and its event listeners"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.timeouts = 0
+            self.invalidated = 0
+            self.opened = 0
+            self.opened_at = {}
+
+    def record_wait(self, seconds):
+        ms = seconds * 1000
+        index = len(WAIT_BUCKETS_MS)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self.buckets[index] += 1
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_invalidated(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def connection_opened(self, key):
+        with self._lock:
+            self.opened += 1
+            self.opened_at[key] = time.time()
+
+    def connection_closed(self, key):
+        with self._lock:
+            self.opened_at.pop(key, None)
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            ages = sorted(now - opened for opened in self.opened_at.values())
+            histogram = {}
+            for bound, count in zip(WAIT_BUCKETS_MS, self.buckets):
+                histogram[f"le_{bound}ms"] = count
+            histogram["le_inf"] = self.buckets[-1]
+            return {
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.timeouts,
+                "checkout_wait_ms": {
+                    "avg": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0,
+                    "max": round(self.wait_max * 1000, 3),
+                    "histogram": histogram,
+                },
+                "connections_opened_total": self.opened,
+                "connections_invalidated_total": self.invalidated,
+                "connection_age_seconds": {
+                    "open": len(ages),
+                    "min": round(ages[0], 1) if ages else None,
+                    "max": round(ages[-1], 1) if ages else None,
+                    "avg": round(sum(ages) / len(ages), 1) if ages else None,
+                },
+            }
+
+
+stats = PoolStats()
+
+
+# =============================================================================
+# INSTRUMENTED POOLS
+# =============================================================================
+
+class _TimedCheckout:
+    """Times Pool.connect(), which is what Engine.connect()/Session call"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            stats.record_timeout()
+            raise
+        finally:
+            stats.record_wait(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+def instrument(engine):
+    """Track connection lifetimes of the engine's pool"""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.connection_opened(id(dbapi_connection))
+
+    @event.listens_for(engine, "close")
+    def _on_close(dbapi_connection, connection_record):
+        stats.connection_closed(id(dbapi_connection))
+
+    @event.listens_for(engine, "close_detached")
+    def _on_close_detached(dbapi_connection):
+        stats.connection_closed(id(dbapi_connection))
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.record_invalidated()
+
+    return engine
+
+
+# =============================================================================
+# REPORT
+# =============================================================================
+
+def pool_status(engine, config):
+    """Current pool occupancy plus the collected counters"""
+    pool = engine.pool
+    result = {
+        "pid": os.getpid(),
+        "pool_class": type(pool).__name__,
+        "config": config,
+    }
+    if isinstance(pool, QueuePool):
+        result.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # QueuePool.overflow() is negative while the pool is not full yet
+            "overflow": max(pool.overflow(), 0),
+        })
+    result.update(stats.snapshot())
+    return result
@@ -0,0 +1,120 @@
+"""
+Employee Profile Enrichment for Stafio
+======================================
+Resolves the display details of employees (name, emp_id, position,
+department, avatar, ...) for a whole result set in ONE query.
+
+List endpoints used to run one EmployeeProfile lookup per result row; they
+now collect the user ids of the page they are about to render and call
+load_employee_cards() once:
+
+    cards = load_employee_cards(db, [req.user_id for req, user, lt in rows])
+    card = cards.get(req.user_id) or empty_card(req.user_id)
+"""
+
+from database import User, EmployeeProfile
+from media_store import public_url
+from avatar_service import avatar_url
+
+
+# =============================================================================
+# FORMATTING HELPERS
+# =============================================================================
+
+def display_name(first_name, last_name, username):
+    """'First Last', falling back to the username when both are empty"""
+    return f"{first_name or ''} {last_name or ''}".strip() or username
+
+
+# =============================================================================
+# BATCH LOOKUP
+# =============================================================================
+
+def empty_card(user_id, name=""):
+    """Card for a user that could not be resolved (deleted in between, etc.)"""
+    return {
+        "user_id": user_id,
+        "name": name,
+        "username": name,
+        "first_name": None,
+        "last_name": None,
+        "email": None,
+        "phone": None,
+        "has_profile": False,
+        "emp_id": str(user_id),
+        "position": None,
+        "department": None,
+        "status": None,
+        "emp_type": None,
+        "joining_date": None,
+        "profile_image": None,
+        "image": avatar_url(user_id, None, name),
+    }
+
+
+def load_employee_cards(db, user_ids):
+    """
+    Resolve user + profile details for every id in `user_ids` with a single
+    users LEFT JOIN employee_profiles query.
+
+    Returns a dict {user_id: card}. Profile fields are returned raw (None when
+    the user has no profile, check card["has_profile"]) so every endpoint can
+    keep its own defaults; "emp_id" already falls back to the user id.
+    "profile_image" is the absolute URL of the full picture, "image" the
+    list-sized thumbnail (or initials) from /api/avatar.
+    """
+    ids = set()
+    for uid in user_ids:
+        if uid is None:
+            continue
+        try:
+            ids.add(int(uid))
+        except (ValueError, TypeError):
+            continue
+
+    if not ids:
+        return {}
+
+    rows = db.query(
+        User.id,
+        User.username,
+        User.first_name,
+        User.last_name,
+        User.email,
+        User.phone,
+        EmployeeProfile.id.label('profile_id'),
+        EmployeeProfile.emp_id,
+        EmployeeProfile.position,
+        EmployeeProfile.department,
+        EmployeeProfile.status,
+        EmployeeProfile.emp_type,
+        EmployeeProfile.joining_date,
+        EmployeeProfile.profile_image,
+    ).outerjoin(
+        EmployeeProfile, EmployeeProfile.user_id == User.id
+    ).filter(
+        User.id.in_(ids)
+    ).all()
+
+    cards = {}
+    for row in rows:
+        name = display_name(row.first_name, row.last_name, row.username)
+        cards[row.id] = {
+            "user_id": row.id,
+            "name": name,
+            "username": row.username,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "email": row.email,
+            "phone": row.phone,
+            "has_profile": row.profile_id is not None,
+            "emp_id": row.emp_id or str(row.id),
+            "position": row.position,
+            "department": row.department,
+            "status": row.status,
+            "emp_type": row.emp_type,
+            "joining_date": row.joining_date,
+            "profile_image": public_url(row.profile_image),
+            "image": avatar_url(row.id, row.profile_image, name),
+        }
+    return cards
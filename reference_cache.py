@@ -0,0 +1,156 @@
+"""
+Reference-Data Cache for Stafio
+===============================
+Leave types, departments, system settings and holiday calendars are read
+on nearly every request but change rarely. This module keeps them per
+process as plain dicts/lists (never ORM objects), each entry tagged with
+the version of its resource (resource_versions.py):
+
+  - a write to the underlying rows bumps the version in the same
+    transaction; the writing worker applies it on commit and the other
+    workers get it through pg_notify/LISTEN, so the next read reloads;
+  - entries older than REFERENCE_CACHE_TTL_SECONDS are reloaded anyway,
+    as a safety net for changes made outside the ORM (psql, scripts).
+
+Loads read from the primary even when the session reads from a replica:
+the new version arrives over LISTEN before a lagging replica has the rows,
+and old rows cached under it would stay for the whole TTL. Nothing is
+cached from a session that has written (its rows are not committed yet).
+
+Cached values are shared between threads: treat them as read-only.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from database import Department, EmployeeProfile, LeaveType, SystemSettings
+from resource_versions import versions
+
+TTL_SECONDS = float(os.getenv('REFERENCE_CACHE_TTL_SECONDS', '300'))
+MAX_ENTRIES = int(os.getenv('REFERENCE_CACHE_MAX_ENTRIES', '256'))
+
+
+class ReferenceCache:
+    """(resource, key) -> value, valid while the resource version is unchanged"""
+
+    def __init__(self, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (resource, key) -> (version, loaded_at, value)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, resource, key, db, loader):
+        """The cached value, or loader(db) on the primary when missing, outdated or expired"""
+        # Read the version before loading: a change in between only costs a reload
+        version = versions.get(resource)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((resource, key))
+            if (entry is not None and version is not None
+                    and entry[0] == version and now - entry[1] < self.ttl):
+                self.stats["hits"] += 1
+                return entry[2]
+            self.stats["misses"] += 1
+
+        with db.primary_reads():
+            value = loader(db)
+        if version is not None and not db.wrote:
+            with self._lock:
+                self._entries[(resource, key)] = (version, now, value)
+                self._entries.move_to_end((resource, key))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, resource=None):
+        with self._lock:
+            for cache_key in [k for k in self._entries if resource is None or k[0] == resource]:
+                del self._entries[cache_key]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries))
+
+
+cache = ReferenceCache()
+
+
+# =============================================================================
+# SETTINGS
+# =============================================================================
+
+def _load_settings(db):
+    return {
+        s.setting_key: {"value": s.setting_value, "type": s.setting_type, "description": s.description}
+        for s in db.query(SystemSettings)
+    }
+
+
+def settings(db):
+    """All system settings: {key: {"value", "type", "description"}}"""
+    return cache.get('settings', 'all', db, _load_settings)
+
+
+def setting(db, key, default=None):
+    """One setting's raw string value"""
+    entry = settings(db).get(key)
+    return entry["value"] if entry is not None else default
+
+
+# =============================================================================
+# LEAVE TYPES
+# =============================================================================
+
+def _load_leave_types(db):
+    return [
+        {
+            "id": lt.id,
+            "name": lt.name,
+            "description": lt.description,
+            "max_days_per_year": lt.max_days_per_year,
+            "type": lt.type,
+            "created_at": lt.created_at,
+        }
+        for lt in db.query(LeaveType).order_by(LeaveType.id)
+    ]
+
+
+def leave_types(db):
+    """All leave types as dicts, by id"""
+    return cache.get('leave_types', 'all', db, _load_leave_types)
+
+
+def leave_type(db, leave_type_id):
+    """One leave type dict, None if there is no such type"""
+    return next((lt for lt in leave_types(db) if lt["id"] == leave_type_id), None)
+
+
+# =============================================================================
+# DEPARTMENTS
+# =============================================================================
+
+def _load_departments(db):
+    dept_list = [{"id": d.id, "name": d.name, "description": d.description} for d in db.query(Department)]
+
+    # Also departments only named on employee profiles
+    existing_names = {d["name"] for d in dept_list}
+    profile_depts = db.execute(
+        select(EmployeeProfile.department).where(
+            EmployeeProfile.department.isnot(None),
+            EmployeeProfile.department != ""
+        ).distinct()
+    ).scalars()
+    for name in profile_depts:
+        if name and name not in existing_names:
+            dept_list.append({"id": None, "name": name, "description": ""})
+    return dept_list
+
+
+def departments(db):
+    """The GET /api/departments list: departments table + profile-only names"""
+    return cache.get('departments', 'all', db, _load_departments)
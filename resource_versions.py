@@ -0,0 +1,240 @@
+"""
+Conditional GETs for Stafio reference data
+==========================================
+Holidays, leave types, departments and settings change rarely but are
+fetched on every page load. Each of these resources has a version counter
+in `resource_versions`; its GET endpoints send a strong ETag built from it
+and answer a matching If-None-Match with 304 before running any query.
+
+The counters are bumped by a flush hook (install_resource_versions), in the
+same transaction as the write, whenever a POST/PUT/DELETE handler - or any
+other code - changes a row the resource is built from. The new version is
+applied to this process's copy on commit and sent to the other workers
+with pg_notify on the event_stream channel, so checking a version is a
+dict lookup while the LISTEN connection is up. While it is down the
+versions are re-read from the database every VERSION_TTL_SECONDS.
+
+Versions and the bodies served under them are read from the primary: a
+notified version can be ahead of a lagging replica, and a stale body
+cached under the new ETag would be revalidated with 304s until the next
+bump.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, make_response, request
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from database import Department, EmployeeProfile, Holiday, LeaveType, ResourceVersion, SessionLocal, SystemSettings
+from db_session import use_primary
+from event_stream import CHANNEL, listener
+
+logger = logging.getLogger(__name__)
+
+VERSION_TTL_SECONDS = float(os.getenv('RESOURCE_VERSION_TTL_SECONDS', '1'))
+# > 0 lets browsers reuse a response this long without revalidating
+MAX_AGE_SECONDS = int(os.getenv('REFERENCE_MAX_AGE_SECONDS', '0'))
+# changes every ETag on deploy, in case a response format changed
+BUILD_ID = os.getenv('ETAG_BUILD_ID') or os.getenv('RENDER_GIT_COMMIT', '')[:12]
+
+
+def _profile_department_changed(obj, state):
+    return state in ('new', 'deleted') or inspect(obj).attrs.department.history.has_changes()
+
+
+# model -> (resource, does this change affect it?)
+RESOURCE_MODELS = {
+    Holiday: ('holidays', None),
+    LeaveType: ('leave_types', None),
+    Department: ('departments', None),
+    # GET /api/departments also lists departments only named on profiles
+    EmployeeProfile: ('departments', _profile_department_changed),
+    SystemSettings: ('settings', None),
+}
+
+
+# =============================================================================
+# VERSION BUMPS (flush hook)
+# =============================================================================
+
+def changed_resources(session):
+    """Resources affected by the flush in progress"""
+    resources = set()
+    for state, objects in (('new', session.new), ('dirty', session.dirty), ('deleted', session.deleted)):
+        for obj in objects:
+            entry = RESOURCE_MODELS.get(type(obj))
+            if entry is None:
+                continue
+            resource, affects = entry
+            if state == 'dirty' and not session.is_modified(obj):
+                continue
+            if affects is None or affects(obj, state):
+                resources.add(resource)
+    return resources
+
+
+def bump_versions(connection, resources):
+    """Increment the resources' counters and announce them; returns {resource: version}"""
+    bumped = {}
+    for resource in sorted(resources):  # same lock order in every transaction
+        version = connection.execute(
+            insert(ResourceVersion)
+            .values(resource=resource, version=1, updated_at=func.now())
+            .on_conflict_do_update(
+                index_elements=[ResourceVersion.resource],
+                set_={"version": ResourceVersion.version + 1, "updated_at": func.now()},
+            )
+            .returning(ResourceVersion.version)
+        ).scalar()
+        connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": CHANNEL, "payload": json.dumps(
+                {"event": "resource_version", "resource": resource, "version": version})}
+        )
+        bumped[resource] = version
+    return bumped
+
+
+def _bump_after_flush(session, flush_context):
+    resources = changed_resources(session)
+    if resources:
+        bumped = bump_versions(session.connection(), resources)
+        session.info.setdefault('resource_versions', {}).update(bumped)
+
+
+def _apply_after_commit(session):
+    bumped = session.info.pop('resource_versions', None)
+    if bumped:
+        # Before our own notification arrives: the writer's next GET must not get a 304
+        versions.update(bumped)
+
+
+def _discard_after_rollback(session):
+    session.info.pop('resource_versions', None)
+
+
+def install_resource_versions(session_factory):
+    """Bump resource versions from every flush of sessions made by the factory"""
+    for name, fn in (('after_flush', _bump_after_flush),
+                     ('after_commit', _apply_after_commit),
+                     ('after_rollback', _discard_after_rollback)):
+        if not event.contains(session_factory, name, fn):
+            event.listen(session_factory, name, fn)
+    listener.add_handler('resource_version', lambda change: versions.update({change["resource"]: change["version"]}))
+
+
+# =============================================================================
+# PROCESS-LOCAL VERSIONS
+# =============================================================================
+
+class VersionCache:
+    """This process's copy of resource_versions"""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._generation = None  # listener generation the copy was loaded under
+
+    def update(self, bumped):
+        with self._lock:
+            for resource, version in bumped.items():
+                # notifications can arrive after a reload already saw a newer value
+                self._versions[resource] = max(version, self._versions.get(resource, 0))
+
+    def _fresh(self):
+        if self._loaded_at is None:
+            return False
+        if listener.connected and self._generation == listener.generation:
+            return True
+        return time.monotonic() - self._loaded_at < VERSION_TTL_SECONDS
+
+    def _reload(self):
+        # Read the generation first: a reconnect during the load makes us reload again
+        generation = listener.generation if listener.connected else None
+        db = SessionLocal()  # the primary, never a replica
+        try:
+            rows = db.execute(select(ResourceVersion.resource, ResourceVersion.version)).all()
+        finally:
+            db.close()
+        with self._lock:
+            for resource, version in rows:
+                self._versions[resource] = max(version, self._versions.get(resource, 0))
+            self._loaded_at = time.monotonic()
+            self._generation = generation
+
+    def get(self, resource):
+        """Current version of the resource, None if it cannot be determined"""
+        listener.start()
+        if not self._fresh():
+            try:
+                self._reload()
+            except Exception as e:
+                logger.error("Could not load resource versions: %s", e)
+                return None
+        with self._lock:
+            return self._versions.get(resource, 0)
+
+
+versions = VersionCache()
+
+
+# =============================================================================
+# CONDITIONAL GET
+# =============================================================================
+
+def make_etag(resource, version, variant=''):
+    """Strong ETag value (unquoted) for one representation of the resource"""
+    tag = f"{resource}-{version}"
+    suffix = '|'.join(part for part in (BUILD_ID, variant) if part)
+    if suffix:
+        tag += '-' + hashlib.sha1(suffix.encode()).hexdigest()[:10]
+    return tag
+
+
+def skip_etag():
+    """Keep the current response out of caches (e.g. a 200 returned for an error)"""
+    g.skip_etag = True
+
+
+def _cache_headers(response, etag):
+    response.set_etag(etag)
+    if MAX_AGE_SECONDS > 0:
+        response.headers['Cache-Control'] = f"public, max-age={MAX_AGE_SECONDS}, must-revalidate"
+    else:
+        response.headers['Cache-Control'] = "no-cache"
+    return response
+
+
+def conditional_get(resource, variant=None):
+    """
+    Decorator for a GET built from `resource`: ETag + Cache-Control on 200s,
+    304 for a matching If-None-Match without calling the view.
+    `variant()` returns what else the representation depends on (e.g. the year).
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            version = versions.get(resource)
+            if version is None:
+                return fn(*args, **kwargs)
+            etag = make_etag(resource, version, variant() if variant else '')
+
+            if request.if_none_match.contains_weak(etag):
+                return _cache_headers(make_response('', 304), etag)
+
+            # The body must be at least as new as the version in its ETag
+            use_primary()
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code == 200 and not g.get('skip_etag'):
+                _cache_headers(response, etag)
+            return response
+        return decorator
+    return wrapper
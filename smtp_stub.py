@@ -0,0 +1,123 @@
+"""
+Local SMTP Stand-in for Testing the Email Outbox
+================================================
+A minimal SMTP server (in the spirit of aiosmtpd's Debugging handler, with
+no extra dependency) that accepts mail on localhost and logs it instead of
+delivering it. It can simulate the failures the outbox worker must handle.
+
+    python smtp_stub.py --port 1025
+    python smtp_stub.py --port 1025 --fail-first 3     # 451 for the first 3 messages
+    python smtp_stub.py --port 1025 --reject bad.test  # 550 for that domain
+
+Then run the worker against it (no STARTTLS, no login):
+
+    SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_STARTTLS=false python email_outbox.py drain
+
+Tests can also embed it: SmtpStub(port=0).start() returns the server; the
+bound port is server.port, received mail is in server.messages and
+server.connections counts SMTP sessions (one per worker batch run when
+the session is reused).
+"""
+
+import argparse
+import socketserver
+import threading
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 smtp-stub ready")
+        mail_from, rcpt_to = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+
+            if verb == "EHLO":
+                self.wfile.write(b"250-smtp-stub\r\n250 8BITMIME\r\n")
+            elif verb == "HELO":
+                self.reply("250 smtp-stub")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = line.split(":", 1)[1].strip(), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = line.split(":", 1)[1].strip().strip("<>")
+                if address.rsplit("@", 1)[-1] in server.reject_domains:
+                    self.reply("550 No such user here")
+                else:
+                    rcpt_to.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                with server.lock:
+                    fail = server.fail_remaining > 0
+                    if fail:
+                        server.fail_remaining -= 1
+                    else:
+                        server.messages.append({"from": mail_from, "to": rcpt_to, "data": b"".join(data)})
+                if fail:
+                    self.reply("451 Temporary local problem, try again")
+                else:
+                    print(f"smtp-stub: message {len(server.messages)} for {', '.join(rcpt_to)}")
+                    self.reply("250 OK: queued")
+                mail_from, rcpt_to = None, []
+            elif verb == "RSET":
+                mail_from, rcpt_to = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=1025, fail_first=0, reject_domains=()):
+        super().__init__((host, port), _SmtpHandler)
+        self.port = self.server_address[1]
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.fail_remaining = fail_first
+        self.reject_domains = set(reject_domains)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="smtp-stub", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP stand-in for the email outbox worker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--fail-first", type=int, default=0, help="answer 451 to the first N messages")
+    parser.add_argument("--reject", action="append", default=[], help="answer 550 to recipients at this domain")
+    args = parser.parse_args()
+
+    server = SmtpStub(args.host, args.port, args.fail_first, args.reject)
+    print(f"smtp-stub listening on {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
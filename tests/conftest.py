@@ -0,0 +1,44 @@
+"""Shared test setup: the application modules live at the repository root."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    """
+    Flask app with g.db (db_session.py) over two SQLite files: the primary
+    and a replica that has not caught up. Both have a table items(name):
+    the primary holds "old" and "new", the replica only "old".
+    """
+    pytest.importorskip("psycopg2")  # database.py builds its (unused) Postgres engine on import
+    from flask import Flask
+    from sqlalchemy import create_engine, text
+
+    import database
+    import db_session
+
+    def make_db(name, rows):
+        engine = create_engine(f"sqlite:///{tmp_path / name}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE items (name TEXT)"))
+            for row in rows:
+                conn.execute(text("INSERT INTO items (name) VALUES (:name)"), {"name": row})
+        return engine
+
+    primary = make_db("primary.db", ["old", "new"])
+    replica = make_db("replica.db", ["old"])
+
+    database.SessionLocal.configure(bind=primary)
+    monkeypatch.setattr(database, "replica_engines", [replica])
+    monkeypatch.setattr(db_session, "replica_engines", [replica])
+
+    app = Flask(__name__)
+    db_session.init_request_db(app)
+    app.primary, app.replica = primary, replica
+    yield app
+    database.SessionLocal.configure(bind=database.engine)
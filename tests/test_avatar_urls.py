@@ -0,0 +1,51 @@
+"""Signed /api/avatar links (avatar_service.avatar_url / check_url)"""
+
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+pytest.importorskip("PIL")
+
+import avatar_service
+
+
+def _args(url):
+    return dict(parse_qsl(urlsplit(url).query))
+
+
+def test_signed_url_is_accepted():
+    args = _args(avatar_service.avatar_url(7, None, "Ada Lovelace", size=80))
+    remaining = avatar_service.check_url(7, args)
+    assert avatar_service.URL_TTL_SECONDS <= remaining <= 2 * avatar_service.URL_TTL_SECONDS
+
+
+def test_url_is_stable_within_a_ttl():
+    assert avatar_service.avatar_url(7, None, "Ada") == avatar_service.avatar_url(7, None, "Ada")
+
+
+@pytest.mark.parametrize("user_id, change", [
+    (8, {}),
+    (7, {"size": "512"}),
+    (7, {"v": "0" * 12}),
+    (7, {"exp": "9999999999"}),
+    (7, {"sig": ""}),
+])
+def test_tampered_url_is_rejected(user_id, change):
+    args = _args(avatar_service.avatar_url(7, None, "Ada"))
+    args.update(change)
+    assert avatar_service.check_url(user_id, args) is None
+
+
+def test_expired_url_is_rejected(monkeypatch):
+    args = _args(avatar_service.avatar_url(7, None, "Ada"))
+    later = int(args["exp"]) + 1
+    monkeypatch.setattr(avatar_service.time, "time", lambda: later)
+    assert avatar_service.check_url(7, args) is None
+
+
+def test_endpoint_needs_the_signature():
+    pytest.importorskip("psycopg2")  # database.py builds its Postgres engine on import
+    import app_py_for_leave_management_backend as backend
+
+    response = backend.app.test_client().get("/api/avatar/7?size=80", headers={"X-User-ID": "7"})
+    assert response.status_code == 403
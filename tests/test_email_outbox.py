@@ -0,0 +1,115 @@
+"""
+Email outbox worker (email_outbox.py) against the local SMTP stand-in
+(smtp_stub.py), with the outbox table in a SQLite file.
+"""
+
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("psycopg2")  # database.py builds its Postgres engine on import
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import email_outbox
+from database import EmailOutbox
+from smtp_stub import SmtpStub
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+    EmailOutbox.__table__.create(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(email_outbox, "SessionLocal", Session)
+    yield Session
+    engine.dispose()
+
+
+@pytest.fixture
+def start_stub():
+    servers = []
+
+    def start(**kwargs):
+        server = SmtpStub(port=0, **kwargs).start()
+        servers.append(server)
+        return server, email_outbox.SmtpConnection(host="127.0.0.1", port=server.port,
+                                                    starttls=False, user="", timeout=5)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _enqueue(Session, *addresses):
+    db = Session()
+    for address in addresses:
+        email_outbox.enqueue_email(db, address, "Subject", "<p>Body</p>")
+    db.commit()
+    db.close()
+
+
+def _rows(Session):
+    db = Session()
+    try:
+        return db.query(EmailOutbox).order_by(EmailOutbox.id).all()
+    finally:
+        db.close()
+
+
+def test_temporary_failure_is_retried(outbox, start_stub):
+    server, connection = start_stub(fail_first=1)
+    _enqueue(outbox, "someone@example.test")
+
+    assert email_outbox.drain_once(connection) == 1
+    [row] = _rows(outbox)
+    assert row.status == 'pending'
+    assert row.attempts == 1
+    assert "451" in row.last_error
+    assert row.next_attempt_at > datetime.utcnow()
+    assert email_outbox.drain_once(connection) == 0  # backing off
+
+    db = outbox()
+    db.query(EmailOutbox).update({"next_attempt_at": datetime.utcnow()})
+    db.commit()
+    db.close()
+
+    assert email_outbox.drain_once(connection) == 1
+    [row] = _rows(outbox)
+    assert row.status == 'sent'
+    assert row.attempts == 2
+    assert row.last_error is None
+    assert len(server.messages) == 1
+    connection.close()
+
+
+def test_permanent_failure_is_not_retried(outbox, start_stub):
+    server, connection = start_stub(reject_domains=["bad.test"])
+    _enqueue(outbox, "nobody@bad.test", "someone@example.test")
+
+    assert email_outbox.drain_once(connection) == 2
+    failed, sent = _rows(outbox)
+    assert failed.status == 'failed'
+    assert failed.attempts == 1
+    assert "550" in failed.last_error
+    # a rejected recipient does not break the session for the rest of the batch
+    assert sent.status == 'sent'
+    assert [m["to"] for m in server.messages] == [["someone@example.test"]]
+    connection.close()
+
+
+def test_batches_reuse_one_connection(outbox, start_stub):
+    server, connection = start_stub()
+    _enqueue(outbox, *[f"user{i}@example.test" for i in range(3)])
+    assert email_outbox.drain_once(connection) == 3
+
+    _enqueue(outbox, "late@example.test")
+    assert email_outbox.drain_once(connection) == 1
+
+    assert all(row.status == 'sent' for row in _rows(outbox))
+    assert len(server.messages) == 4
+    assert server.connections == 1
+    assert connection.connects == 1
+    connection.close()
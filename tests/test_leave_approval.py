@@ -0,0 +1,104 @@
+"""
+Concurrent approvals of one leave request (approve_leave_request) must book
+its days in the ledger once. Needs row locks, so it runs against the
+Postgres database in TEST_DATABASE_URL (its tables are dropped and
+recreated) and is skipped without one.
+"""
+
+import os
+import threading
+from datetime import date
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+@pytest.fixture
+def leave_app(monkeypatch):
+    from sqlalchemy import create_engine
+
+    import database
+    import db_session
+
+    engine = create_engine(TEST_DATABASE_URL)
+    database.Base.metadata.drop_all(engine)
+    database.Base.metadata.create_all(engine)
+    database.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(db_session, "replica_engines", [])
+
+    import app_py_for_leave_management_backend as backend
+    yield backend.app
+    database.SessionLocal.configure(bind=database.engine)
+    engine.dispose()
+
+
+def _seed():
+    from database import LeaveRequest, LeaveType, SessionLocal, User
+
+    db = SessionLocal()
+    admin = User(username="admin", email="admin@example.test", password_hash="x", role="admin")
+    employee = User(username="emp", email="emp@example.test", password_hash="x", role="employee")
+    leave_type = LeaveType(name="Casual", max_days_per_year=12)
+    db.add_all([admin, employee, leave_type])
+    db.flush()
+    leave_request = LeaveRequest(
+        user_id=employee.id, leave_type_id=leave_type.id, start_date=date(2026, 3, 2),
+        end_date=date(2026, 3, 4), num_days=3, day_type="full_day", reason="r", status="pending"
+    )
+    db.add(leave_request)
+    db.commit()
+    ids = admin.id, employee.id, leave_type.id, leave_request.id
+    db.close()
+    return ids
+
+
+def test_concurrent_approvals_book_the_days_once(leave_app, monkeypatch):
+    import leave_ledger
+    from database import LeaveLedgerBalance, SessionLocal
+
+    admin_id, employee_id, leave_type_id, request_id = _seed()
+
+    # Hold the first approval inside its transaction until the second one has
+    # read the request too (or, with the row lock, given up waiting for it)
+    barrier = threading.Barrier(2)
+    record_approved = leave_ledger.record_request_approved
+
+    def slow_record_approved(db, leave_request):
+        try:
+            barrier.wait(timeout=2)
+        except threading.BrokenBarrierError:
+            pass
+        return record_approved(db, leave_request)
+
+    monkeypatch.setattr(leave_ledger, "record_request_approved", slow_record_approved)
+
+    statuses = []
+
+    def approve():
+        response = leave_app.test_client().put(
+            f"/api/leave_requests/{request_id}/approve", headers={"X-User-ID": str(admin_id)}, json={}
+        )
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=approve) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200, 400]
+    db = SessionLocal()
+    try:
+        balance = db.query(LeaveLedgerBalance).filter(
+            LeaveLedgerBalance.user_id == employee_id,
+            LeaveLedgerBalance.leave_type_id == leave_type_id,
+            LeaveLedgerBalance.year == 2026
+        ).one()
+        assert (balance.pending, balance.used) == (0, 3)
+        assert leave_ledger.verify_ledger(db) == []
+    finally:
+        db.close()
@@ -0,0 +1,47 @@
+"""POST /api/logout_all only acts on a verified Bearer access token"""
+
+import pytest
+
+pytest.importorskip("psycopg2")  # database.py builds its Postgres engine on import
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    import app_py_for_leave_management_backend as backend
+
+    revoked = []
+    monkeypatch.setattr(backend, "USE_TOKEN_VERSIONS", True)
+    monkeypatch.setattr(backend, "revoke_all_tokens", revoked.append)
+    backend.revoked = revoked
+    return backend
+
+
+def test_user_id_header_is_not_enough(backend):
+    response = backend.app.test_client().post(
+        "/api/logout_all", headers={"X-User-ID": "7", "X-User-Role": "admin"}
+    )
+    assert response.status_code == 401
+    assert backend.revoked == []
+
+
+def test_invalid_token_is_rejected(backend, monkeypatch):
+    import auth
+
+    monkeypatch.setattr(auth, "verify_token", lambda token, expected_type="access": None)
+    response = backend.app.test_client().post(
+        "/api/logout_all", headers={"Authorization": "Bearer forged", "X-User-ID": "7"}
+    )
+    assert response.status_code == 401
+    assert backend.revoked == []
+
+
+def test_verified_token_logs_its_user_out(backend, monkeypatch):
+    import auth
+
+    payload = {"user_id": 7, "role": "employee", "jti": "jti-7", "type": "access"}
+    monkeypatch.setattr(auth, "verify_token", lambda token, expected_type="access": payload)
+    response = backend.app.test_client().post(
+        "/api/logout_all", headers={"Authorization": "Bearer valid", "X-User-ID": "8"}
+    )
+    assert response.status_code == 200
+    assert backend.revoked == [7]
@@ -0,0 +1,58 @@
+"""
+Replica routing (database.RoutingSession, db_session.py) against two
+SQLite files standing in for the primary and a lagging replica.
+"""
+
+import pytest
+from flask import g, jsonify
+from sqlalchemy import text
+
+
+def _names():
+    return [row[0] for row in g.db.execute(text("SELECT name FROM items ORDER BY name"))]
+
+
+@pytest.fixture
+def client(replica_app):
+    @replica_app.route('/items', methods=['GET', 'POST'])
+    def items():
+        return jsonify(_names())
+
+    @replica_app.route('/items/touch', methods=['GET'])
+    def touch():
+        before = _names()
+        g.db.execute(text("UPDATE items SET name = name WHERE 1 = 0"))
+        return jsonify({"before": before, "after": _names()})
+
+    return replica_app.test_client()
+
+
+def test_get_reads_from_replica(client):
+    assert client.get('/items').json == ["old"]
+
+
+def test_other_methods_read_from_primary(client):
+    assert client.post('/items').json == ["new", "old"]
+
+
+def test_session_sticks_to_primary_after_first_write(client):
+    import db_session
+
+    response = client.get('/items/touch')
+    assert response.json == {"before": ["old"], "after": ["new", "old"]}
+    # and the client reads its own writes for DB_REPLICA_STICKY_SECONDS
+    assert db_session.READ_PRIMARY_COOKIE in response.headers.get('Set-Cookie', '')
+    assert client.get('/items').json == ["new", "old"]
+
+
+def test_read_primary_cookie_forces_primary(client):
+    import db_session
+
+    client.set_cookie(db_session.READ_PRIMARY_COOKIE, '1')
+    assert client.get('/items').json == ["new", "old"]
+
+
+def test_read_primary_header_forces_primary(client):
+    import db_session
+
+    assert client.get('/items', headers={db_session.READ_PRIMARY_HEADER: 'true'}).json == ["new", "old"]
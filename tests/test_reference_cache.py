@@ -0,0 +1,49 @@
+"""Reference-data cache (reference_cache.py) with a lagging read replica"""
+
+import pytest
+from flask import g
+from sqlalchemy import text
+
+
+@pytest.fixture
+def app(replica_app, monkeypatch):
+    import reference_cache
+    from database import SystemSettings
+
+    for engine, allow_signup in ((replica_app.primary, 'false'), (replica_app.replica, 'true')):
+        SystemSettings.__table__.create(engine)
+        with engine.begin() as conn:
+            conn.execute(SystemSettings.__table__.insert().values(setting_key='allow_signup', setting_value=allow_signup))
+
+    # the version bump has already arrived over LISTEN; the replica lags behind it
+    monkeypatch.setattr(reference_cache.versions, "get", lambda resource: 3)
+    reference_cache.cache.invalidate()
+    yield replica_app
+    reference_cache.cache.invalidate()
+
+
+def test_reload_reads_the_primary(app):
+    import reference_cache
+
+    with app.test_request_context('/register', method='GET'):
+        assert reference_cache.setting(g.db, 'allow_signup') == 'false'
+        # the rest of the request still reads from the replica
+        assert g.db.execute(text("SELECT count(*) FROM items")).scalar() == 1
+
+    # cached under the new version: no replica value on the next request either
+    with app.test_request_context('/register', method='GET'):
+        assert reference_cache.setting(g.db, 'allow_signup') == 'false'
+    assert reference_cache.cache.snapshot()["hits"] >= 1
+
+
+def test_nothing_cached_from_a_session_that_wrote(app):
+    import reference_cache
+
+    with app.test_request_context('/settings', method='POST'):
+        g.db.execute(text("UPDATE system_settings SET setting_value = 'true'"))
+        assert reference_cache.setting(g.db, 'allow_signup') == 'true'  # its own, uncommitted
+        g.db.rollback()
+
+    assert reference_cache.cache.snapshot()["entries"] == 0
+    with app.test_request_context('/register', method='GET'):
+        assert reference_cache.setting(g.db, 'allow_signup') == 'false'
@@ -0,0 +1,29 @@
+"""Conditional GETs (resource_versions.conditional_get) with a lagging replica"""
+
+import pytest
+from flask import g, jsonify
+from sqlalchemy import text
+
+
+@pytest.fixture
+def client(replica_app, monkeypatch):
+    import resource_versions
+
+    # the version just notified over LISTEN, ahead of the replica
+    monkeypatch.setattr(resource_versions.versions, "get", lambda resource: 7)
+
+    @replica_app.route('/items', methods=['GET'])
+    @resource_versions.conditional_get('items')
+    def items():
+        return jsonify([row[0] for row in g.db.execute(text("SELECT name FROM items ORDER BY name"))])
+
+    return replica_app.test_client()
+
+
+def test_body_under_new_etag_comes_from_primary(client):
+    response = client.get('/items')
+    assert response.status_code == 200
+    assert response.json == ["new", "old"]
+    etag = response.headers['ETag']
+
+    assert client.get('/items', headers={'If-None-Match': etag}).status_code == 304
@@ -0,0 +1,23 @@
+"""BloomFilter sizing in token_blacklist.py"""
+
+import pytest
+
+pytest.importorskip("psycopg2")  # database.py builds its Postgres engine on import
+
+from token_blacklist import BloomFilter
+
+
+def test_count_ignores_re_adds():
+    bloom = BloomFilter(100, 0.001)
+    for _refresh in range(12):  # each refresh re-reads the overlap window
+        for i in range(50):
+            bloom.add(f"jti-{i}")
+    assert bloom.count == 50
+    assert bloom.count <= bloom.capacity
+    assert all(f"jti-{i}" in bloom for i in range(50))
+
+
+def test_add_reports_new_keys():
+    bloom = BloomFilter(100, 0.001)
+    assert bloom.add("a") is True
+    assert bloom.add("a") is False
@@ -0,0 +1,272 @@
+"""
+JWT Blacklist Cache for Stafio
+==============================
+Answers "is this JTI blacklisted?" for every authenticated request without
+a database round-trip in the common (not blacklisted) case.
+
+Each worker process keeps:
+  - a Bloom filter of every live blacklisted JTI: a miss is a definite
+    "not blacklisted" and needs no query;
+  - a bounded LRU of JTIs confirmed as blacklisted: a hit needs no query
+    either. Only Bloom false positives go to the database.
+
+The filter is refreshed incrementally from blacklisted_tokens using a
+blacklisted_at watermark at most every JWT_BLACKLIST_REFRESH_SECONDS, so a
+logout handled by one worker takes effect on the others within that bound
+(immediately on the worker that handled it).
+
+A daemon thread deletes rows whose expires_at has passed every
+JWT_BLACKLIST_SWEEP_SECONDS; an expired token is rejected by its own `exp`
+claim anyway. Run it by hand with:
+
+    python token_blacklist.py sweep
+"""
+
+import hashlib
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from database import SessionLocal, BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+
+REFRESH_SECONDS = float(os.getenv('JWT_BLACKLIST_REFRESH_SECONDS', '5'))
+SWEEP_SECONDS = float(os.getenv('JWT_BLACKLIST_SWEEP_SECONDS', '3600'))
+BLOOM_CAPACITY = int(os.getenv('JWT_BLACKLIST_BLOOM_CAPACITY', '100000'))
+BLOOM_ERROR_RATE = float(os.getenv('JWT_BLACKLIST_BLOOM_ERROR_RATE', '0.001'))
+LRU_SIZE = int(os.getenv('JWT_BLACKLIST_LRU_SIZE', '10000'))
+
+# blacklisted_at is stamped by the inserting worker before it commits, so
+# rows can become visible slightly out of order: re-read this much history
+# on every refresh (re-adding a JTI to the filter changes nothing).
+WATERMARK_OVERLAP = timedelta(seconds=60)
+
+
+# =============================================================================
+# BLOOM FILTER
+# =============================================================================
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Set the key's bits; `count` only grows for keys not already in the filter"""
+        new = False
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                new = True
+        if new:
+            # re-adds (the refresh overlap re-reads every recent JTI) don't fill the filter
+            self.count += 1
+        return new
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+# =============================================================================
+# PROCESS-LOCAL CACHE
+# =============================================================================
+
+class BlacklistCache:
+    """Bloom filter + LRU of confirmed JTIs, kept in sync with blacklisted_tokens"""
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, capacity=BLOOM_CAPACITY,
+                 error_rate=BLOOM_ERROR_RATE, lru_size=LRU_SIZE):
+        self.refresh_seconds = refresh_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lru_size = lru_size
+        self._lock = threading.RLock()
+        self._bloom = None
+        self._confirmed = OrderedDict()
+        self._watermark = None
+        self._refreshed_at = 0.0
+        self.stats = {"lookups": 0, "bloom_negative": 0, "lru_hits": 0, "db_checks": 0, "refreshes": 0}
+
+    # ---- lookups -------------------------------------------------------------
+
+    def is_blacklisted(self, jti):
+        if not jti:
+            return False
+        self.refresh()
+        with self._lock:
+            self.stats["lookups"] += 1
+            if self._bloom is None or jti not in self._bloom:
+                self.stats["bloom_negative"] += 1
+                return False
+            if jti in self._confirmed:
+                self._confirmed.move_to_end(jti)
+                self.stats["lru_hits"] += 1
+                return True
+            self.stats["db_checks"] += 1
+
+        # Bloom positive that is not cached: confirm against the table
+        db = SessionLocal()
+        try:
+            found = db.query(BlacklistedToken.id).filter(BlacklistedToken.jti == jti).first() is not None
+        finally:
+            db.close()
+        if found:
+            self._remember(jti)
+        return found
+
+    def add(self, jti):
+        """Record a JTI this process just blacklisted (visible here immediately)"""
+        if not jti:
+            return
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+        self._remember(jti)
+
+    def _remember(self, jti):
+        with self._lock:
+            self._confirmed[jti] = True
+            self._confirmed.move_to_end(jti)
+            while len(self._confirmed) > self.lru_size:
+                self._confirmed.popitem(last=False)
+
+    # ---- synchronisation ---------------------------------------------------------
+
+    def refresh(self, force=False):
+        """Pull JTIs blacklisted since the watermark (full load the first time)"""
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return
+            try:
+                if self._bloom is None:
+                    self._load_all()
+                else:
+                    self._load_since(self._watermark)
+            except Exception as e:
+                # Keep answering from what we have; try again next interval
+                logger.error("Token blacklist refresh error: %s", e)
+            self._refreshed_at = time.monotonic()
+            self.stats["refreshes"] += 1
+
+    def _load_all(self):
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            live = db.query(BlacklistedToken.jti, BlacklistedToken.blacklisted_at).filter(
+                or_(BlacklistedToken.expires_at.is_(None), BlacklistedToken.expires_at > now)
+            ).all()
+        finally:
+            db.close()
+        bloom = BloomFilter(max(self.capacity, len(live) * 2), self.error_rate)
+        for jti, _ in live:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._watermark = max((at for _, at in live if at), default=now)
+
+    def _load_since(self, watermark):
+        db = SessionLocal()
+        try:
+            rows = db.query(BlacklistedToken.jti, BlacklistedToken.blacklisted_at).filter(
+                BlacklistedToken.blacklisted_at > watermark - WATERMARK_OVERLAP
+            ).all()
+        finally:
+            db.close()
+        for jti, at in rows:
+            self._bloom.add(jti)
+            if at and at > self._watermark:
+                self._watermark = at
+        # Too full for its error rate: rebuild from the live rows, bigger
+        if self._bloom.count > self._bloom.capacity:
+            self.capacity = self._bloom.count * 2
+            self._load_all()
+
+    def rebuild(self):
+        """Drop the filter; the next lookup reloads the live rows"""
+        with self._lock:
+            self._bloom = None
+            self._confirmed.clear()
+            self._refreshed_at = 0.0
+
+
+blacklist_cache = BlacklistCache()
+
+
+# =============================================================================
+# EXPIRY SWEEPER
+# =============================================================================
+
+def sweep_expired(now=None):
+    """Delete blacklist rows whose token has expired; returns the row count"""
+    now = now or datetime.utcnow()
+    db = SessionLocal()
+    try:
+        deleted = db.query(BlacklistedToken).filter(
+            BlacklistedToken.expires_at.isnot(None),
+            BlacklistedToken.expires_at < now
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+_sweeper_lock = threading.Lock()
+_sweeper = None
+
+
+def _sweep_loop(interval):
+    while True:
+        try:
+            deleted = sweep_expired()
+            if deleted:
+                logger.info("Token blacklist sweeper: deleted %s expired row(s)", deleted)
+                # Expired JTIs still set bits in the filter: start a fresh one
+                blacklist_cache.rebuild()
+        except Exception as e:
+            logger.error("Token blacklist sweeper error: %s", e)
+        time.sleep(interval)
+
+
+def start_sweeper(interval=SWEEP_SECONDS):
+    """Start the per-process sweeper thread once (no-op when interval <= 0)"""
+    global _sweeper
+    if interval <= 0:
+        return
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep_loop, args=(interval,),
+                                        name="token-blacklist-sweeper", daemon=True)
+            _sweeper.start()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "sweep":
+        print("Usage: python token_blacklist.py sweep")
+        sys.exit(2)
+    print(f"Deleted {sweep_expired()} expired blacklist row(s)")
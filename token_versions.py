@@ -0,0 +1,94 @@
+"""
+Per-User Token Versions for Stafio
+==================================
+Revocation without a growing blacklist: every user has a `token_version`
+counter, tokens carry it in the `tv` claim, and verify_token rejects a
+token whose `tv` is older than the user's current version. Bumping the
+counter logs the user out everywhere in O(1), one UPDATE.
+
+Versions are read through a small process-local map refreshed after
+JWT_TOKEN_VERSION_TTL_SECONDS, so a bump made by another worker takes
+effect within that bound (immediately on the worker that made it).
+Tokens issued before the claim existed count as version 0.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import update
+
+from database import SessionLocal, User
+
+
+TTL_SECONDS = float(os.getenv('JWT_TOKEN_VERSION_TTL_SECONDS', '5'))
+MAX_ENTRIES = int(os.getenv('JWT_TOKEN_VERSION_CACHE_SIZE', '10000'))
+
+
+class TokenVersionCache:
+    """user_id -> (token_version, loaded_at), bounded LRU with a TTL"""
+
+    def __init__(self, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._versions = OrderedDict()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._versions.get(user_id)
+            if cached and now - cached[1] < self.ttl:
+                self._versions.move_to_end(user_id)
+                return cached[0]
+
+        db = SessionLocal()
+        try:
+            version = db.query(User.token_version).filter(User.id == user_id).scalar()
+        finally:
+            db.close()
+        # Unknown (or not yet committed) users have issued nothing to revoke
+        version = version or 0
+        self.set(user_id, version)
+        return version
+
+    def set(self, user_id, version):
+        with self._lock:
+            self._versions[user_id] = (version, time.monotonic())
+            self._versions.move_to_end(user_id)
+            while len(self._versions) > self.max_entries:
+                self._versions.popitem(last=False)
+
+
+version_cache = TokenVersionCache()
+
+
+def current_token_version(user_id):
+    """The version new tokens of this user are issued with"""
+    return version_cache.get(user_id)
+
+
+def is_token_version_current(payload):
+    """False when the token was issued before the user's last revocation"""
+    user_id = payload.get("user_id")
+    if user_id is None:
+        return False
+    return payload.get("tv", 0) >= version_cache.get(user_id)
+
+
+def revoke_user_tokens(db, user_id):
+    """
+    Invalidate every token issued to the user so far ("log out everywhere").
+    Commits on the given session; returns the new version.
+    """
+    version = db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(token_version=User.token_version + 1)
+        .returning(User.token_version)
+    ).scalar()
+    db.commit()
+    if version is not None:
+        version_cache.set(user_id, version)
+    return version